@@ -1,26 +1,142 @@
-from django.contrib import admin
+from decimal import Decimal
 
+from django import forms
+from django.contrib import admin, messages
+from django.contrib.admin.helpers import ActionForm
+from django.core.exceptions import ValidationError
+from django.core.validators import MaxValueValidator, MinValueValidator
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from django.db.models.functions import Round
+from django.utils import timezone
+
+from .caching import invalidate_catalogue
 from .models import Publisher, Book, Member, Order, Review
 
 
+def _price_bounds():
+    # The same limits as the validators on Book.price, so bulk updates can enforce them in SQL
+    validators = Book._meta.get_field('price').validators
+    low = next(v.limit_value for v in validators if isinstance(v, MinValueValidator))
+    high = next(v.limit_value for v in validators if isinstance(v, MaxValueValidator))
+    return low, high
+
+
+def _reprice(modeladmin, request, queryset, new_price):
+    # Applies the price expression with one UPDATE; books whose new price would leave the allowed range are skipped
+    low, high = _price_bounds()
+    selected = queryset.count()
+    updated = (queryset.alias(new_price=new_price)
+               .filter(new_price__gte=low, new_price__lte=high)
+               .update(price=new_price, updated_at=timezone.now()))
+    # Bulk updates send no model signals, so the cached pages are expired here
+    invalidate_catalogue()
+    modeladmin.message_user(request, f"{updated} book(s) repriced.")
+    if updated < selected:
+        modeladmin.message_user(request, f"{selected - updated} book(s) skipped: the new price would be outside "
+                                         f"{low}-{high}.", messages.WARNING)
+
+
+def _action_value(modeladmin, request, name):
+    # Reads one of the BookActionForm inputs, reporting an error when it is missing or invalid
+    try:
+        value = BookActionForm.base_fields[name].clean(request.POST.get(name))
+    except ValidationError:
+        value = None
+    if value not in (None, ''):
+        return value
+    modeladmin.message_user(request, f"Please fill in '{name}' next to the action.", messages.ERROR)
+    return None
+
+
 # Action to increase book prices by $10 in bulk
+@admin.action(description='Increase price by $10')
 def increase_10_dollars(modeladmin, request, queryset):
-    for book in queryset:
-        price = book.price + 10
-        book.price = price
-        book.save()
+    _reprice(modeladmin, request, queryset, F('price') + 10)
+
+
+@admin.action(description='Change price by amount ($)')
+def change_price_by_amount(modeladmin, request, queryset):
+    amount = _action_value(modeladmin, request, 'amount')
+    if amount is not None:
+        _reprice(modeladmin, request, queryset, F('price') + amount)
+
+
+@admin.action(description='Change price by percentage (%%)')
+def change_price_by_percent(modeladmin, request, queryset):
+    percent = _action_value(modeladmin, request, 'amount')
+    if percent is not None:
+        factor = 1 + percent / Decimal(100)
+        _reprice(modeladmin, request, queryset, Round(F('price') * factor, 2))
+
+
+@admin.action(description='Set category')
+def set_category(modeladmin, request, queryset):
+    category = _action_value(modeladmin, request, 'category')
+    if category is not None:
+        updated = queryset.update(category=category, updated_at=timezone.now())
+        invalidate_catalogue()
+        modeladmin.message_user(request, f"{updated} book(s) moved to category {category}.")
+
+
+@admin.action(description='Move to publisher')
+def move_to_publisher(modeladmin, request, queryset):
+    publisher = _action_value(modeladmin, request, 'publisher')
+    if publisher is not None:
+        # Titles the publisher already has would break book_publisher_title_uniq, so those books stay put
+        colliding = queryset.exclude(publisher=publisher).filter(
+            title__in=Book.objects.filter(publisher=publisher).values('title'))
+        skipped = colliding.count()
+        try:
+            with transaction.atomic():
+                updated = (queryset.exclude(pk__in=colliding.values('pk'))
+                           .update(publisher=publisher, updated_at=timezone.now()))
+        except IntegrityError:
+            # Two of the selected books share a title
+            modeladmin.message_user(request, f"No books moved: some of the selected books have the same title, "
+                                             f"and {publisher} can only have one of them.", messages.ERROR)
+            return
+        invalidate_catalogue()
+        modeladmin.message_user(request, f"{updated} book(s) moved to {publisher}.")
+        if skipped:
+            modeladmin.message_user(request, f"{skipped} book(s) skipped: {publisher} already has a book with "
+                                             f"the same title.", messages.WARNING)
+
+
+class BookActionForm(ActionForm):
+    # Inputs shown next to the action dropdown on the Book list and used by the bulk actions above
+    amount = forms.DecimalField(required=False, label='Amount ($ or %)')
+    category = forms.ChoiceField(choices=[('', '---------')] + Book.CATEGORY_CHOICES, required=False)
+    publisher = forms.ModelChoiceField(Publisher.objects.all(), required=False)
 
 
 class BookAdmin(admin.ModelAdmin):
     # Fields displayed in the Book admin panel
     fields = [('title', 'category', 'publisher'), ('num_pages', 'price', 'num_reviews')]
-    list_display = ('title', 'category', 'price')  # Columns displayed in the book list
-    actions = [increase_10_dollars]  # Action to increase book prices
+    list_display = ('title', 'category', 'price', 'publisher')  # Columns displayed in the book list
+    list_select_related = ('publisher',)  # Publishers are joined instead of loaded per row
+    # Bulk actions, each a single UPDATE over the selected books
+    actions = [increase_10_dollars, change_price_by_amount, change_price_by_percent, set_category, move_to_publisher]
+    action_form = BookActionForm
 
 
 class OrderAdmin(admin.ModelAdmin):
     fields = ['books', ('member', 'order_type', 'order_date')]  # Fields displayed in the Order admin panel
     list_display = ('id', 'member', 'order_type', 'order_date', 'total_items')  # Columns displayed in the order list
+    list_select_related = ('member',)  # Members are joined instead of loaded per row
+
+    def get_queryset(self, request):
+        # Counts books for the whole changelist page in one query
+        return super().get_queryset(request).with_book_count()
+
+    @admin.display(description='Total items', ordering='book_count')
+    def total_items(self, obj):
+        return obj.total_items()
+
+
+class ReviewAdmin(admin.ModelAdmin):
+    list_display = ('__str__', 'rating', 'date')  # Columns displayed in the review list
+    list_select_related = ('book',)  # Review.__str__ shows the book title
 
 
 class PublisherAdmin(admin.ModelAdmin):
@@ -28,8 +144,20 @@ class PublisherAdmin(admin.ModelAdmin):
 
 
 class MemberAdmin(admin.ModelAdmin):
-    list_display = ('username', 'first_name', 'last_name', 'status', 'books_title')  # Columns displayed in the
-    # Member admin panel
+    list_display = ('username', 'first_name', 'last_name', 'status', 'borrowed_count',
+                    'books_title')  # Columns displayed in the Member admin panel
+
+    def get_queryset(self, request):
+        # Borrowed counts and titles for the whole changelist page instead of a query per member
+        return super().get_queryset(request).with_borrowed_titles()
+
+    @admin.display(description='Borrowed', ordering='borrowed_count')
+    def borrowed_count(self, obj):
+        return obj.borrowed_count
+
+    @admin.display(description='Borrowed books')
+    def books_title(self, obj):
+        return obj.books_title()
 
 
 # Register your models here.
@@ -37,4 +165,4 @@ admin.site.register(Publisher, PublisherAdmin)  # Register Publisher model
 admin.site.register(Book, BookAdmin)  # Register Book model with customized admin view
 admin.site.register(Member, MemberAdmin)  # Register Member model with customized admin view
 admin.site.register(Order, OrderAdmin)  # Register Order model with customized admin view
-admin.site.register(Review)  # Register Review model
+admin.site.register(Review, ReviewAdmin)  # Register Review model with customized admin view
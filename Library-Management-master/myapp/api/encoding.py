@@ -0,0 +1,33 @@
+import json
+from decimal import Decimal
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse
+
+try:
+    # Optional: several times faster than the json module on large batches
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _default(obj):
+    # orjson handles dates itself; prices are sent as strings, as DjangoJSONEncoder does
+    if isinstance(obj, Decimal):
+        return str(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(data):
+    # JSON bytes for `data`, made of dicts, lists and the values .values() queries return
+    if orjson is not None:
+        return orjson.dumps(data, default=_default, option=orjson.OPT_UTC_Z)
+    return json.dumps(data, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+
+
+def json_response(data, status=200):
+    return HttpResponse(dumps(data), status=status, content_type='application/json')
+
+
+def json_error(message, status):
+    return json_response({'error': message}, status=status)
@@ -0,0 +1,16 @@
+from django.urls import path
+
+from . import views
+
+app_name = 'api'
+
+urlpatterns = [
+    # Batch lookup of up to 500 books: books/?ids=1,2,3
+    path(r'books/', views.books, name='books'),
+
+    # A book's reviews, one page at a time (?cursor=)
+    path(r'books/<int:book_id>/reviews/', views.book_reviews, name='book_reviews'),
+
+    # A member's order history, one page at a time (?cursor=)
+    path(r'members/<int:member_id>/orders/', views.member_orders, name='member_orders'),
+]
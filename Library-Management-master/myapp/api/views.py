@@ -0,0 +1,99 @@
+import logging
+
+from django.db.models import F
+from django.views.decorators.http import require_GET
+
+from ..models import Book, Order, Review
+from ..pagination import paginate
+from .encoding import json_error, json_response
+
+logger = logging.getLogger(__name__)
+
+# Version 1 of the read API, mounted at /myapp/api/v1/. Rows are read as .values() dicts and encoded
+# straight to JSON, without building model instances.
+
+# Most books one ?ids= request may ask for; they are fetched with a single id__in query
+MAX_BATCH_IDS = 500
+
+# Reviews or orders per page; further pages are requested with the returned next_cursor
+PAGE_SIZE = 50
+
+BOOK_FIELDS = ['id', 'title', 'category', 'num_pages', 'price', 'publisher_id', 'description', 'num_reviews',
+               'avg_rating', 'updated_at']
+REVIEW_FIELDS = ['id', 'reviewer', 'rating', 'comments', 'date']
+ORDER_FIELDS = ['id', 'order_type', 'order_date']
+
+
+def parse_ids(value):
+    # "3,1,3" -> [1, 3]; raises ValueError with a message for the client
+    try:
+        ids = sorted({int(part) for part in value.split(',') if part.strip()})
+    except ValueError:
+        raise ValueError("ids must be a comma-separated list of integers.")
+    if not ids:
+        raise ValueError("Give the books to fetch as ?ids=1,2,3.")
+    if len(ids) > MAX_BATCH_IDS:
+        raise ValueError(f"At most {MAX_BATCH_IDS} ids can be fetched per request.")
+    return ids
+
+
+def _page_response(page):
+    return json_response({'results': page.object_list, 'next_cursor': page.next_cursor})
+
+
+@require_GET
+def books(request):
+    # GET books/?ids=1,2,3: the books in id order, and the requested ids that match no book
+    try:
+        ids = parse_ids(request.GET.get('ids', ''))
+    except ValueError as e:
+        return json_error(str(e), 400)
+    try:
+        rows = list(Book.objects.filter(id__in=ids).order_by('id')
+                    .values(*BOOK_FIELDS, publisher_name=F('publisher__name')))
+        found = {row['id'] for row in rows}
+        return json_response({'results': rows, 'missing': [book_id for book_id in ids if book_id not in found]})
+    except Exception as e:
+        logger.error("An error occurred in the books API: %s", e)
+        return json_error('An unexpected error occurred.', 500)
+
+
+@require_GET
+def book_reviews(request, book_id):
+    # GET books/<id>/reviews/: the book's reviews, newest first, read along review_book_date_idx
+    try:
+        reviews = paginate(Review.objects.filter(book_id=book_id).values(*REVIEW_FIELDS), ('-date', '-id'),
+                           request.GET.get('cursor'), PAGE_SIZE)
+        # Only an empty page needs to tell a book without reviews from a missing book
+        if not reviews and not Book.objects.filter(pk=book_id).exists():
+            return json_error(f"Book {book_id} does not exist.", 404)
+        return _page_response(reviews)
+    except Exception as e:
+        logger.error("An error occurred in the reviews API: %s", e)
+        return json_error('An unexpected error occurred.', 500)
+
+
+@require_GET
+def member_orders(request, member_id):
+    # GET members/<id>/orders/: a member's orders, newest first, each with its book ids. Open to the member
+    # (through their session) and to staff.
+    if not request.user.is_authenticated:
+        return json_error('Authentication required.', 401)
+    if request.user.pk != member_id and not request.user.is_staff:
+        return json_error('You may only read your own orders.', 403)
+    try:
+        orders = paginate(Order.objects.filter(member_id=member_id).values(*ORDER_FIELDS), ('-order_date', '-id'),
+                          request.GET.get('cursor'), PAGE_SIZE)
+
+        # The books of the whole page in one query
+        book_ids = {order['id']: [] for order in orders}
+        lines = (Order.books.through.objects.filter(order_id__in=book_ids).order_by('order_id', 'book_id')
+                 .values_list('order_id', 'book_id'))
+        for order_id, book_id in lines:
+            book_ids[order_id].append(book_id)
+        for order in orders:
+            order['book_ids'] = book_ids[order['id']]
+        return _page_response(orders)
+    except Exception as e:
+        logger.error("An error occurred in the orders API: %s", e)
+        return json_error('An unexpected error occurred.', 500)
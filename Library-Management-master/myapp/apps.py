@@ -3,3 +3,7 @@ from django.apps import AppConfig
 
 class MyappConfig(AppConfig):
     name = 'myapp'
+
+    def ready(self):
+        # Registers the model signal handlers
+        from . import signals  # noqa: F401
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.views import redirect_to_login
+from django.http import Http404, HttpResponseServerError
+from django.shortcuts import render
+from django.template.loader import render_to_string
+
+from . import views
+from .caching import acached_fragment, adetail_fragment_key, aindex_fragment_key
+from .forms import SearchForm
+from .models import Book, BookRecommendation, Review, TopRatedBook
+from .pagination import apaginate
+
+logger = logging.getLogger(__name__)
+
+# Async versions of the read-only catalogue views, served under /myapp/async/ by mysiteF19.asgi.
+# Queries use the async ORM; the session, request.user and full pages (base.html reads request.member)
+# still go through the sync ORM, so they run in a worker thread. Templates are rendered there too, as
+# rendering a large fragment in the event loop would hold up every other request it is serving.
+arender = sync_to_async(render)
+arender_to_string = sync_to_async(render_to_string)
+
+
+def login_required(view):
+    # django.contrib.auth's login_required cannot wrap coroutines before Django 5.0
+    @wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if not await sync_to_async(lambda: request.user.is_authenticated)():
+            return redirect_to_login(request.get_full_path(), '/myapp/login/')
+        return await view(request, *args, **kwargs)
+    return wrapper
+
+
+class IndexView(views.IndexView):
+    async def get(self, request):
+        try:
+            last_login = await sync_to_async(request.session.get)(self.last_login_cookie, '')
+
+            # Shares the cached book list pages with the sync view
+            cursor = request.GET.get('cursor')
+            booklist_html = await acached_fragment(await aindex_fragment_key(cursor),
+                                                   lambda: self.render_books(cursor))
+            return await arender(request, self.template_name, {'booklist_html': booklist_html,
+                                                               'last_login': last_login})
+        except Exception as e:
+            logger.error("An error occurred in async IndexView: %s", e)
+            return await arender(request, 'myapp/error.html',
+                                 {'message': 'Something went wrong! Please try again later.'})
+
+    async def render_books(self, cursor):
+        book_list = await apaginate(Book.objects.for_listing(), ('id',), cursor, self.page_size)
+        return await arender_to_string(self.fragment_template, {'booklist': book_list})
+
+
+class DetailView(views.DetailView):
+    async def get(self, request, book_id):
+        detail_html = await acached_fragment(await adetail_fragment_key(book_id), lambda: self.render_book(book_id))
+        return await arender(request, self.template_name, {'detail_html': detail_html})
+
+    async def render_book(self, book_id):
+        # The book, its latest reviews and its recommendations only need the book id, so they are awaited together.
+        # They still run one after another: on Django 4.2 each async ORM query goes through sync_to_async into
+        # the single thread-sensitive worker thread, so gather saves no database time.
+        try:
+            book, reviews, related_books = await asyncio.gather(Book.objects.with_publisher().aget(id=book_id),
+                                                                self.latest_reviews(book_id),
+                                                                self.also_borrowed(book_id))
+        except Book.DoesNotExist:
+            raise Http404(f"Book with ID {book_id} does not exist")
+
+        related_heading = self.also_borrowed_heading
+        if not related_books:
+            related_books = [top.book async for top in TopRatedBook.objects.for_category(book.category, book.id)]
+            related_heading = self.top_rated_heading
+
+        avg_rating = book.avg_rating if book.rating_count else -1
+        return await arender_to_string(self.fragment_template, {'book': book, 'avg_rating': avg_rating,
+                                                                'reviews': reviews, 'related_books': related_books,
+                                                                'related_heading': related_heading})
+
+    async def latest_reviews(self, book_id):
+        reviews = Review.objects.filter(book_id=book_id).order_by('-date', '-id')[:self.reviews_shown]
+        return [review async for review in reviews]
+
+    async def also_borrowed(self, book_id):
+        return [rec.recommended async for rec in BookRecommendation.objects.for_book(book_id)]
+
+
+async def findbooks(request):
+    try:
+        if request.method == 'POST' or 'max_price' in request.GET:
+            data = request.POST if request.method == 'POST' else request.GET
+            form = SearchForm(data)
+            if form.is_valid():
+                name = form.cleaned_data['name']
+                category = form.cleaned_data['category']
+                max_price = form.cleaned_data['max_price']
+
+                # The search may load the in-memory search index and page through its matches with the sync ORM
+                booklist = await sync_to_async(views.search_results)(name, category, max_price, data.get('cursor'))
+                return await arender(request, 'myapp/results.html',
+                                     {'booklist': booklist, 'name': name, 'category': category,
+                                      'next_query': views.next_page_query(data, booklist)})
+            else:
+                logger.error("Form errors: %s", form.errors)
+                return await arender(request, 'myapp/findbooks.html', {'form': form})
+        else:
+            return await arender(request, 'myapp/findbooks.html', {'form': SearchForm()})
+    except Exception as e:
+        logger.error("An error occurred: %s", e)
+        return HttpResponseServerError("An error occurred during book search.")
+
+
+@login_required
+async def chk_reviews(request, book_id):
+    try:
+        selected_book = await Book.objects.only('id', 'title', 'rating_count', 'avg_rating').aget(pk=book_id)
+        avg_rating = selected_book.avg_rating if selected_book.rating_count else -1
+        return await arender(request, 'myapp/chk_reviews.html', {'book': selected_book, 'avg_rating': avg_rating})
+
+    except Book.DoesNotExist as e:
+        logger.error("Book with ID %s does not exist: %s", book_id, e)
+        return await arender(request, 'myapp/error.html', {'error_message': 'The book does not exist.'})
+
+    except Exception as e:
+        logger.error("An error occurred: %s", e)
+        return await arender(request, 'myapp/error.html', {'error_message': 'An unexpected error occurred.'})
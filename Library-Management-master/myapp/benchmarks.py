@@ -0,0 +1,234 @@
+import asyncio
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from asgiref.sync import ThreadSensitiveContext
+from django.core.cache import cache
+from django.db import connections
+from django.db.backends.signals import connection_created
+from django.db.models import Count
+from django.test import Client
+from django.urls import reverse
+
+from .models import Book, Member
+from .profiling import QueryTimer
+
+# Most queries each scenario may run per request, on a warm cache (QUERY_BUDGETS) and on its first request after
+# the cache was cleared (COLD_QUERY_BUDGETS). None of these may grow with the size of the catalogue; a view
+# exceeding a budget at any scale fails the benchmark. Each budget leaves one query of headroom over the count
+# measured when it was set, so an intended extra query is a deliberate budget change, not a failed run.
+#
+# Warm, index, detail and chk_reviews run the updated_at lookup behind their ETag/Last-Modified
+# (myapp.conditional), the only query a 304 costs, and read the page fragments from the cache. Cold requests
+# also read the session and user from the database, and render the fragments: the index reads one page of
+# books; the detail page reads the book with its publisher, its latest reviews, its recommendations and,
+# when it has none, the top rated books of its category.
+QUERY_BUDGETS = {
+    'index': 3,        # measured 2
+    'detail': 3,       # measured 2
+    'findbooks': 3,    # measured 2
+    'my_orders': 4,    # measured 3
+    'place_order': 7,  # measured 6
+    'chk_reviews': 4,  # measured 3
+}
+
+COLD_QUERY_BUDGETS = {
+    'index': 5,        # measured 4
+    'detail': 8,       # measured 7
+    'findbooks': 5,    # measured 4
+    'my_orders': 5,    # measured 4
+    'place_order': 8,  # measured 7
+    'chk_reviews': 5,  # measured 4
+}
+
+
+# Status every scenario must answer with; anything else (an error page, a redirect to login) fails the benchmark
+EXPECTED_STATUS = 200
+
+
+def scale_sizes(books):
+    # Dataset proportions used for a benchmark scale, keyed like generate_catalogue()'s arguments
+    return {'publishers': max(1, books // 100), 'books': books, 'members': max(10, books // 50),
+            'orders': books, 'reviews': books * 2}
+
+
+def build_fixtures():
+    # The member with the most orders and the most reviewed book make the heaviest pages
+    member = (Member.objects.filter(status__in=[1, 2]).annotate(order_count=Count('member'))
+              .order_by('-order_count', 'pk').first())
+    book = Book.objects.order_by('-rating_count', 'id').first()
+    order_books = list(Book.objects.order_by('id').values_list('id', flat=True)[:5])
+    return {'member': member, 'book_id': book.id, 'order_books': order_books}
+
+
+def scenarios(fixtures):
+    # (name, method, path, data) for every benchmarked view
+    book_id = fixtures['book_id']
+    return [
+        ('index', 'get', reverse('myapp:index'), None),
+        ('detail', 'get', reverse('myapp:detail', args=[book_id]), None),
+        ('findbooks', 'post', reverse('myapp:findbooks'), {'name': 'python', 'max_price': '1000'}),
+        ('my_orders', 'get', reverse('myapp:orders'), None),
+        ('place_order', 'post', reverse('myapp:place_order'),
+         {'books': fixtures['order_books'], 'order_type': 1}),
+        ('chk_reviews', 'get', reverse('myapp:check_reviews', args=[book_id]), None),
+    ]
+
+
+def timed_request(client, method, path, data):
+    # Returns (response, seconds, query count) for one request, counting queries on every database
+    timer = QueryTimer()
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timer))
+        start = time.perf_counter()
+        response = getattr(client, method)(path, data) if data is not None else getattr(client, method)(path)
+        elapsed = time.perf_counter() - start
+    return response, elapsed, timer.count
+
+
+def run_scenarios(repeat=10):
+    # Runs every scenario once on a cold cache, then `repeat` times on a warm one, as the busiest member
+    fixtures = build_fixtures()
+    client = Client()
+    client.force_login(fixtures['member'])
+
+    results = []
+    for name, method, path, data in scenarios(fixtures):
+        # The first request finds the cache empty, as after a deploy or a catalogue change, and warms it
+        cache.clear()
+        response, elapsed, cold_queries = timed_request(client, method, path, data)
+        timings = []
+        queries = 0
+        status = response.status_code
+        for _ in range(repeat):
+            response, elapsed, count = timed_request(client, method, path, data)
+            timings.append(elapsed * 1000)
+            queries = max(queries, count)
+            # The first unexpected status is kept, so one failing repeat is not hidden by later ones
+            if status == EXPECTED_STATUS:
+                status = response.status_code
+        timings.sort()
+        results.append({
+            'name': name,
+            'status': status,
+            'expected_status': EXPECTED_STATUS,
+            'median_ms': statistics.median(timings),
+            'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+            'queries': queries,
+            'budget': QUERY_BUDGETS.get(name),
+            'cold_queries': cold_queries,
+            'cold_budget': COLD_QUERY_BUDGETS.get(name),
+        })
+    return results
+
+
+def load_scenarios(fixtures):
+    # (name, sync path, async path, POST data or None) for the pages that have an async version
+    book_id = fixtures['book_id']
+    search = {'name': 'python', 'max_price': '1000'}
+    return [
+        ('index', reverse('myapp:index'), reverse('myapp:async_index'), None),
+        ('detail', reverse('myapp:detail', args=[book_id]), reverse('myapp:async_detail', args=[book_id]), None),
+        ('findbooks', reverse('myapp:findbooks'), reverse('myapp:async_findbooks'), search),
+        ('chk_reviews', reverse('myapp:check_reviews', args=[book_id]),
+         reverse('myapp:async_check_reviews', args=[book_id]), None),
+    ]
+
+
+class LatencyWrapper:
+    # Execute wrapper sleeping before every query, standing in for the round trip to a remote database
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+
+    def __call__(self, execute, sql, params, many, context):
+        time.sleep(self.seconds)
+        return execute(sql, params, many, context)
+
+
+def simulate_db_latency(seconds):
+    # Adds the delay to every open connection and to every connection worker threads open later
+    wrapper = LatencyWrapper(seconds)
+
+    def add(sender, connection, **kwargs):
+        if wrapper not in connection.execute_wrappers:
+            connection.execute_wrappers.append(wrapper)
+
+    connection_created.connect(add, weak=False)
+    for connection in connections.all():
+        add(None, connection)
+
+
+def simulate_connect_latency(seconds):
+    # Sleeps whenever a connection is opened, standing in for the TCP/TLS/authentication handshake
+    def delay(sender, connection, **kwargs):
+        time.sleep(seconds)
+
+    connection_created.connect(delay, weak=False)
+
+
+def _load_result(elapsed, timings, statuses):
+    timings.sort()
+    return {
+        'rps': len(timings) / elapsed,
+        'median_ms': statistics.median(timings),
+        'p95_ms': timings[min(len(timings) - 1, int(len(timings) * 0.95))],
+        'errors': sum(1 for status in statuses if status != 200),
+    }
+
+
+def sync_load(clients, path, data, requests):
+    # One thread per client, as a threaded WSGI server would run them; returns throughput and latency
+    def worker(client, count):
+        timings, statuses = [], []
+        for _ in range(count):
+            start = time.perf_counter()
+            response = client.post(path, data) if data is not None else client.get(path)
+            timings.append((time.perf_counter() - start) * 1000)
+            statuses.append(response.status_code)
+        return timings, statuses
+
+    counts = _split(requests, len(clients))
+    start = time.perf_counter()
+    with ThreadPoolExecutor(len(clients)) as pool:
+        results = list(pool.map(worker, clients, counts))
+    elapsed = time.perf_counter() - start
+    return _load_result(elapsed, [t for timings, _ in results for t in timings],
+                        [s for _, statuses in results for s in statuses])
+
+
+async def async_load(clients, path, data, requests):
+    # One task per client in a single event loop; each request gets its own sync thread for the parts
+    # that still use the sync ORM, as ASGIHandler gives it
+    async def worker(client, count):
+        timings, statuses = [], []
+        for _ in range(count):
+            start = time.perf_counter()
+            async with ThreadSensitiveContext():
+                response = await (client.post(path, data) if data is not None else client.get(path))
+            timings.append((time.perf_counter() - start) * 1000)
+            statuses.append(response.status_code)
+        return timings, statuses
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*(worker(client, count)
+                                     for client, count in zip(clients, _split(requests, len(clients)))))
+    elapsed = time.perf_counter() - start
+    return _load_result(elapsed, [t for timings, _ in results for t in timings],
+                        [s for _, statuses in results for s in statuses])
+
+
+def _split(total, parts):
+    return [total // parts + (1 if i < total % parts else 0) for i in range(parts)]
+
+
+def logged_in_clients(client_class, member, count):
+    clients = []
+    for _ in range(count):
+        client = client_class()
+        client.force_login(member)
+        clients.append(client)
+    return clients
@@ -0,0 +1,126 @@
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.safestring import mark_safe
+
+from .pagination import decode_cursor
+
+# Version stamps are part of every fragment key, so bumping one makes the old entries unreachable
+# (they expire on their own) instead of having to find and delete them
+CATALOGUE_VERSION = 'catalogue:version'  # any book or publisher change; also bulk updates
+SEARCH_INDEX_VERSION = 'search:version'  # book titles/descriptions, for myapp.search's in-memory index
+
+
+def _book_version_key(book_id):
+    # A book and its reviews
+    return f'book:{book_id}:version'
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Not set yet (or evicted): any new value differs from what fragments were cached under
+        cache.set(key, 2, None)
+
+
+def _on_commit(func):
+    # Readers must not cache the old rows under the new version while the write is still uncommitted
+    transaction.on_commit(func)
+
+
+def invalidate_book(book_id):
+    _on_commit(lambda: _bump(_book_version_key(book_id)))
+
+
+def invalidate_catalogue():
+    _on_commit(lambda: _bump(CATALOGUE_VERSION))
+
+
+def invalidate_search_index():
+    # Every process rebuilds its in-memory search index on its next search
+    _on_commit(lambda: _bump(SEARCH_INDEX_VERSION))
+
+
+def _versions(*keys):
+    found = cache.get_many(keys)
+    return [found.get(key, 1) for key in keys]
+
+
+async def _aversions(*keys):
+    found = await cache.aget_many(keys)
+    return [found.get(key, 1) for key in keys]
+
+
+def catalogue_versions(book_id=None):
+    # The current catalogue stamp (and the book's, when given), for HTTP validators in myapp.conditional
+    if book_id is None:
+        return _versions(CATALOGUE_VERSION)
+    return _versions(CATALOGUE_VERSION, _book_version_key(book_id))
+
+
+def search_index_version():
+    return _versions(SEARCH_INDEX_VERSION)[0]
+
+
+def _index_position(cursor):
+    # The index lists books by id, so a page is identified by the last id of the page before it ('' for the
+    # first page). None for a cursor that does not decode to one id: any string can be sent as ?cursor=, and
+    # those pages are rendered without being cached.
+    if not cursor:
+        return ''
+    values = decode_cursor(cursor)
+    if values is None or len(values) != 1 or type(values[0]) is not int:
+        return None
+    return values[0]
+
+
+def _index_key(catalogue_version, cursor):
+    position = _index_position(cursor)
+    if position is None:
+        return None
+    return f'fragment:index:{catalogue_version}:{position}'
+
+
+def _detail_key(book_id, book_version, catalogue_version):
+    return f'fragment:detail:{book_id}:{book_version}:{catalogue_version}'
+
+
+def index_fragment_key(cursor):
+    return _index_key(*_versions(CATALOGUE_VERSION), cursor)
+
+
+def detail_fragment_key(book_id):
+    return _detail_key(book_id, *_versions(_book_version_key(book_id), CATALOGUE_VERSION))
+
+
+def cached_fragment(key, render):
+    # Returns the HTML cached under `key`, rendering and storing it on a miss; a None key is never cached
+    if key is None:
+        return mark_safe(render())
+    html = cache.get(key)
+    if html is None:
+        html = render()
+        cache.set(key, html, getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 600))
+    return mark_safe(html)
+
+
+# Async counterparts for the views in async_views; they share the keys (and so the cached HTML) of the above
+
+async def aindex_fragment_key(cursor):
+    return _index_key(*await _aversions(CATALOGUE_VERSION), cursor)
+
+
+async def adetail_fragment_key(book_id):
+    return _detail_key(book_id, *await _aversions(_book_version_key(book_id), CATALOGUE_VERSION))
+
+
+async def acached_fragment(key, render):
+    # `render` is a coroutine function
+    if key is None:
+        return mark_safe(await render())
+    html = await cache.aget(key)
+    if html is None:
+        html = await render()
+        await cache.aset(key, html, getattr(settings, 'CATALOGUE_CACHE_TIMEOUT', 600))
+    return mark_safe(html)
@@ -0,0 +1,95 @@
+import hashlib
+from functools import wraps
+
+from django.db.models import Max
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import condition
+
+from .caching import catalogue_versions
+from .models import Book
+
+# ETag and Last-Modified validators for the catalogue pages, so a repeat visit gets a 304 before the view
+# renders anything. Each costs one indexed lookup of updated_at plus a read of the cache version stamps,
+# which also change on deletes and on bulk jobs (recommendations, imports) that timestamps alone would miss.
+# Pages extend base.html, which greets the logged-in user, so the ETag also covers the session.
+
+
+def conditional_page(etag_func, last_modified_func):
+    # django.views.decorators.http.condition, plus Vary: Cookie on every response, 304s included
+    def decorator(view):
+        conditional_view = condition(etag_func=etag_func, last_modified_func=last_modified_func)(view)
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            response = conditional_view(request, *args, **kwargs)
+            patch_vary_headers(response, ('Cookie',))
+            return response
+        return wrapper
+    return decorator
+
+
+def _etag(request, *parts):
+    data = '|'.join(str(part) for part in parts + (request.session.session_key,))
+    return hashlib.md5(data.encode(), usedforsecurity=False).hexdigest()
+
+
+def _once(request, name, compute):
+    # Both validators of a request share one database lookup
+    attr = f'_conditional_{name}'
+    if not hasattr(request, attr):
+        setattr(request, attr, compute())
+    return getattr(request, attr)
+
+
+def catalogue_modified(request):
+    # Newest change to any book, read from the end of the updated_at index
+    return _once(request, 'catalogue', lambda: Book.objects.aggregate(latest=Max('updated_at'))['latest'])
+
+
+def book_modified(request, book_id):
+    # Newest change to the book or its publisher; None when the book does not exist
+    def compute():
+        row = Book.objects.filter(pk=book_id).values_list('updated_at', 'publisher__updated_at').first()
+        return max(row) if row else None
+    return _once(request, f'book_{book_id}', compute)
+
+
+def index_etag(request):
+    return _etag(request, 'index', request.GET.get('cursor', ''), catalogue_modified(request),
+                 *catalogue_versions())
+
+
+def index_last_modified(request):
+    return catalogue_modified(request)
+
+
+def detail_etag(request, book_id):
+    # A missing book gets no validators, so its 404 is never revalidated
+    modified = book_modified(request, book_id)
+    if modified is None:
+        return None
+    return _etag(request, 'detail', book_id, modified, *catalogue_versions(book_id))
+
+
+def detail_last_modified(request, book_id):
+    return book_modified(request, book_id)
+
+
+def check_reviews_etag(request, book_id):
+    modified = book_modified(request, book_id)
+    if modified is None:
+        return None
+    return _etag(request, 'check', book_id, modified)
+
+
+def results_etag(request):
+    # Only result pages requested with GET (the search form posts the first page)
+    if request.method not in ('GET', 'HEAD') or 'max_price' not in request.GET:
+        return None
+    return _etag(request, 'results', request.GET.urlencode(), catalogue_modified(request), *catalogue_versions())
+
+
+def results_last_modified(request):
+    if request.method not in ('GET', 'HEAD') or 'max_price' not in request.GET:
+        return None
+    return catalogue_modified(request)
@@ -0,0 +1,80 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import connections, transaction
+
+from .caching import invalidate_book
+from .models import Book
+
+logger = logging.getLogger(__name__)
+
+
+class ReviewCounterBuffer:
+    # Coalesces review increments per book in process memory so a hot book takes one row lock per
+    # flush instead of one per review. Pending increments are lost if the process is killed before
+    # a flush; `manage.py rebuild_ratings` restores the rating aggregates from the Review table.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = {}  # book_id -> [review count, rating total]
+        self._timer = None
+
+    @property
+    def enabled(self):
+        return getattr(settings, 'REVIEW_COUNTERS_BUFFERED', False)
+
+    @property
+    def interval(self):
+        return getattr(settings, 'REVIEW_COUNTERS_FLUSH_INTERVAL', 5)
+
+    def add(self, book_id, rating):
+        with self._lock:
+            entry = self._pending.setdefault(book_id, [0, 0])
+            entry[0] += 1
+            entry[1] += rating
+            # The first pending increment schedules the next flush
+            if self._timer is None:
+                self._timer = threading.Timer(self.interval, self._flush_from_timer)
+                self._timer.daemon = True
+                self._timer.start()
+
+    def flush(self):
+        # Writes every pending increment; returns the number of books updated
+        with self._lock:
+            pending, self._pending = self._pending, {}
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+        if not pending:
+            return 0
+        try:
+            with transaction.atomic():
+                # Sorted ids give every process the same row lock order
+                for book_id in sorted(pending):
+                    count, rating_total = pending[book_id]
+                    Book.add_reviews(book_id, count, rating_total)
+                    invalidate_book(book_id)
+        except Exception:
+            # Keeps the increments for the next flush rather than dropping them
+            with self._lock:
+                for book_id, (count, rating_total) in pending.items():
+                    entry = self._pending.setdefault(book_id, [0, 0])
+                    entry[0] += count
+                    entry[1] += rating_total
+            raise
+        return len(pending)
+
+    def _flush_from_timer(self):
+        try:
+            self.flush()
+        except Exception as e:
+            logger.error("Failed to flush review counters: %s", e)
+        finally:
+            # The timer thread has its own database connection
+            connections.close_all()
+
+
+review_counters = ReviewCounterBuffer()
+atexit.register(review_counters.flush)
@@ -0,0 +1,114 @@
+import random
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from .caching import invalidate_catalogue, invalidate_search_index
+from .models import Book, Member, Order, Publisher, Review
+from .search import book_index
+
+# Synthetic members are recognisable by this username prefix so they can be cleared again
+USERNAME_PREFIX = 'synthetic_'
+
+# Password of every synthetic member, for logging in while benchmarking
+PASSWORD = 'synthetic-password'
+
+WORDS = ['python', 'django', 'history', 'ocean', 'garden', 'river', 'mountain', 'science', 'journey', 'kitchen',
+         'winter', 'summer', 'secret', 'empire', 'machine', 'island', 'forest', 'city', 'music', 'stars',
+         'travel', 'dragon', 'letters', 'night', 'light', 'shadow', 'algorithm', 'biology', 'war', 'peace']
+
+# Orders and reviews are spread over the year before this date so that runs are reproducible
+BASE_DATE = date(2024, 1, 1)
+
+
+def clear_catalogue():
+    # Removes every book, publisher, order and review, and the synthetic members
+    Review.objects.all().delete()
+    Order.objects.all().delete()
+    Book.objects.all().delete()
+    Publisher.objects.all().delete()
+    Member.objects.filter(username__startswith=USERNAME_PREFIX).delete()
+    book_index.clear()
+
+
+def generate_catalogue(publishers=10, books=1000, members=100, orders=1000, reviews=2000, books_per_order=3,
+                       seed=0, batch_size=1000):
+    # Loads a deterministic synthetic dataset; the same arguments always produce the same rows
+    rng = random.Random(seed)
+    categories = [code for code, label in Book.CATEGORY_CHOICES]
+
+    with transaction.atomic():
+        publisher_objs = Publisher.objects.bulk_create(
+            [Publisher(name=f'Publisher {i:05d}', website=f'https://publisher{i}.example.com',
+                       city=rng.choice(['Windsor', 'Toronto', 'Ottawa', 'Montreal']), country='Canada')
+             for i in range(publishers)], batch_size=batch_size)
+
+        # Ratings are drawn up front so each book's aggregates are written together with the book
+        review_plan = [(rng.randrange(books), rng.randint(1, 5)) for _ in range(reviews)]
+        rating_sums = [0] * books
+        rating_counts = [0] * books
+        for position, rating in review_plan:
+            rating_sums[position] += rating
+            rating_counts[position] += 1
+
+        book_objs = []
+        for i in range(books):
+            title_words = rng.sample(WORDS, 3)
+            book_objs.append(Book(
+                title=f'{" ".join(title_words).title()} {i}',
+                category=rng.choice(categories),
+                num_pages=rng.randint(50, 1200),
+                price=Decimal(rng.randint(100, 99900)) / 100,
+                publisher=rng.choice(publisher_objs),
+                description=' '.join(rng.choice(WORDS) for _ in range(20)),
+                num_reviews=rating_counts[i],
+                rating_sum=rating_sums[i],
+                rating_count=rating_counts[i],
+                avg_rating=rating_sums[i] / rating_counts[i] if rating_counts[i] else 0,
+            ))
+        book_objs = Book.objects.bulk_create(book_objs, batch_size=batch_size)
+
+        # Django cannot bulk_create multi-table inherited models, so members are saved one by one,
+        # sharing a single password hash
+        password = make_password(PASSWORD)
+        member_objs = []
+        for i in range(members):
+            member = Member(username=f'{USERNAME_PREFIX}{i:06d}', password=password, first_name=f'Member{i}',
+                            status=rng.choice([1, 1, 2, 3]))
+            member.save()
+            member_objs.append(member)
+
+        order_objs = Order.objects.bulk_create(
+            [Order(member=rng.choice(member_objs), order_type=rng.choice([Order.PURCHASE, Order.BORROW]),
+                   order_date=BASE_DATE - timedelta(days=rng.randrange(365)))
+             for _ in range(orders)], batch_size=batch_size)
+
+        OrderBook = Order.books.through
+        BorrowedBook = Member.borrowed_books.through
+        order_books = []
+        borrowed = set()
+        for order in order_objs:
+            for book in rng.sample(book_objs, min(books_per_order, len(book_objs))):
+                order_books.append(OrderBook(order_id=order.pk, book_id=book.pk))
+                if order.order_type == Order.BORROW:
+                    borrowed.add((order.member_id, book.pk))
+        OrderBook.objects.bulk_create(order_books, batch_size=batch_size)
+        BorrowedBook.objects.bulk_create(
+            [BorrowedBook(member_id=member_id, book_id=book_id) for member_id, book_id in sorted(borrowed)],
+            batch_size=batch_size)
+
+        Review.objects.bulk_create(
+            [Review(reviewer=f'reader{rng.randrange(members or 1)}@example.com', book=book_objs[position],
+                    rating=rating, comments=' '.join(rng.choice(WORDS) for _ in range(8)),
+                    date=BASE_DATE - timedelta(days=rng.randrange(365)))
+             for position, rating in review_plan], batch_size=batch_size)
+
+    # bulk_create sends no post_save signals, so the in-memory search indexes and the cached pages are
+    # expired explicitly; this process's index is dropped at once, as the stamps only move on commit
+    book_index.clear()
+    invalidate_search_index()
+    invalidate_catalogue()
+    return {'publishers': len(publisher_objs), 'books': len(book_objs), 'members': len(member_objs),
+            'orders': len(order_objs), 'order_books': len(order_books), 'reviews': len(review_plan)}
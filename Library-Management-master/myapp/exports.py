@@ -0,0 +1,98 @@
+import csv
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Prefetch
+
+from .models import Book, Order, Review
+
+# Rows fetched from the database per round trip; memory use depends on this, not on the table size
+CHUNK_SIZE = 2000
+
+FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+class ExportError(ValueError):
+    pass
+
+
+class Echo:
+    # File-like object for csv.writer that hands each formatted line back instead of storing it
+
+    def write(self, value):
+        return value
+
+
+BOOK_FIELDS = ['id', 'title', 'category', 'num_pages', 'price', 'publisher_id', 'publisher__name', 'description',
+               'num_reviews', 'avg_rating']
+ORDER_FIELDS = ['id', 'member_id', 'order_type', 'order_date', 'book_ids']
+REVIEW_FIELDS = ['id', 'book_id', 'reviewer', 'rating', 'comments', 'date']
+
+
+def book_rows(since_id=None, since_date=None, chunk_size=CHUNK_SIZE):
+    books = Book.objects.order_by('id').values(*BOOK_FIELDS)
+    if since_id is not None:
+        books = books.filter(id__gt=since_id)
+    yield from books.iterator(chunk_size=chunk_size)
+
+
+def order_rows(since_id=None, since_date=None, chunk_size=CHUNK_SIZE):
+    # Book ids are prefetched once per chunk of orders
+    orders = Order.objects.order_by('id').prefetch_related(Prefetch('books', queryset=Book.objects.only('id')))
+    if since_id is not None:
+        orders = orders.filter(id__gt=since_id)
+    if since_date is not None:
+        orders = orders.filter(order_date__gte=since_date)
+    for order in orders.iterator(chunk_size=chunk_size):
+        yield {'id': order.id, 'member_id': order.member_id, 'order_type': order.order_type,
+               'order_date': order.order_date, 'book_ids': sorted(book.id for book in order.books.all())}
+
+
+def review_rows(since_id=None, since_date=None, chunk_size=CHUNK_SIZE):
+    reviews = Review.objects.order_by('id').values(*REVIEW_FIELDS)
+    if since_id is not None:
+        reviews = reviews.filter(id__gt=since_id)
+    if since_date is not None:
+        reviews = reviews.filter(date__gte=since_date)
+    yield from reviews.iterator(chunk_size=chunk_size)
+
+
+# kind -> (row generator, CSV columns, whether it can be filtered by date)
+EXPORTS = {
+    'books': (book_rows, BOOK_FIELDS, False),
+    'orders': (order_rows, ORDER_FIELDS, True),
+    'reviews': (review_rows, REVIEW_FIELDS, True),
+}
+
+
+def _csv_value(value):
+    # Lists (an order's book ids) go into a single space-separated cell
+    if isinstance(value, list):
+        return ' '.join(str(item) for item in value)
+    return value
+
+
+def export_lines(kind, fmt, since_id=None, since_date=None, chunk_size=CHUNK_SIZE):
+    # Iterator of formatted lines (header first for CSV) for one export, ordered by id so that the
+    # last exported id can be passed as since_id by the next incremental run
+    if kind not in EXPORTS:
+        raise ExportError(f"Unknown export '{kind}'; choose from {', '.join(EXPORTS)}.")
+    if fmt not in FORMATS:
+        raise ExportError(f"Unknown format '{fmt}'; choose from {', '.join(FORMATS)}.")
+    row_generator, fields, date_filter = EXPORTS[kind]
+    if since_date is not None and not date_filter:
+        raise ExportError(f"The {kind} export can only be filtered by id.")
+    rows = row_generator(since_id=since_id, since_date=since_date, chunk_size=chunk_size)
+    if fmt == 'ndjson':
+        return (json.dumps(row, cls=DjangoJSONEncoder) + '\n' for row in rows)
+    return _csv_lines(rows, fields)
+
+
+def _csv_lines(rows, fields):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow([_csv_value(row[field]) for field in fields])
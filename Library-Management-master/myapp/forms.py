@@ -1,7 +1,43 @@
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
+from django.urls import reverse_lazy
 
-from myapp.models import Order, Review, Member
+from myapp.models import Book, Order, Review, Member
+
+
+def _book_id(value):
+    # The submitted value as a book id, or None when it cannot be one (letters, other digits, beyond 64 bits)
+    try:
+        pk = int(value)
+    except (TypeError, ValueError):
+        return None
+    return pk if 0 < pk < 2 ** 63 else None
+
+
+# Book inputs render an option for the selected books only, not one per book in the catalogue;
+# book_picker.js adds the books the user finds through the title autocomplete
+class BookPickerMixin:
+    class Media:
+        js = ['myapp/book_picker.js']
+
+    def __init__(self, attrs=None):
+        super().__init__({'class': 'form-control book-picker',
+                          'data-autocomplete-url': reverse_lazy('myapp:book_autocomplete'), **(attrs or {})})
+
+    def optgroups(self, name, value, attrs=None):
+        # The submitted or initial ids are loaded with one query; unknown ids are left to the field's validation
+        ids = [pk for pk in map(_book_id, value) if pk is not None]
+        books = self.choices.queryset.filter(pk__in=ids).order_by('title') if ids else []
+        return [(None, [self.create_option(name, book.pk, str(book), True, index)], index)
+                for index, book in enumerate(books)]
+
+
+class BookSelect(BookPickerMixin, forms.Select):
+    pass
+
+
+class BookSelectMultiple(BookPickerMixin, forms.SelectMultiple):
+    pass
 
 
 # Form for book search functionality
@@ -13,8 +49,8 @@ class SearchForm(forms.Form):
         ('T', 'Travel'),
         ('O', 'Other')
     ]
-    # Fields for searching books by name, category, and maximum price
-    name = forms.CharField(max_length=100, required=False, label="Your Name")
+    # Fields for searching books by title/description, category, and maximum price
+    name = forms.CharField(max_length=100, required=False, label="Title or keywords")
     category = forms.ChoiceField(widget=forms.RadioSelect, choices=CATEGORY_CHOICES, required=False,
                                  label="Select a category:")
     max_price = forms.DecimalField(label="Maximum Price", required=True, min_value=0)
@@ -26,7 +62,12 @@ class OrderForm(forms.ModelForm):
         model = Order
         # Fields for creating an order: books and order type
         fields = ['books', 'order_type']
-        widgets = {'books': forms.CheckboxSelectMultiple(), 'order_type': forms.RadioSelect}
+        widgets = {'books': BookSelectMultiple(), 'order_type': forms.RadioSelect}
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Submitted books are checked with a single id__in query that loads only what the order page shows
+        self.fields['books'].queryset = Book.objects.for_listing()
 
 
 # Form for submitting reviews
@@ -35,10 +76,14 @@ class ReviewForm(forms.ModelForm):
         model = Review
         # Fields for submitting a review: reviewer, book, rating, comments
         fields = ['reviewer', 'book', 'rating', 'comments']
-        widgets = {'book': forms.RadioSelect}
+        widgets = {'book': BookSelect()}
         labels = {'reviewer': u'Please enter a valid email', 'rating': u'Rating: An integer between 1 (worst) and 5 ('
                                                                        u'best)'}
 
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.fields['book'].queryset = Book.objects.for_listing()
+
     # Validation for the rating field
     def clean_rating(self):
         rating = self.cleaned_data.get('rating')
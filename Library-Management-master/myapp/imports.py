@@ -0,0 +1,133 @@
+import csv
+import json
+import os
+
+from django.core.exceptions import ValidationError
+from django.db import transaction
+
+from .models import Book, Publisher
+
+# Rows written per transaction (one publisher upsert and one book upsert)
+BATCH_SIZE = 2000
+
+FORMATS = ('csv', 'ndjson')
+
+# Input columns. The publisher is given by name ("publisher__name" as written by export_data also works);
+# rows that also give publisher_website create or update the publisher, the others must name an existing one.
+PUBLISHER_COLUMNS = {'website': 'publisher_website', 'city': 'publisher_city', 'country': 'publisher_country'}
+BOOK_COLUMNS = ['title', 'category', 'num_pages', 'price', 'description']
+
+# Book columns an import overwrites on an existing (publisher, title); rating counters are left alone.
+# updated_at is filled in by bulk_create and has to be listed for conflicting rows to get it.
+BOOK_UPDATE_FIELDS = ['category', 'num_pages', 'price', 'description', 'updated_at']
+
+
+class CatalogueImportError(ValueError):
+    pass
+
+
+def detect_format(path):
+    extension = os.path.splitext(path)[1].lstrip('.').lower()
+    if extension in ('jsonl', 'ndjson'):
+        return 'ndjson'
+    if extension == 'csv':
+        return 'csv'
+    raise CatalogueImportError(f"Cannot tell the format of '{path}'; pass --format csv or ndjson.")
+
+
+def read_rows(file, fmt):
+    # Yields (line number, row dict) one line at a time, so the file is never held in memory
+    if fmt == 'csv':
+        reader = csv.DictReader(file)
+        for row in reader:
+            yield reader.line_num, row
+    else:
+        for line_no, line in enumerate(file, start=1):
+            if line.strip():
+                try:
+                    yield line_no, json.loads(line)
+                except ValueError as e:
+                    yield line_no, e
+
+
+def batches(rows, size=BATCH_SIZE):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _value(row, column):
+    # Empty CSV cells count as missing so the model default applies
+    value = row.get(column)
+    return None if value == '' else value
+
+
+def _clean(model, name, value):
+    # Runs the model field's own conversion, choices check and validators (e.g. the price bounds)
+    field = model._meta.get_field(name)
+    if value is None and field.has_default():
+        value = field.get_default()
+    elif value is None and field.blank and field.empty_strings_allowed:
+        value = ''
+    try:
+        return field.clean(value, None)
+    except ValidationError as e:
+        raise ValidationError(f"{name}: {' '.join(e.messages)}")
+
+
+def clean_row(row):
+    # Returns (publisher name, publisher details or None, book field values) or raises ValidationError
+    if isinstance(row, ValueError):
+        raise ValidationError(f'invalid JSON ({row})')
+    if not isinstance(row, dict):
+        raise ValidationError('not a JSON object')
+    name = _clean(Publisher, 'name', _value(row, 'publisher') or _value(row, 'publisher__name'))
+    details = None
+    if _value(row, PUBLISHER_COLUMNS['website']) is not None:
+        details = {field: _clean(Publisher, field, _value(row, column)) for field, column in PUBLISHER_COLUMNS.items()}
+    book = {field: _clean(Book, field, _value(row, field)) for field in BOOK_COLUMNS}
+    return name, details, book
+
+
+def import_batch(batch):
+    # Validates and upserts one batch of (line number, row); returns (rows imported, [(line number, error)])
+    errors = []
+    cleaned = []
+    for line_no, row in batch:
+        try:
+            cleaned.append((line_no,) + clean_row(row))
+        except ValidationError as e:
+            errors.append((line_no, ' '.join(e.messages)))
+
+    # Later rows win when a file repeats a key, as they would if imported one by one; sorted keys keep
+    # concurrent workers locking rows in the same order
+    publishers = {name: Publisher(name=name, **details) for line_no, name, details, book in cleaned if details}
+
+    with transaction.atomic():
+        if publishers:
+            Publisher.objects.bulk_create(
+                [publishers[name] for name in sorted(publishers)], update_conflicts=True,
+                unique_fields=['name'], update_fields=list(PUBLISHER_COLUMNS) + ['updated_at'])
+        # Upserts do not return ids on every backend, so they are looked up in one query
+        names = {name for line_no, name, details, book in cleaned}
+        publisher_ids = dict(Publisher.objects.filter(name__in=names).values_list('name', 'id'))
+
+        books = {}
+        imported = 0
+        for line_no, name, details, book in cleaned:
+            if name not in publisher_ids:
+                errors.append((line_no, f"publisher: '{name}' does not exist; give publisher_website to create it"))
+                continue
+            books[publisher_ids[name], book['title']] = Book(publisher_id=publisher_ids[name], **book)
+            imported += 1
+        if books:
+            Book.objects.bulk_create(
+                [books[key] for key in sorted(books)], update_conflicts=True,
+                unique_fields=['publisher', 'title'], update_fields=BOOK_UPDATE_FIELDS)
+
+    return imported, sorted(errors)
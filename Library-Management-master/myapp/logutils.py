@@ -0,0 +1,182 @@
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import threading
+import time
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+
+# Logging pipeline used by settings.LOGGING. Records are filtered (sampling, rate limits) and put on an
+# in-memory queue by the thread that logs; a listener thread formats them as JSON and does the I/O, so a
+# request never waits on the log stream. Nothing here may import models: it is loaded while Django configures
+# logging, before the apps.
+
+# Records waiting to be written; when the listener falls this far behind, new records are dropped
+QUEUE_SIZE = 10000
+
+logger = logging.getLogger(__name__)
+
+# LogRecord attributes; anything else on a record came from `extra=` and is written as its own JSON key
+_RECORD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', None, None))) | {'message', 'asctime'}
+
+
+class JsonFormatter(logging.Formatter):
+    # One JSON object per line: time, level, logger, message, the exception if any, and the extra fields
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage(),
+        }
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            # Formatted by NonBlockingQueueHandler.prepare()
+            entry['exception'] = record.exc_text
+        entry.update((key, value) for key, value in vars(record).items() if key not in _RECORD_ATTRS)
+        return json.dumps(entry, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    # Lets through a random `rates[name]` share of the records below WARNING of each configured logger and its
+    # children (the most specific name wins); other loggers use `default`. Warnings and errors always pass.
+
+    def __init__(self, rates=None, default=1.0):
+        super().__init__()
+        self.rates = dict(rates or {})
+        self.default = default
+        self._resolved = {}
+
+    def rate(self, name):
+        if name not in self._resolved:
+            parts = name.split('.')
+            prefixes = ('.'.join(parts[:length]) for length in range(len(parts), 0, -1))
+            self._resolved[name] = next((self.rates[prefix] for prefix in prefixes if prefix in self.rates),
+                                        self.default)
+        return self._resolved[name]
+
+    def filter(self, record):
+        if record.levelno >= logging.WARNING:
+            return True
+        return random.random() < self.rate(record.name)
+
+
+class RateLimitFilter(logging.Filter):
+    # Passes at most `rate` records per `per` seconds for each logger and message template, so one failing
+    # query cannot flood the log; the next record let through carries the number dropped as `suppressed`.
+    # Windows that have ended are dropped every `per` seconds, those with dropped records only after `keep`
+    # seconds, so messages that are not logged again do not stay in memory; their dropped count is then
+    # logged as a warning of its own.
+
+    def __init__(self, rate=20, per=1.0, keep=60.0):
+        super().__init__()
+        self.rate = rate
+        self.per = per
+        self.keep = keep
+        self._windows = {}
+        self._lock = threading.Lock()
+        self._next_sweep = time.monotonic() + per
+
+    def filter(self, record):
+        key = (record.name, record.msg)
+        now = time.monotonic()
+        expired = ()
+        with self._lock:
+            if now >= self._next_sweep:
+                expired = self._sweep(now)
+            start, count, suppressed = self._windows.get(key, (now, 0, 0))
+            if now - start >= self.per:
+                start, count = now, 0
+            if count >= self.rate:
+                self._windows[key] = (start, count, suppressed + 1)
+                passed = False
+            else:
+                self._windows[key] = (start, count + 1, 0)
+                passed = True
+        # Logged outside the lock, as these records come back through this filter
+        for (name, msg), dropped in expired:
+            logger.warning("Suppressed %d records of %s: %s", dropped, name, msg,
+                           extra={'suppressed': dropped, 'suppressed_logger': name})
+        if passed and suppressed:
+            record.suppressed = suppressed
+        return passed
+
+    def _sweep(self, now):
+        # Returns ((logger name, message), dropped count) for the windows given up on with records dropped
+        expired = [(key, window[2]) for key, window in self._windows.items()
+                   if window[2] and now - window[0] >= self.keep]
+        self._windows = {key: window for key, window in self._windows.items()
+                         if now - window[0] < (self.keep if window[2] else self.per)}
+        self._next_sweep = now + self.per
+        return expired
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    # Drops the record instead of waiting when the queue is full; the next record queued carries the number
+    # dropped as `queue_dropped`. A forked child (import_catalogue's workers) has no listener thread, so
+    # there it writes its records to `target` itself.
+
+    def __init__(self, log_queue, target=None):
+        super().__init__(log_queue)
+        self.target = target
+        self.dropped = 0
+        self.listener = None
+
+    def write_directly(self):
+        # Called in forked children: records put on the inherited queue would never be written, and the
+        # parent's listener is not theirs to stop
+        if self.listener is not None:
+            atexit.unregister(self.listener.stop)
+            self.listener = None
+        self.queue = None
+
+    def emit(self, record):
+        if self.queue is None:
+            self.target.handle(record)
+        else:
+            super().emit(record)
+
+    def prepare(self, record):
+        # The message is built now, as its arguments may change once the call returns, and the traceback is
+        # turned into text the listener thread can still format; both only for records the filters kept
+        record = copy.copy(record)
+        record.message = record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
+
+    def enqueue(self, record):
+        # Handler.handle() holds the handler's lock, so `dropped` is only changed by one thread at a time
+        if self.dropped:
+            record.queue_dropped = self.dropped
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+        else:
+            self.dropped = 0
+
+
+def queue_handler(stream=None, queue_size=QUEUE_SIZE):
+    # Handler factory for LOGGING ('()': 'myapp.logutils.queue_handler'): a queue handler whose listener
+    # thread writes JSON lines to `stream` (stderr by default). The listener is stopped, and the queue
+    # drained, when the process exits.
+    target = logging.StreamHandler(stream)
+    target.setFormatter(JsonFormatter())
+    log_queue = queue.Queue(queue_size)
+    listener = QueueListener(log_queue, target, respect_handler_level=True)
+    listener.start()
+    atexit.register(listener.stop)
+    handler = NonBlockingQueueHandler(log_queue, target)
+    handler.listener = listener
+    if hasattr(os, 'register_at_fork'):
+        os.register_at_fork(after_in_child=handler.write_directly)
+    return handler
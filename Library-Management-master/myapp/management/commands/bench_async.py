@@ -0,0 +1,60 @@
+import asyncio
+
+from django.core.cache import cache
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import AsyncClient, Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from myapp import benchmarks
+from myapp.datagen import generate_catalogue
+
+
+class Command(BaseCommand):
+    help = 'Load-tests the read-only pages through the sync (WSGI, one thread per concurrent reader) and async ' \
+           '(ASGI, one event loop) views against a synthetic catalogue in a throwaway test database'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--concurrency', type=int, default=20, help='Simultaneous readers')
+        parser.add_argument('--requests', type=int, default=200, help='Requests per page and mode')
+        parser.add_argument('--db-latency-ms', type=float, default=2.0,
+                            help='Delay added to every query, as for a database on another host (0 for none)')
+        parser.add_argument('--no-cache', action='store_true',
+                            help='Clear the cache before each run so the fragment caches do not hide the queries')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(PROFILING_ENABLED=False):
+                generate_catalogue(seed=options['seed'], **benchmarks.scale_sizes(options['books']))
+                if options['db_latency_ms']:
+                    benchmarks.simulate_db_latency(options['db_latency_ms'] / 1000)
+                self.run(options)
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+    def run(self, options):
+        fixtures = benchmarks.build_fixtures()
+        concurrency, requests = options['concurrency'], options['requests']
+        sync_clients = benchmarks.logged_in_clients(Client, fixtures['member'], concurrency)
+        async_clients = benchmarks.logged_in_clients(AsyncClient, fixtures['member'], concurrency)
+
+        self.stdout.write(f"{options['books']} books, {concurrency} concurrent readers, {requests} requests per run, "
+                          f"{options['db_latency_ms']} ms per query")
+        self.stdout.write(f"{'view':<14}{'mode':<7}{'req/s':>9}{'median ms':>11}{'p95 ms':>9}{'errors':>8}")
+        for name, sync_path, async_path, data in benchmarks.load_scenarios(fixtures):
+            for mode, run in (('sync', lambda: benchmarks.sync_load(sync_clients, sync_path, data, requests)),
+                              # A fresh event loop rather than async_to_sync, which would run every request's
+                              # sync parts in this one thread instead of a thread per request as under ASGI
+                              ('async', lambda: asyncio.run(benchmarks.async_load(
+                                  async_clients, async_path, data, requests)))):
+                if options['no_cache']:
+                    cache.clear()
+                result = run()
+                line = (f"{name:<14}{mode:<7}{result['rps']:>9.1f}{result['median_ms']:>11.2f}"
+                        f"{result['p95_ms']:>9.2f}{result['errors']:>8}")
+                self.stdout.write(self.style.ERROR(line) if result['errors'] else line)
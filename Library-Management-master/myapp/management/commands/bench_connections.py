@@ -0,0 +1,100 @@
+import os
+import statistics
+import tempfile
+import time
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections, connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+from django.urls import reverse
+
+from myapp import benchmarks
+from myapp.datagen import generate_catalogue
+
+
+class Command(BaseCommand):
+    help = 'Compares request latency with a new database connection per request, persistent connections ' \
+           '(CONN_MAX_AGE with health checks) and, on Django 5.1+ with PostgreSQL, a psycopg pool'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=1000)
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--requests', type=int, default=200, help='Timed requests per page and mode')
+        parser.add_argument('--connect-latency-ms', type=float, default=0,
+                            help='Delay added to every new connection, as for a database on another host')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        temp_dir = None
+        if connection.vendor == 'sqlite':
+            # An in-memory test database would vanish on the first reconnect
+            temp_dir = tempfile.TemporaryDirectory()
+            connection.settings_dict['TEST']['NAME'] = os.path.join(temp_dir.name, 'bench.sqlite3')
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(PROFILING_ENABLED=False):
+                generate_catalogue(seed=options['seed'], **benchmarks.scale_sizes(options['books']))
+                if options['connect_latency_ms']:
+                    benchmarks.simulate_connect_latency(options['connect_latency_ms'] / 1000)
+                self.run(options['requests'])
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+            if temp_dir is not None:
+                temp_dir.cleanup()
+
+    def modes(self):
+        # (name, CONN_MAX_AGE, CONN_HEALTH_CHECKS, OPTIONS['pool'])
+        modes = [('per-request', 0, False, None), ('persistent', 600, True, None)]
+        if django.VERSION >= (5, 1) and connection.vendor == 'postgresql':
+            modes.append(('pool', 0, False, {'min_size': 2, 'max_size': 4}))
+        return modes
+
+    def run(self, requests):
+        fixtures = benchmarks.build_fixtures()
+        client = Client()
+        client.force_login(fixtures['member'])
+        pages = [('chk_reviews', reverse('myapp:check_reviews', args=[fixtures['book_id']])),
+                 ('detail', reverse('myapp:detail', args=[fixtures['book_id']]))]
+
+        self.stdout.write(f"{'view':<14}{'mode':<13}{'median ms':>11}{'p95 ms':>9}{'connects':>10}")
+        settings_dict = connection.settings_dict
+        original = dict(settings_dict, OPTIONS=dict(settings_dict['OPTIONS']))
+        try:
+            for name, path in pages:
+                for mode, max_age, health_checks, pool in self.modes():
+                    connection.close()
+                    settings_dict['CONN_MAX_AGE'] = max_age
+                    settings_dict['CONN_HEALTH_CHECKS'] = health_checks
+                    settings_dict['OPTIONS'] = dict(original['OPTIONS'], **({'pool': pool} if pool else {}))
+                    timings, connects = self.measure(client, path, requests)
+                    if pool:
+                        connection.close_pool()
+                    timings.sort()
+                    self.stdout.write(f"{name:<14}{mode:<13}{statistics.median(timings):>11.2f}"
+                                      f"{timings[min(len(timings) - 1, int(len(timings) * 0.95))]:>9.2f}"
+                                      f"{connects:>10}")
+        finally:
+            connection.close()
+            settings_dict.update(original)
+
+    @staticmethod
+    def measure(client, path, requests):
+        # The test client disconnects close_old_connections from request_started/request_finished, so it is
+        # called here as it would be around every real request
+        timings = []
+        connects = 0
+        for i in range(requests + 1):
+            close_old_connections()
+            reconnects = connection.connection is None
+            start = time.perf_counter()
+            client.get(path)
+            elapsed = (time.perf_counter() - start) * 1000
+            close_old_connections()
+            # The first request only warms up the page cache
+            if i:
+                timings.append(elapsed)
+                connects += reconnects
+        return timings, connects
@@ -0,0 +1,75 @@
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from myapp import benchmarks
+from myapp.datagen import clear_catalogue, generate_catalogue
+
+
+class Command(BaseCommand):
+    help = 'Benchmarks the main myapp views against synthetic catalogues of several sizes in a throwaway ' \
+           'test database, reporting latency and query counts and failing when a view answers with an ' \
+           'unexpected status or exceeds its query budget'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--scales', default='100,1000,10000',
+                            help='Comma-separated number of books for each run (default: 100,1000,10000)')
+        parser.add_argument('--repeat', type=int, default=10, help='Timed requests per view and scale')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--no-budgets', action='store_true',
+                            help='Report only; never fail on query counts (unexpected statuses still fail)')
+
+    def handle(self, *args, **options):
+        scales = [int(scale) for scale in options['scales'].split(',') if scale.strip()]
+        failures = []
+        errors = []
+
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            # Profiling samples from benchmark requests would pollute the real report
+            with override_settings(PROFILING_ENABLED=False):
+                for scale in scales:
+                    clear_catalogue()
+                    cache.clear()
+                    generate_catalogue(seed=options['seed'], **benchmarks.scale_sizes(scale))
+                    scale_failures, scale_errors = self.report(scale, benchmarks.run_scenarios(options['repeat']))
+                    failures += scale_failures
+                    errors += scale_errors
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if errors:
+            raise CommandError('Unexpected status: ' + '; '.join(errors))
+        if failures and not options['no_budgets']:
+            raise CommandError('Query budget exceeded: ' + '; '.join(failures))
+
+    def report(self, scale, results):
+        self.stdout.write(f'\n{scale} books')
+        self.stdout.write(f"{'view':<14}{'status':>7}{'median ms':>11}{'p95 ms':>9}{'queries':>9}{'budget':>8}"
+                          f"{'cold':>6}{'budget':>8}")
+        failures = []
+        errors = []
+        for result in results:
+            line = (f"{result['name']:<14}{result['status']:>7}{result['median_ms']:>11.2f}{result['p95_ms']:>9.2f}"
+                    f"{result['queries']:>9}{self.budget(result['budget']):>8}"
+                    f"{result['cold_queries']:>6}{self.budget(result['cold_budget']):>8}")
+            over = False
+            for label, queries, budget in (('', result['queries'], result['budget']),
+                                           ('cold ', result['cold_queries'], result['cold_budget'])):
+                if budget is not None and queries > budget:
+                    failures.append(f"{result['name']} ran {queries} queries {label}at {scale} books "
+                                    f"(budget {budget})")
+                    over = True
+            if result['status'] != result['expected_status']:
+                errors.append(f"{result['name']} answered {result['status']} at {scale} books "
+                              f"(expected {result['expected_status']})")
+                over = True
+            self.stdout.write(self.style.ERROR(line) if over else line)
+        return failures, errors
+
+    @staticmethod
+    def budget(value):
+        return '-' if value is None else value
@@ -0,0 +1,32 @@
+import time
+from importlib.util import find_spec
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp import recommendations
+
+
+class Command(BaseCommand):
+    help = 'Rebuilds the "members also borrowed" lists from books ordered together and the top rated books of ' \
+           'each category (needs numpy and scipy)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--per-book', type=int, default=recommendations.RECOMMENDATIONS_PER_BOOK)
+        parser.add_argument('--per-category', type=int, default=recommendations.TOP_RATED_PER_CATEGORY)
+        parser.add_argument('--block-lines', type=int, default=recommendations.BLOCK_LINES,
+                            help='Order lines processed per block; bounds the memory used')
+        parser.add_argument('--min-support', type=int, default=1,
+                            help='Orders two books must share before one is recommended for the other')
+
+    def handle(self, *args, **options):
+        # recommendations imports them where they are used; fail early, before any query, when they are missing
+        if find_spec('numpy') is None or find_spec('scipy') is None:
+            raise CommandError('compute_recommendations needs numpy and scipy: pip install numpy scipy')
+
+        start = time.perf_counter()
+        counts = recommendations.compute_recommendations(
+            per_book=options['per_book'], per_category=options['per_category'],
+            block_lines=options['block_lines'], min_support=options['min_support'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Stored {counts['recommendations']} recommendations and {counts['top_rated']} top rated books "
+            f"in {time.perf_counter() - start:.1f}s."))
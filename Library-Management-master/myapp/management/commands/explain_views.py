@@ -0,0 +1,118 @@
+import re
+
+from django.apps import apps
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings, setup_test_environment, teardown_test_environment
+
+from myapp import benchmarks
+from myapp.datagen import generate_catalogue
+from myapp.search import book_index
+
+# Plan lines that mean a whole myapp table is read; small auth/session tables are not reported
+FULL_SCAN_MARKERS = {
+    'postgresql': ('Seq Scan on myapp_',),
+    'sqlite': ('SCAN myapp_',),
+}
+
+# SQLite reports the first page of a list in primary key order as "SCAN myapp_book" too, but walking the
+# table in rowid order it stops after LIMIT rows. Only queries of exactly this shape (no WHERE or join that
+# could make it read on for matches) with no temporary sort in the plan are treated as bounded.
+PK_ORDERED_PAGE_RE = re.compile(r'FROM "(\w+)" ORDER BY "\1"\."(\w+)" (?:ASC|DESC) LIMIT \d+$')
+
+
+class QueryRecorder:
+    # Execute wrapper remembering every SELECT a view runs, with its parameters
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith('SELECT'):
+            self.queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+
+class Command(BaseCommand):
+    help = 'Generates a large synthetic catalogue in a throwaway test database, runs each benchmarked view and ' \
+           'prints the query plan of every SELECT it issues, flagging full scans of myapp tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--books', type=int, default=100000, help='Catalogue size (default: 100000)')
+        parser.add_argument('--seed', type=int, default=0)
+        parser.add_argument('--fail-on-scan', action='store_true',
+                            help='Exit with an error when any plan scans a whole myapp table')
+
+    def handle(self, *args, **options):
+        setup_test_environment()
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            with override_settings(PROFILING_ENABLED=False):
+                generate_catalogue(seed=options['seed'], **benchmarks.scale_sizes(options['books']))
+                # Fresh planner statistics, as a production database would have
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+                scans = self.explain_scenarios()
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+            teardown_test_environment()
+
+        if scans and options['fail_on_scan']:
+            raise CommandError(f'{scans} query plan(s) scan a whole myapp table.')
+
+    def explain_scenarios(self):
+        markers = FULL_SCAN_MARKERS.get(connection.vendor, ())
+        fixtures = benchmarks.build_fixtures()
+        client = Client()
+        client.force_login(fixtures['member'])
+
+        # The SQLite fallback's in-memory search index reads every book once per process, not per request
+        cache.clear()
+        book_index.search('warm')
+
+        scans = 0
+        for name, method, path, data in benchmarks.scenarios(fixtures):
+            # Cached fragments would hide the view's queries
+            cache.clear()
+            recorder = QueryRecorder()
+            with connection.execute_wrapper(recorder):
+                if data is not None:
+                    getattr(client, method)(path, data)
+                else:
+                    getattr(client, method)(path)
+
+            self.stdout.write(self.style.MIGRATE_HEADING(f'\n{name}: {method.upper()} {path}'))
+            for sql, params in recorder.queries:
+                self.stdout.write(f'  {sql}')
+                plan = self.explain(sql, params)
+                bounded = self.bounded_scan(sql, plan)
+                for line in plan:
+                    if line == bounded:
+                        self.stdout.write(f'      {line}   (primary key order, stops at the LIMIT)')
+                    elif any(marker in line for marker in markers):
+                        scans += 1
+                        self.stdout.write(self.style.WARNING(f'      {line}   <-- table scan'))
+                    else:
+                        self.stdout.write(f'      {line}')
+        return scans
+
+    @staticmethod
+    def bounded_scan(sql, plan):
+        # The plan line of a SQLite scan that reads no more than LIMIT rows, if the query is one
+        match = PK_ORDERED_PAGE_RE.search(sql)
+        if connection.vendor != 'sqlite' or not match or any('USE TEMP B-TREE' in line for line in plan):
+            return None
+        table, column = match.groups()
+        primary_keys = {model._meta.db_table: model._meta.pk.column for model in apps.get_models()}
+        if primary_keys.get(table) != column:
+            return None
+        return f'SCAN {table}'
+
+    @staticmethod
+    def explain(sql, params):
+        with connection.cursor() as cursor:
+            cursor.execute(f'{connection.ops.explain_query_prefix()} {sql}', params)
+            # The plan text is the last column on both PostgreSQL and SQLite
+            return [str(row[-1]) for row in cursor.fetchall()]
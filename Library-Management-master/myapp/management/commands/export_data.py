@@ -0,0 +1,34 @@
+import sys
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.exports import CHUNK_SIZE, EXPORTS, FORMATS, ExportError, export_lines
+
+
+class Command(BaseCommand):
+    help = 'Streams books, orders or reviews as CSV or NDJSON, optionally only rows newer than an id or date'
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=list(EXPORTS))
+        parser.add_argument('--format', choices=list(FORMATS), default='csv')
+        parser.add_argument('--since-id', type=int, help='Only rows with a greater id (incremental sync)')
+        parser.add_argument('--since-date', type=date.fromisoformat,
+                            help='Only orders/reviews dated on or after YYYY-MM-DD')
+        parser.add_argument('--output', help='File to write (default: standard output)')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            lines = export_lines(options['kind'], options['format'], since_id=options['since_id'],
+                                 since_date=options['since_date'], chunk_size=options['chunk_size'])
+        except ExportError as e:
+            raise CommandError(e)
+
+        output = open(options['output'], 'w', newline='', encoding='utf-8') if options['output'] else sys.stdout
+        try:
+            for line in lines:
+                output.write(line)
+        finally:
+            if output is not sys.stdout:
+                output.close()
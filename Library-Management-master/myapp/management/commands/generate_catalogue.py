@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from myapp.datagen import clear_catalogue, generate_catalogue
+
+
+class Command(BaseCommand):
+    help = 'Loads a deterministic synthetic catalogue (publishers, books, members, orders, reviews) with bulk inserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--publishers', type=int, default=10)
+        parser.add_argument('--books', type=int, default=1000)
+        parser.add_argument('--members', type=int, default=100)
+        parser.add_argument('--orders', type=int, default=1000)
+        parser.add_argument('--reviews', type=int, default=2000)
+        parser.add_argument('--books-per-order', type=int, default=3)
+        parser.add_argument('--seed', type=int, default=0, help='Same seed, same data')
+        parser.add_argument('--batch-size', type=int, default=1000)
+        parser.add_argument('--clear', action='store_true',
+                            help='Delete all books, publishers, orders, reviews and synthetic members first')
+
+    def handle(self, *args, **options):
+        if options['publishers'] < 1 or options['books'] < 1 or options['members'] < 1:
+            raise CommandError('At least one publisher, book and member is required.')
+        if options['clear']:
+            clear_catalogue()
+        counts = generate_catalogue(
+            publishers=options['publishers'], books=options['books'], members=options['members'],
+            orders=options['orders'], reviews=options['reviews'], books_per_order=options['books_per_order'],
+            seed=options['seed'], batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            'Generated ' + ', '.join(f'{count} {name}' for name, count in counts.items()) + '.'))
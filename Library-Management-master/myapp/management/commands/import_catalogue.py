@@ -0,0 +1,77 @@
+import multiprocessing
+import time
+from collections import deque
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from myapp.caching import invalidate_catalogue, invalidate_search_index
+from myapp.imports import BATCH_SIZE, FORMATS, CatalogueImportError, batches, detect_format, import_batch, read_rows
+
+# Errors printed in full; the rest are only counted
+MAX_REPORTED_ERRORS = 50
+
+
+class Command(BaseCommand):
+    help = 'Imports publishers and books from a CSV or JSON-lines file, creating or updating publishers by name ' \
+           'and books by (publisher, title) with batched upserts'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--format', choices=FORMATS, help='Default: from the file extension (.csv, .jsonl, .ndjson)')
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE, help='Rows per transaction')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='Processes importing batches in parallel (PostgreSQL only)')
+
+    def handle(self, *args, **options):
+        try:
+            fmt = options['format'] or detect_format(options['path'])
+        except CatalogueImportError as e:
+            raise CommandError(e)
+        workers = options['workers']
+        if workers > 1 and connection.vendor == 'sqlite':
+            raise CommandError('SQLite allows one writer at a time; run with --workers 1.')
+
+        self.verbosity = options['verbosity']
+        self.imported = 0
+        self.errors = 0
+        start = time.perf_counter()
+        with open(options['path'], newline='', encoding='utf-8') as file:
+            row_batches = batches(read_rows(file, fmt), options['batch_size'])
+            if workers > 1:
+                self.import_parallel(row_batches, workers)
+            else:
+                for batch in row_batches:
+                    self.report(*import_batch(batch))
+        elapsed = time.perf_counter() - start
+
+        # bulk_create sends no post_save signals, so the in-memory search indexes and the cached pages
+        # are expired explicitly
+        invalidate_search_index()
+        invalidate_catalogue()
+
+        rate = self.imported / elapsed if elapsed else 0
+        self.stdout.write(self.style.SUCCESS(
+            f'Imported {self.imported} rows in {elapsed:.1f}s ({rate:.0f} rows/s); {self.errors} rows rejected.'))
+
+    def import_parallel(self, row_batches, workers):
+        # Forked children must not share the parent's database connections
+        connections.close_all()
+        with multiprocessing.get_context('fork').Pool(workers) as pool:
+            # At most two batches per worker are read ahead, so memory stays bounded however big the file is
+            pending = deque()
+            for batch in row_batches:
+                if len(pending) >= workers * 2:
+                    self.report(*pending.popleft().get())
+                pending.append(pool.apply_async(import_batch, (batch,)))
+            while pending:
+                self.report(*pending.popleft().get())
+
+    def report(self, imported, errors):
+        for line_no, message in errors:
+            if self.errors < MAX_REPORTED_ERRORS:
+                self.stderr.write(f'Line {line_no}: {message}')
+            self.errors += 1
+        self.imported += imported
+        if self.verbosity > 1:
+            self.stdout.write(f'{self.imported} rows imported')
@@ -0,0 +1,116 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
+from django.db.migrations.executor import MigrationExecutor
+from django.db.models import Count
+
+from myapp.caching import invalidate_catalogue, invalidate_search_index
+
+# Review counters a merged book adds to the copy that is kept
+COUNTERS = ['num_reviews', 'rating_sum', 'rating_count']
+
+# Book fields shown when copies of a title differ; only the kept copy's values survive a merge
+COMPARED = ['price', 'category', 'num_pages', 'description']
+
+
+class Command(BaseCommand):
+    help = 'Lists publishers sharing a name and books sharing a title under one publisher, which migration 0017 ' \
+           'refuses to constrain, and with --merge folds each group into its oldest row'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--merge', action='store_true',
+                            help='Merge every listed group into its oldest row; without it nothing is changed')
+        parser.add_argument('--database', default=DEFAULT_DB_ALIAS)
+
+    def handle(self, *args, **options):
+        db = options['database']
+        Publisher, Book = self.models(db)
+        publishers = duplicates(Publisher.objects.using(db), 'name')
+        books = book_duplicates(Book.objects.using(db),
+                                {other: keep for keep, others in publishers.items() for other in others})
+        if not publishers and not books:
+            self.stdout.write('No duplicate publishers or books.')
+            return
+
+        for keep, others in publishers.items():
+            self.stdout.write(f'Publisher {keep} {Publisher.objects.using(db).get(pk=keep).name!r}: '
+                              f'keeps its books and takes over those of {", ".join(map(str, others))}')
+        for keep, others in books.items():
+            rows = {row['id']: row for row in Book.objects.using(db).filter(id__in=[keep] + others)
+                    .values('id', 'title', *COMPARED)}
+            self.stdout.write(f'Book {keep} {rows[keep]["title"]!r}: takes over the orders, borrows and reviews '
+                              f'of {", ".join(map(str, others))}')
+            for field in COMPARED:
+                if any(rows[other][field] != rows[keep][field] for other in others):
+                    values = ', '.join(f'{pk}={str(rows[pk][field])[:40]!r}' for pk in [keep] + others)
+                    self.stdout.write(self.style.WARNING(f'  {field} differs, {keep} is kept: {values}'))
+        if not options['merge']:
+            self.stdout.write('Nothing changed; run again with --merge to merge these rows.')
+            return
+
+        with transaction.atomic(using=db):
+            for keep, others in publishers.items():
+                move_relations(Publisher, db, keep, others)
+                Publisher.objects.using(db).filter(id__in=others).delete()
+            for keep, others in books.items():
+                merge_books(Book, db, keep, others)
+            invalidate_search_index()
+            invalidate_catalogue()
+        self.stdout.write(self.style.SUCCESS('Merged. Run migrate to add the unique constraints.'))
+
+    @staticmethod
+    def models(db):
+        # The models as the database has them: before 0017 it lacks columns the current models have (updated_at)
+        executor = MigrationExecutor(connections[db])
+        loader = executor.loader
+        state = loader.project_state([key for key in loader.applied_migrations if key in loader.graph.nodes])
+        return state.apps.get_model('myapp', 'Publisher'), state.apps.get_model('myapp', 'Book')
+
+
+def duplicates(queryset, *key):
+    # {kept id: [ids of the other rows with the same key]}; the oldest row of each key is kept
+    groups = queryset.values(*key).annotate(copies=Count('id')).filter(copies__gt=1).order_by(*key)
+    result = {}
+    for group in groups:
+        ids = list(queryset.filter(**{field: group[field] for field in key}).order_by('id')
+                   .values_list('id', flat=True))
+        result[ids[0]] = ids[1:]
+    return result
+
+
+def book_duplicates(queryset, merged_publishers):
+    # duplicates() by (publisher, title), each merged publisher standing for the one it is merged into, so the
+    # books that only collide once their publishers are merged are listed (and merged) too
+    titles = queryset.values('title').annotate(copies=Count('id')).filter(copies__gt=1).values('title')
+    groups = {}
+    for pk, publisher, title in (queryset.filter(title__in=titles).order_by('id')
+                                 .values_list('id', 'publisher', 'title')):
+        groups.setdefault((merged_publishers.get(publisher, publisher), title), []).append(pk)
+    return {ids[0]: ids[1:] for ids in groups.values() if len(ids) > 1}
+
+
+def move_relations(model, db, keep, others):
+    # Points every row that refers to one of `others` at `keep` instead
+    for relation in model._meta.related_objects:
+        if relation.many_to_many:
+            # e.g. Order.books: the link table's column to this model is the field's "reverse" side
+            through = relation.through
+            own = relation.field.m2m_reverse_field_name()
+            other = relation.field.m2m_field_name() + '_id'
+            rows = through.objects.using(db).filter(**{f'{own}__in': others})
+            through.objects.using(db).bulk_create(
+                [through(**{f'{own}_id': keep, other: row}) for row in rows.values_list(other, flat=True)],
+                ignore_conflicts=True)
+            rows.delete()
+        else:
+            relation.related_model.objects.using(db).filter(**{f'{relation.field.name}__in': others}).update(
+                **{relation.field.name: keep})
+
+
+def merge_books(Book, db, keep, others):
+    move_relations(Book, db, keep, others)
+    # The merged books' reviews now belong to the kept one, and so do their counts
+    books = Book.objects.using(db).filter(id__in=[keep] + others)
+    totals = {field: sum(books.values_list(field, flat=True)) for field in COUNTERS}
+    totals['avg_rating'] = totals['rating_sum'] / totals['rating_count'] if totals['rating_count'] else 0
+    Book.objects.using(db).filter(id=keep).update(**totals)
+    Book.objects.using(db).filter(id__in=others).delete()
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+
+from myapp import profiling
+
+
+class Command(BaseCommand):
+    help = 'Shows p50/p95/p99 wall time, query count, query time and template time per view ' \
+           'from the samples recorded by ProfilingMiddleware'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--reset', action='store_true', help='Discard all recorded samples after reporting')
+
+    def handle(self, *args, **options):
+        stats = profiling.summary()
+        if not stats:
+            self.stdout.write('No samples recorded yet.')
+        else:
+            header = f"{'view':<28}{'n':>6}"
+            for metric in profiling.METRICS:
+                header += f"  {metric + ' p50/p95/p99':>30}"
+            self.stdout.write(header)
+            for view_name, view_stats in stats.items():
+                line = f"{view_name:<28}{view_stats['samples']:>6}"
+                for metric in profiling.METRICS:
+                    values = view_stats[metric]
+                    line += f"  {values['p50']:>10.1f}{values['p95']:>10.1f}{values['p99']:>10.1f}"
+                self.stdout.write(line)
+
+        if options['reset']:
+            profiling.reset()
+            self.stdout.write(self.style.SUCCESS('Samples discarded.'))
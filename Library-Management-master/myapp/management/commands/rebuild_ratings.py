@@ -0,0 +1,44 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, Sum
+from django.utils import timezone
+
+from myapp.caching import invalidate_catalogue
+from myapp.models import Book, Review
+
+
+class Command(BaseCommand):
+    help = 'Recomputes the rating aggregates (rating_sum, rating_count, avg_rating) of every book from its reviews'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of books written per bulk UPDATE')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        # One grouped query over Review instead of one query per book
+        totals = Review.objects.order_by().values('book').annotate(total=Sum('rating'), count=Count('id'))
+
+        updated = 0
+        now = timezone.now()
+        with transaction.atomic():
+            # Books whose reviews were all deleted end up back at zero
+            Book.objects.update(rating_sum=0, rating_count=0, avg_rating=0, updated_at=now)
+
+            batch = []
+            for row in totals.iterator(chunk_size=batch_size):
+                batch.append(Book(pk=row['book'], rating_sum=row['total'], rating_count=row['count'],
+                                  avg_rating=row['total'] / row['count'], updated_at=now))
+                if len(batch) >= batch_size:
+                    updated += self.write(batch)
+                    batch = []
+            updated += self.write(batch)
+            invalidate_catalogue()
+
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt rating aggregates for {updated} reviewed books.'))
+
+    @staticmethod
+    def write(batch):
+        if batch:
+            Book.objects.bulk_update(batch, ['rating_sum', 'rating_count', 'avg_rating', 'updated_at'])
+        return len(batch)
@@ -0,0 +1,18 @@
+from django.core.management.base import BaseCommand
+
+from myapp.reports import refresh_reports
+
+
+class Command(BaseCommand):
+    help = 'Folds the orders and reviews added since the last run into the reporting tables behind the staff ' \
+           'dashboard and recomputes the per-category snapshot; schedule it (e.g. every few minutes with cron)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true',
+                            help='Rebuild from the whole history, e.g. after orders or reviews were edited or deleted')
+
+    def handle(self, *args, **options):
+        counts = refresh_reports(full=options['full'])
+        self.stdout.write(self.style.SUCCESS(
+            f"Added {counts['orders']} orders and {counts['reviews']} reviews; "
+            f"{counts['categories']} categories recomputed."))
@@ -0,0 +1,162 @@
+import logging
+import random
+import time
+from contextlib import ExitStack
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.functional import SimpleLazyObject
+
+from . import profiling, routers
+from .models import Member
+
+logger = logging.getLogger(__name__)
+
+
+class ProfilingMiddleware:
+    # Records wall time, query count/time and template render time for a random PROFILING_SAMPLE_RATE share
+    # of requests, keyed by the resolved URL name (e.g. 'myapp:detail'); see `manage.py profile_report`.
+    # The other requests go straight through.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.sample_rate = getattr(settings, 'PROFILING_SAMPLE_RATE', 1.0)
+        # Under ASGI the chain stays async, so async views are not pushed into a thread by this middleware
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+        profiling.install_template_timer()
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if random.random() >= self.sample_rate:
+            return self.get_response(request)
+        timer = profiling.QueryTimer()
+        token = profiling.start_template_timer()
+        start = time.perf_counter()
+        try:
+            with ExitStack() as stack:
+                self.wrap_connections(stack, timer)
+                response = self.get_response(request)
+        finally:
+            template_time = profiling.stop_template_timer(token)
+        wall_time = time.perf_counter() - start
+        return self.record(request, response, timer, wall_time, template_time)
+
+    async def __acall__(self, request):
+        if random.random() >= self.sample_rate:
+            return await self.get_response(request)
+        timer = profiling.QueryTimer()
+        token = profiling.start_template_timer()
+        start = time.perf_counter()
+        # Async ORM queries run in the request's sync thread, so the wrappers are installed (and removed) there
+        stack = ExitStack()
+        try:
+            await sync_to_async(self.wrap_connections)(stack, timer)
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(stack.close)()
+            template_time = profiling.stop_template_timer(token)
+        wall_time = time.perf_counter() - start
+        return await sync_to_async(self.record)(request, response, timer, wall_time, template_time)
+
+    @staticmethod
+    def wrap_connections(stack, timer):
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(timer))
+
+    def record(self, request, response, timer, wall_time, template_time):
+        sample = (wall_time * 1000, timer.count, timer.duration * 1000, template_time * 1000)
+        match = request.resolver_match
+        if match is not None:
+            profiling.record_sample(match.view_name, sample)
+
+        # Views catch their own exceptions, so slow requests are reported here
+        slow_ms = getattr(settings, 'PROFILING_SLOW_REQUEST_MS', None)
+        if slow_ms is not None and sample[0] >= slow_ms:
+            logger.warning("Slow request %s %s: %.1f ms, %d queries in %.1f ms, templates %.1f ms",
+                           request.method, request.path, sample[0], timer.count, sample[2], sample[3])
+
+        if getattr(settings, 'PROFILING_SERVER_TIMING', False):
+            response['Server-Timing'] = (f'total;dur={sample[0]:.1f}, '
+                                         f'db;dur={sample[2]:.1f};desc="{timer.count} queries", '
+                                         f'tpl;dur={sample[3]:.1f}')
+        return response
+
+
+def get_member(request):
+    # The logged-in user's Member row; None for anonymous users and accounts that are not members (e.g. staff)
+    if not request.user.is_authenticated:
+        return None
+    try:
+        return request.user.member
+    except Member.DoesNotExist:
+        return None
+
+
+class MemberMiddleware:
+    # Sets request.member, resolved on first use and then reused for the rest of the request. It is falsy
+    # when there is no member, so test it with `if request.member`, not `is None`.
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        request.member = SimpleLazyObject(lambda: get_member(request))
+        return self.get_response(request)
+
+
+class ReplicaPinningMiddleware:
+    # Read-your-writes for myapp.routers.PrimaryReplicaRouter: requests that write set a signed cookie, and
+    # for REPLICA_PIN_SECONDS afterwards that client's reads go to the primary (as do all reads of POSTs), so
+    # a replica that has not caught up yet cannot hide the order or review they just placed. Goes before
+    # SessionMiddleware, whose reads it routes too.
+    sync_capable = True
+    async_capable = True
+    cookie_name = 'pin_primary'
+
+    def __init__(self, get_response):
+        if not routers.replicas():
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.window = getattr(settings, 'REPLICA_PIN_SECONDS', 5)
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        tokens = routers.begin(self.pinned(request))
+        try:
+            return self.finish(self.get_response(request))
+        finally:
+            routers.end(tokens)
+
+    async def __acall__(self, request):
+        # The async ORM's worker threads run in a copy of this context and hand their changes back
+        tokens = routers.begin(self.pinned(request))
+        try:
+            return self.finish(await self.get_response(request))
+        finally:
+            routers.end(tokens)
+
+    def pinned(self, request):
+        return (request.method not in ('GET', 'HEAD', 'OPTIONS')
+                or request.get_signed_cookie(self.cookie_name, default=None, max_age=self.window) is not None)
+
+    def finish(self, response):
+        # Only a write starts (or extends) the window; reads while pinned do not
+        if routers.has_written():
+            response.set_signed_cookie(self.cookie_name, '1', max_age=self.window, httponly=True, samesite='Lax')
+        return response
+
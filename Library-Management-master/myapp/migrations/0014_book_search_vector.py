@@ -0,0 +1,37 @@
+from django.db import migrations
+
+# PostgreSQL keeps the generated column up to date on every INSERT/UPDATE, including bulk writes
+ADD_SEARCH_VECTOR = """
+ALTER TABLE myapp_book ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+    setweight(to_tsvector('english', coalesce(title, '')), 'A') ||
+    setweight(to_tsvector('english', coalesce(description, '')), 'B')
+) STORED;
+CREATE INDEX myapp_book_search_vector_gin ON myapp_book USING gin (search_vector);
+"""
+
+DROP_SEARCH_VECTOR = """
+DROP INDEX IF EXISTS myapp_book_search_vector_gin;
+ALTER TABLE myapp_book DROP COLUMN IF EXISTS search_vector;
+"""
+
+
+def add_search_vector(apps, schema_editor):
+    # Other databases use the in-memory index in myapp.search instead
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(ADD_SEARCH_VECTOR)
+
+
+def drop_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_SEARCH_VECTOR)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0013_remove_member_image_member_profile_image_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_search_vector, drop_search_vector),
+    ]
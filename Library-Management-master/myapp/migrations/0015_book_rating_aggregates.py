@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:29
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+def backfill_ratings(apps, schema_editor):
+    # Seeds the new aggregates from existing reviews; later changes go through Book.add_rating
+    Book = apps.get_model('myapp', 'Book')
+    Review = apps.get_model('myapp', 'Review')
+    totals = Review.objects.order_by().values('book').annotate(total=Sum('rating'), count=Count('id'))
+    books = [Book(pk=row['book'], rating_sum=row['total'], rating_count=row['count'],
+                  avg_rating=row['total'] / row['count']) for row in totals]
+    Book.objects.bulk_update(books, ['rating_sum', 'rating_count', 'avg_rating'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0014_book_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='avg_rating',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='rating_sum',
+            field=models.PositiveBigIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_ratings, migrations.RunPython.noop),
+    ]
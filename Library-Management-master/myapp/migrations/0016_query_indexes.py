@@ -0,0 +1,40 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:35
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0015_book_rating_aggregates'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='member',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='member', to='myapp.member'),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='book',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='myapp.book'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['category', 'price'], name='book_category_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='book',
+            index=models.Index(fields=['price'], name='book_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='order',
+            index=models.Index(fields=['member', '-order_date', '-id', 'order_type'], name='order_member_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['book', '-date', '-id'], name='review_book_date_idx'),
+        ),
+    ]
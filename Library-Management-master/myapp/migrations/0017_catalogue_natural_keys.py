@@ -0,0 +1,65 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:39
+
+from django.core.management.base import CommandError
+from django.db import migrations, models
+from django.db.models import Count
+import django.db.models.deletion
+
+
+# Duplicate groups named in the error message; the rest are counted
+LISTED = 20
+
+
+def _duplicate_groups(queryset, *key):
+    # (key values, ids) for every key shared by several rows
+    groups = queryset.values(*key).annotate(copies=Count('id')).filter(copies__gt=1).order_by(*key)
+    for group in groups:
+        values = {field: group[field] for field in key}
+        yield values, list(queryset.filter(**values).order_by('id').values_list('id', flat=True))
+
+
+def check_duplicates(apps, schema_editor):
+    # The constraints below cannot be added while rows break them. Merging such rows rewrites catalogue data
+    # (which copy's price and description survive, which book orders and reviews belong to), so it is not done
+    # here: `manage.py merge_duplicates` shows what would change and merges on request.
+    db = schema_editor.connection.alias
+    Publisher = apps.get_model('myapp', 'Publisher')
+    Book = apps.get_model('myapp', 'Book')
+
+    problems = [f"publisher name {values['name']!r}: ids {', '.join(map(str, ids))}"
+                for values, ids in _duplicate_groups(Publisher.objects.using(db), 'name')]
+    problems += [f"book title {values['title']!r} of publisher {values['publisher']}: ids {', '.join(map(str, ids))}"
+                 for values, ids in _duplicate_groups(Book.objects.using(db), 'publisher', 'title')]
+    if problems:
+        listed = problems[:LISTED]
+        if len(problems) > LISTED:
+            listed.append(f'... and {len(problems) - LISTED} more')
+        raise CommandError(
+            'Cannot add the unique publisher name and (publisher, title) constraints; these rows share them:\n  '
+            + '\n  '.join(listed)
+            + '\nReview them with `python manage.py merge_duplicates`, merge or fix them, then migrate again.')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0016_query_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(check_duplicates, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='book',
+            constraint=models.UniqueConstraint(fields=('publisher', 'title'), name='book_publisher_title_uniq'),
+        ),
+        migrations.AddConstraint(
+            model_name='publisher',
+            constraint=models.UniqueConstraint(fields=('name',), name='publisher_name_uniq'),
+        ),
+        # The FK index is dropped once the (publisher, title) constraint covers it
+        migrations.AlterField(
+            model_name='book',
+            name='publisher',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='books', to='myapp.publisher'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:48
+
+from django.db import migrations
+import myapp.models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0017_catalogue_natural_keys'),
+    ]
+
+    operations = [
+        migrations.AlterModelManagers(
+            name='member',
+            managers=[
+                ('objects', myapp.models.MemberManager()),
+            ],
+        ),
+    ]
@@ -0,0 +1,58 @@
+# Generated by Django 4.2.30 on 2026-10-18 15:50
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0019_book_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CategoryStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('category', models.CharField(choices=[('S', 'Science&Tech'), ('F', 'Fiction'), ('B', 'Biography'), ('T', 'Travel'), ('O', 'Other')], max_length=1, unique=True)),
+                ('books', models.PositiveIntegerField(default=0)),
+                ('avg_price', models.DecimalField(decimal_places=2, default=0, max_digits=10)),
+                ('reviews', models.PositiveIntegerField(default=0)),
+                ('avg_rating', models.FloatField(default=0)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DailyOrderStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField()),
+                ('order_type', models.IntegerField(choices=[(0, 'Purchase'), (1, 'Borrow')])),
+                ('orders', models.PositiveIntegerField(default=0)),
+                ('books', models.PositiveIntegerField(default=0)),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='ReportWatermark',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(max_length=20, unique=True)),
+                ('last_id', models.BigIntegerField(default=0)),
+                ('refreshed_at', models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='PublisherReviewStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reviews', models.PositiveIntegerField(default=0)),
+                ('rating_sum', models.PositiveBigIntegerField(default=0)),
+                ('publisher', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='review_stats', to='myapp.publisher')),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name='dailyorderstats',
+            constraint=models.UniqueConstraint(fields=('day', 'order_type'), name='dailyorderstats_day_type_uniq'),
+        ),
+    ]
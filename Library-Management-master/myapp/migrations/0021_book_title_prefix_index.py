@@ -0,0 +1,31 @@
+from django.db import migrations
+
+# Book autocomplete filters with title__istartswith. On PostgreSQL that is UPPER(title::text) LIKE 'X%',
+# which only a pattern_ops index on the same expression can answer; SQLite's case-insensitive LIKE uses an
+# index in the NOCASE collation. Neither can be declared portably in Meta.indexes.
+CREATE_INDEX = {
+    'postgresql': 'CREATE INDEX book_title_prefix_idx ON myapp_book (UPPER(title::text) text_pattern_ops);',
+    'sqlite': 'CREATE INDEX book_title_prefix_idx ON myapp_book (title COLLATE NOCASE);',
+}
+
+
+def add_title_index(apps, schema_editor):
+    sql = CREATE_INDEX.get(schema_editor.connection.vendor)
+    if sql:
+        schema_editor.execute(sql)
+
+
+def drop_title_index(apps, schema_editor):
+    if schema_editor.connection.vendor in CREATE_INDEX:
+        schema_editor.execute('DROP INDEX IF EXISTS book_title_prefix_idx;')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0020_reporting_tables'),
+    ]
+
+    operations = [
+        migrations.RunPython(add_title_index, drop_title_index),
+    ]
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+# SQLite cannot add a column in place, so 0022 rebuilt myapp_book and lost the raw-SQL index from 0021, which
+# the schema editor does not know about. Any later migration that rebuilds the table on SQLite must restore
+# it the same way. PostgreSQL altered the table in place and still has it.
+CREATE_INDEX = 'CREATE INDEX IF NOT EXISTS book_title_prefix_idx ON myapp_book (title COLLATE NOCASE);'
+
+
+def restore_title_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'sqlite':
+        schema_editor.execute(CREATE_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0022_updated_at'),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_title_index, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.30 on 2026-10-18 16:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('myapp', '0023_restore_book_title_prefix_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='reportwatermark',
+            name='pending_ids',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -1,6 +1,8 @@
-from django.contrib.auth.models import User
+from django.contrib.auth.models import User, UserManager
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db import models
+from django.db import connections, models
+from django.db.models import F
+from django.db.models.functions import Cast
 from django.utils import timezone
 
 
@@ -11,11 +13,29 @@ class Publisher(models.Model):
     website = models.URLField()
     city = models.CharField(max_length=20, blank=True)
     country = models.CharField(max_length=20, blank=False, default='USA')
+    # Last change, for the Last-Modified/ETag of the pages showing it; queryset.update() must set it itself
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            # Natural key used by import_catalogue to upsert publishers
+            models.UniqueConstraint(fields=['name'], name='publisher_name_uniq'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class BookQuerySet(models.QuerySet):
+    def with_publisher(self):
+        # Joins the publisher so that {{ book.publisher }} costs no extra query
+        return self.select_related('publisher')
+
+    def for_listing(self):
+        # Only what book lists show: the title and the id for the link
+        return self.only('id', 'title')
+
+
 class Book(models.Model):
     # Book details: title, category, pages, price, publisher, description, reviews count
     CATEGORY_CHOICES = [
@@ -30,13 +50,68 @@ class Book(models.Model):
     num_pages = models.PositiveIntegerField(default=100)
     price = models.DecimalField(max_digits=10, decimal_places=2,
                                 validators=[MinValueValidator(0), MaxValueValidator(1000)])
-    publisher = models.ForeignKey(Publisher, related_name='books', on_delete=models.CASCADE)
+    # Indexed by book_publisher_title_uniq, which starts with publisher
+    publisher = models.ForeignKey(Publisher, related_name='books', on_delete=models.CASCADE, db_index=False)
     description = models.TextField(blank=True)
     num_reviews = models.PositiveIntegerField(default=0)
+    # Rating aggregates kept in step with Review so pages don't have to average every review
+    rating_sum = models.PositiveBigIntegerField(default=0)
+    rating_count = models.PositiveIntegerField(default=0)
+    avg_rating = models.FloatField(default=0)
+    # Also set by add_reviews() and the bulk updates in admin, rebuild_ratings and import_catalogue
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    objects = BookQuerySet.as_manager()
+
+    class Meta:
+        # book_title_prefix_idx (the autocomplete's title prefix lookups) is created with raw SQL in 0021; on
+        # SQLite, migrations that rebuild this table must recreate it, as 0023 does
+        indexes = [
+            # findbooks: WHERE category = %s AND price <= %s (the id ordering is applied to the few matches)
+            models.Index(fields=['category', 'price'], name='book_category_price_idx'),
+            # findbooks without a category: WHERE price <= %s
+            models.Index(fields=['price'], name='book_price_idx'),
+        ]
+        constraints = [
+            # Natural key used by import_catalogue to upsert books
+            models.UniqueConstraint(fields=['publisher', 'title'], name='book_publisher_title_uniq'),
+        ]
 
     def __str__(self):
         return self.title
 
+    @staticmethod
+    def add_reviews(book_id, count, rating_total):
+        # Folds `count` new reviews adding up to `rating_total` stars into the counters in a single
+        # UPDATE; the right-hand side sees the row's current values, so concurrent reviews cannot
+        # overwrite each other and no other column is rewritten
+        return Book.objects.filter(pk=book_id).update(
+            num_reviews=F('num_reviews') + count,
+            rating_sum=F('rating_sum') + rating_total,
+            rating_count=F('rating_count') + count,
+            avg_rating=Cast(F('rating_sum') + rating_total, models.FloatField()) / (F('rating_count') + count),
+            updated_at=timezone.now(),
+        )
+
+
+class MemberQuerySet(models.QuerySet):
+    def with_borrowed_titles(self):
+        # Adds borrowed_count and the borrowed titles for all members at once. PostgreSQL aggregates the
+        # titles in the same query; other databases get them from one prefetch query for all the members.
+        queryset = self.annotate(borrowed_count=models.Count('borrowed_books'))
+        if connections[self.db].vendor == 'postgresql':
+            # Imported here: django.contrib.postgres.aggregates needs psycopg
+            from django.contrib.postgres.aggregates import StringAgg
+            return queryset.annotate(borrowed_titles=StringAgg('borrowed_books__title', ', ',
+                                                               ordering='borrowed_books__title'))
+        return queryset.prefetch_related(
+            models.Prefetch('borrowed_books', queryset=Book.objects.only('id', 'title')))
+
+
+class MemberManager(UserManager.from_queryset(MemberQuerySet)):
+    # Keeps create_user() and friends from User's manager
+    pass
+
 
 class Member(User):
     # Extending Django's default User model with additional fields for library members
@@ -54,30 +129,65 @@ class Member(User):
     borrowed_books = models.ManyToManyField(Book, blank=True)
     profile_image = models.ImageField(upload_to='profile_image/', blank=True)
 
+    objects = MemberManager()
+
     def __str__(self):
         return self.username
 
     def books_title(self):
-        title = ""
-        for book in self.borrowed_books.all():
-            title = title + book.title + ", "
-        return title[:-2]
+        # Uses the titles from MemberQuerySet.with_borrowed_titles() when the member was loaded with them
+        if hasattr(self, 'borrowed_titles'):
+            return self.borrowed_titles or ''
+        return ', '.join(sorted(book.title for book in self.borrowed_books.all()))
+
+
+class OrderQuerySet(models.QuerySet):
+    def with_books(self):
+        # Loads the books (id and title only) of every order in one extra query instead of one per order
+        return self.prefetch_related(models.Prefetch('books', queryset=Book.objects.only('id', 'title').order_by('id')))
+
+    def with_book_count(self):
+        # Counts each order's books in the same query as the orders
+        return self.annotate(book_count=models.Count('books'))
+
+    def history(self, member):
+        # A member's orders ready for display; paginate by ('-order_date', '-id')
+        return self.filter(member=member).with_books()
 
 
 class Order(models.Model):
     # Order details: books, member, order type, order date
+    PURCHASE = 0
+    BORROW = 1
     ORDER_TYPE_CHOICES = [
-        (0, 'Purchase'),
-        (1, 'Borrow')
+        (PURCHASE, 'Purchase'),
+        (BORROW, 'Borrow')
     ]
     books = models.ManyToManyField(Book)
-    member = models.ForeignKey(Member, related_name='member', on_delete=models.CASCADE)
+    # Lookups by member use the leading column of order_member_date_idx
+    member = models.ForeignKey(Member, related_name='member', on_delete=models.CASCADE, db_index=False)
     order_type = models.IntegerField(choices=ORDER_TYPE_CHOICES, default=1)
     order_date = models.DateField(default=timezone.now)
 
+    objects = OrderQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # my_orders: WHERE member_id = %s ORDER BY order_date DESC, id DESC; order_type makes the
+            # index covering, so an order history page is read from the index alone
+            models.Index(fields=['member', '-order_date', '-id', 'order_type'], name='order_member_date_idx'),
+        ]
+
     def total_items(self):
+        # Uses the with_book_count() annotation when present
+        if hasattr(self, 'book_count'):
+            return self.book_count
         return self.books.count()
 
+    def book_titles(self):
+        # Comma-separated titles; served from the with_books() prefetch when present
+        return ', '.join(book.title for book in self.books.all())
+
     def __str__(self):
         return self.member.username + " " + str(self.order_date)
 
@@ -85,10 +195,130 @@ class Order(models.Model):
 class Review(models.Model):
     # Review details: reviewer email, book, rating, comments, review date
     reviewer = models.EmailField()
-    book = models.ForeignKey(Book, on_delete=models.CASCADE)
+    # Lookups by book use the leading column of review_book_date_idx, so the foreign key needs no index of its own
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, db_index=False)
     rating = models.PositiveIntegerField()
     comments = models.TextField(blank=True)
     date = models.DateField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            # DetailView: WHERE book_id = %s ORDER BY date DESC, id DESC LIMIT n
+            models.Index(fields=['book', '-date', '-id'], name='review_book_date_idx'),
+        ]
 
     def __str__(self):
         return self.reviewer + " for " + self.book.title + " : " + str(self.rating) + " stars"
+
+
+class BookRecommendationQuerySet(models.QuerySet):
+    def for_book(self, book_id):
+        # The precomputed list for one book, best first, with just what the detail page links to
+        return (self.filter(book_id=book_id).select_related('recommended')
+                .only('recommended__id', 'recommended__title').order_by('rank'))
+
+
+class BookRecommendation(models.Model):
+    # "Members also borrowed": books most often in the same orders as `book`, rebuilt offline by
+    # `manage.py compute_recommendations`
+    # Lookups by book use the leading column of bookrec_book_rank_uniq
+    book = models.ForeignKey(Book, related_name='recommendations', on_delete=models.CASCADE, db_index=False)
+    recommended = models.ForeignKey(Book, related_name='+', on_delete=models.CASCADE)
+    rank = models.PositiveSmallIntegerField()
+    score = models.FloatField()
+
+    objects = BookRecommendationQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            # DetailView: WHERE book_id = %s ORDER BY rank
+            models.UniqueConstraint(fields=['book', 'rank'], name='bookrec_book_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.book_id} -> {self.recommended_id} (#{self.rank})'
+
+
+class TopRatedBookQuerySet(models.QuerySet):
+    def for_category(self, category, exclude_book_id=None):
+        queryset = (self.filter(category=category).select_related('book')
+                    .only('book__id', 'book__title').order_by('rank'))
+        if exclude_book_id is not None:
+            queryset = queryset.exclude(book_id=exclude_book_id)
+        return queryset
+
+
+class TopRatedBook(models.Model):
+    # Best rated books of each category, rebuilt together with the recommendations
+    category = models.CharField(max_length=1, choices=Book.CATEGORY_CHOICES)
+    rank = models.PositiveSmallIntegerField()
+    book = models.ForeignKey(Book, related_name='+', on_delete=models.CASCADE)
+    score = models.FloatField()
+
+    objects = TopRatedBookQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['category', 'rank'], name='toprated_category_rank_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.category} #{self.rank}: {self.book_id}'
+
+
+# Reporting tables for the staff dashboard, maintained by `manage.py refresh_reports` (see myapp/reports.py)
+
+class ReportWatermark(models.Model):
+    # Highest id of a source table (orders, reviews) already folded into the report tables, and the ids below
+    # it that were not committed yet at the last refresh, as [first, last] ranges
+    source = models.CharField(max_length=20, unique=True)
+    last_id = models.BigIntegerField(default=0)
+    pending_ids = models.JSONField(default=list, blank=True)
+    refreshed_at = models.DateTimeField(null=True, blank=True)
+
+    def __str__(self):
+        return f'{self.source} up to {self.last_id}'
+
+
+class DailyOrderStats(models.Model):
+    # Orders, order lines and revenue (prices at refresh time; purchases only) per day and order type
+    day = models.DateField()
+    order_type = models.IntegerField(choices=Order.ORDER_TYPE_CHOICES)
+    orders = models.PositiveIntegerField(default=0)
+    books = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['day', 'order_type'], name='dailyorderstats_day_type_uniq'),
+        ]
+
+    def __str__(self):
+        return f'{self.day} {self.get_order_type_display()}: {self.orders}'
+
+
+class CategoryStats(models.Model):
+    # Snapshot of the catalogue per category
+    category = models.CharField(max_length=1, choices=Book.CATEGORY_CHOICES, unique=True)
+    books = models.PositiveIntegerField(default=0)
+    avg_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    reviews = models.PositiveIntegerField(default=0)
+    avg_rating = models.FloatField(default=0)
+
+    def __str__(self):
+        return self.get_category_display()
+
+
+class PublisherReviewStats(models.Model):
+    # Review count and rating total of each publisher's books
+    publisher = models.OneToOneField(Publisher, related_name='review_stats', on_delete=models.CASCADE)
+    reviews = models.PositiveIntegerField(default=0)
+    rating_sum = models.PositiveBigIntegerField(default=0)
+
+    def __str__(self):
+        return f'{self.publisher_id}: {self.reviews} reviews'
+
+    @property
+    def avg_rating(self):
+        return self.rating_sum / self.reviews if self.reviews else 0
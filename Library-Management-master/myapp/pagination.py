@@ -0,0 +1,118 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import ValidationError
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 10
+
+
+def encode_cursor(values):
+    # Opaque, URL-safe token holding the ordering values of the last row on a page
+    data = json.dumps(values, cls=DjangoJSONEncoder, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(data).decode().rstrip('=')
+
+
+def decode_cursor(token):
+    # Returns the list of values stored in the token, or None if it is missing or malformed
+    if not token:
+        return None
+    try:
+        data = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+        values = json.loads(data)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        return None
+    return values if isinstance(values, list) else None
+
+
+def _ordering_field(queryset, name):
+    # The model field, or the output field of an annotation such as a search rank
+    if name in queryset.query.annotations:
+        return queryset.query.annotations[name].output_field
+    return queryset.model._meta.get_field(name)
+
+
+def cursor_values(queryset, ordering, cursor):
+    # The cursor's values converted (and validated) by the fields of `ordering`, or None when the token is missing,
+    # malformed or does not fit the ordering, e.g. a tampered ["x"] for an id; callers then serve the first page
+    values = decode_cursor(cursor)
+    if values is None or len(values) != len(ordering):
+        return None
+    try:
+        values = [_ordering_field(queryset, field.lstrip('-')).clean(value, None)
+                  for field, value in zip(ordering, values)]
+    except (ValidationError, TypeError, ValueError):
+        return None
+    # Ordering fields are never null, and a None value cannot be compared with. SQLite's backend reports no
+    # integer range to validate against, so ids beyond 64 bits are refused here rather than by the driver.
+    if any(value is None or (isinstance(value, int) and not -2 ** 63 <= value < 2 ** 63) for value in values):
+        return None
+    return values
+
+
+def keyset_filter(ordering, values):
+    # Rows strictly after `values` in `ordering`, e.g. ('-rank', 'id') gives
+    # rank < r OR (rank = r AND id > i), which the database answers with an index seek
+    condition = Q()
+    for position, field in enumerate(ordering):
+        name = field.lstrip('-')
+        lookup = 'lt' if field.startswith('-') else 'gt'
+        step = Q(**{'%s__%s' % (name, lookup): values[position]})
+        for previous, value in zip(ordering[:position], values):
+            step &= Q(**{previous.lstrip('-'): value})
+        condition |= step
+    return condition
+
+
+class KeysetPage:
+    def __init__(self, object_list, next_cursor):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __bool__(self):
+        return bool(self.object_list)
+
+
+def _page_queryset(queryset, ordering, cursor, page_size):
+    # The page after the cursor, plus one row to know whether another page follows.
+    # The last ordering field must be unique so that every row has exactly one position.
+    queryset = queryset.order_by(*ordering)
+    values = cursor_values(queryset, ordering, cursor)
+    if values is not None:
+        queryset = queryset.filter(keyset_filter(ordering, values))
+    return queryset[:page_size + 1]
+
+
+def keyset_page(object_list, ordering, page_size):
+    # Page from rows already in `ordering`: up to page_size + 1 of them, the extra one only telling that
+    # another page follows
+    next_cursor = None
+    if len(object_list) > page_size:
+        object_list = object_list[:page_size]
+        last = object_list[-1]
+        # Rows of a .values() queryset are dicts
+        value = last.get if isinstance(last, dict) else lambda name: getattr(last, name)
+        next_cursor = encode_cursor([value(field.lstrip('-')) for field in ordering])
+    return KeysetPage(object_list, next_cursor)
+
+
+def paginate(queryset, ordering, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    # Fetches one page of `queryset` in `ordering` after the cursor
+    return keyset_page(list(_page_queryset(queryset, ordering, cursor, page_size)), ordering, page_size)
+
+
+async def apaginate(queryset, ordering, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    # paginate() for async views
+    return keyset_page([obj async for obj in _page_queryset(queryset, ordering, cursor, page_size)], ordering, page_size)
@@ -0,0 +1,171 @@
+import atexit
+import contextvars
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+# Per-request accumulator for template render time, set by ProfilingMiddleware
+_template_time = contextvars.ContextVar('template_time', default=None)
+_template_timer_installed = False
+
+# Stored in the same order in every sample
+METRICS = ('wall_ms', 'queries', 'db_ms', 'template_ms')
+
+
+class QueryTimer:
+    # Database execute wrapper counting queries and the time spent in them
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+def install_template_timer():
+    # Wraps the Django template backend so that every top-level render adds to the current request's total
+    global _template_timer_installed
+    if _template_timer_installed:
+        return
+    from django.template.backends.django import Template
+
+    original_render = Template.render
+
+    def render(self, context=None, request=None):
+        start = time.perf_counter()
+        try:
+            return original_render(self, context, request)
+        finally:
+            total = _template_time.get()
+            if total is not None:
+                total[0] += time.perf_counter() - start
+
+    Template.render = render
+    _template_timer_installed = True
+
+
+def start_template_timer():
+    return _template_time.set([0.0])
+
+
+def stop_template_timer(token):
+    total = _template_time.get()
+    _template_time.reset(token)
+    return total[0]
+
+
+def _cache():
+    return caches[getattr(settings, 'PROFILING_CACHE', 'default')]
+
+
+def _counter_key(view_name):
+    return f'profiling:{view_name}:batches'
+
+
+def _batch_key(view_name, slot):
+    return f'profiling:{view_name}:{slot}'
+
+
+def _slots():
+    # Batches kept per view: enough full batches for PROFILING_WINDOW samples
+    window = getattr(settings, 'PROFILING_WINDOW', 1000)
+    return max(1, math.ceil(window / getattr(settings, 'PROFILING_BATCH_SIZE', 50)))
+
+
+# Samples of this process not yet written to the cache: {view_name: (monotonic time of the first, [samples])}
+_buffer = {}
+_buffer_lock = threading.Lock()
+
+
+def record_sample(view_name, sample):
+    # Buffers one sample in memory. A view's buffer is written to the cache as one batch when it holds
+    # PROFILING_BATCH_SIZE samples or its oldest sample is PROFILING_FLUSH_SECONDS old, so most requests
+    # do no cache I/O at all.
+    now = time.monotonic()
+    with _buffer_lock:
+        first, samples = _buffer.setdefault(view_name, (now, []))
+        samples.append(sample)
+        if (len(samples) < getattr(settings, 'PROFILING_BATCH_SIZE', 50)
+                and now - first < getattr(settings, 'PROFILING_FLUSH_SECONDS', 10)):
+            return
+        del _buffer[view_name]
+    _write_batch(view_name, samples)
+
+
+def flush():
+    # Writes every buffered sample to the cache (also done when the process exits)
+    with _buffer_lock:
+        pending = {view_name: samples for view_name, (first, samples) in _buffer.items()}
+        _buffer.clear()
+    for view_name, samples in pending.items():
+        _write_batch(view_name, samples)
+
+
+atexit.register(flush)
+
+
+def _write_batch(view_name, samples):
+    # Each batch gets its own key in a ring of _slots() keys per view, numbered by a counter, so processes
+    # flushing at the same time write different keys instead of rewriting one shared list. incr() is atomic
+    # on Redis and Memcached; on the file cache two processes may rarely draw the same number, and one of
+    # the two batches is then lost.
+    cache = _cache()
+    counter = _counter_key(view_name)
+    cache.add(counter, 0, None)
+    try:
+        number = cache.incr(counter)
+    except ValueError:
+        # Removed by reset() in between
+        return
+    cache.set(_batch_key(view_name, number % _slots()), samples, None)
+
+    views = cache.get('profiling:views', set())
+    if view_name not in views:
+        views.add(view_name)
+        cache.set('profiling:views', views, None)
+
+
+def _samples(cache, view_name):
+    batches = cache.get_many([_batch_key(view_name, slot) for slot in range(_slots())])
+    return [sample for batch in batches.values() for sample in batch]
+
+
+def percentile(sorted_values, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return 0
+    rank = math.ceil(fraction * len(sorted_values))
+    return sorted_values[max(rank, 1) - 1]
+
+
+def summary():
+    # {view_name: {'samples': n, metric: {'p50': .., 'p95': .., 'p99': ..}}} for every recorded view
+    cache = _cache()
+    result = {}
+    for view_name in sorted(cache.get('profiling:views', set())):
+        samples = _samples(cache, view_name)
+        if not samples:
+            continue
+        stats = {'samples': len(samples)}
+        for position, metric in enumerate(METRICS):
+            values = sorted(sample[position] for sample in samples)
+            stats[metric] = {name: percentile(values, fraction)
+                             for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99))}
+        result[view_name] = stats
+    return result
+
+
+def reset():
+    cache = _cache()
+    for view_name in cache.get('profiling:views', set()):
+        cache.delete_many([_counter_key(view_name)] + [_batch_key(view_name, slot) for slot in range(_slots())])
+    cache.delete('profiling:views')
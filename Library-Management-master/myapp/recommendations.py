@@ -0,0 +1,139 @@
+from django.db import transaction
+
+from .caching import invalidate_catalogue
+from .models import Book, BookRecommendation, Order, TopRatedBook
+
+# NumPy and SciPy are only needed by the offline job (`manage.py compute_recommendations`), so they are
+# imported inside the functions that use them
+
+RECOMMENDATIONS_PER_BOOK = 10
+TOP_RATED_PER_CATEGORY = 10
+
+# Order lines held in memory at once; each block is turned into a sparse matrix and folded into the totals
+BLOCK_LINES = 500000
+
+# Ratings are shrunk towards the overall mean as if every book had this many extra average reviews,
+# so a single 5-star review does not top a category
+PRIOR_REVIEWS = 5
+
+WRITE_BATCH_SIZE = 5000
+
+
+def order_line_blocks(block_lines=BLOCK_LINES):
+    # Yields (order ids, book ids) arrays of whole orders, about `block_lines` lines each, streamed in order
+    # id order so an order is never split between two blocks
+    import numpy as np
+
+    lines = Order.books.through.objects.order_by('order_id', 'book_id').values_list('order_id', 'book_id')
+    orders, books = [], []
+    for order_id, book_id in lines.iterator(chunk_size=10000):
+        if len(orders) >= block_lines and order_id != orders[-1]:
+            yield np.array(orders, dtype=np.int64), np.array(books, dtype=np.int64)
+            orders, books = [], []
+        orders.append(order_id)
+        books.append(book_id)
+    if orders:
+        yield np.array(orders, dtype=np.int64), np.array(books, dtype=np.int64)
+
+
+def co_occurrence(blocks, size):
+    # Book x book matrix counting the orders that contain both books (the diagonal counts each book's
+    # orders), summed block by block: for an orders x books 0/1 matrix A it is A.T @ A
+    import numpy as np
+    from scipy import sparse
+
+    counts = sparse.csr_matrix((size, size), dtype=np.int32)
+    for orders, books in blocks:
+        rows = np.unique(orders, return_inverse=True)[1]
+        lines = sparse.csr_matrix((np.ones(len(books), dtype=np.int32), (rows, books)),
+                                  shape=(rows.max() + 1, size))
+        counts = counts + (lines.T @ lines).tocsr()
+    return counts
+
+
+def top_per_group(groups, scores, limit):
+    # Positions of the `limit` best scores of every group, and their 1-based rank within it
+    import numpy as np
+
+    order = np.lexsort((-scores, groups))
+    sorted_groups = groups[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_groups, sorted_groups, side='left')
+    keep = rank < limit
+    return order[keep], rank[keep] + 1
+
+
+def recommendation_rows(counts, per_book=RECOMMENDATIONS_PER_BOOK, min_support=1):
+    # (book ids, recommended ids, ranks, scores): for every book the books sharing the most orders with it,
+    # scored by cosine similarity count(a, b) / sqrt(count(a) * count(b)) so best-sellers do not dominate
+    import numpy as np
+
+    totals = counts.diagonal().astype(np.float64)
+    pairs = counts.tocoo()
+    keep = (pairs.row != pairs.col) & (pairs.data >= min_support)
+    books, recommended, together = pairs.row[keep], pairs.col[keep], pairs.data[keep]
+    scores = together / np.sqrt(totals[books] * totals[recommended])
+    positions, ranks = top_per_group(books, scores, per_book)
+    return books[positions], recommended[positions], ranks, scores[positions]
+
+
+def top_rated_rows(per_category=TOP_RATED_PER_CATEGORY, prior_reviews=PRIOR_REVIEWS):
+    # (categories, book ids, ranks, scores) of the best rated reviewed books of every category, from the
+    # rating counters kept on Book
+    import numpy as np
+
+    rated = Book.objects.filter(rating_count__gt=0).values_list('id', 'category', 'rating_sum', 'rating_count')
+    ids, categories, sums, counts = [], [], [], []
+    for book_id, category, rating_sum, rating_count in rated.iterator(chunk_size=10000):
+        ids.append(book_id)
+        categories.append(category)
+        sums.append(rating_sum)
+        counts.append(rating_count)
+    if not ids:
+        return [], [], [], []
+
+    sums = np.array(sums, dtype=np.float64)
+    counts = np.array(counts, dtype=np.float64)
+    mean = sums.sum() / counts.sum()
+    scores = (sums + prior_reviews * mean) / (counts + prior_reviews)
+    labels, groups = np.unique(np.array(categories), return_inverse=True)
+    positions, ranks = top_per_group(groups, scores, per_category)
+    return labels[groups[positions]], np.array(ids, dtype=np.int64)[positions], ranks, scores[positions]
+
+
+def _batches(objs, size=WRITE_BATCH_SIZE):
+    batch = []
+    for obj in objs:
+        batch.append(obj)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def compute_recommendations(per_book=RECOMMENDATIONS_PER_BOOK, per_category=TOP_RATED_PER_CATEGORY,
+                            block_lines=BLOCK_LINES, min_support=1):
+    # Rebuilds both tables; readers keep seeing the old lists until the transaction commits
+    last_book = Book.objects.order_by('-id').values_list('id', flat=True).first()
+    if last_book is None:
+        recommendations = ([], [], [], [])
+    else:
+        counts = co_occurrence(order_line_blocks(block_lines), last_book + 1)
+        recommendations = recommendation_rows(counts, per_book, min_support)
+    top_rated = top_rated_rows(per_category)
+
+    with transaction.atomic():
+        BookRecommendation.objects.all().delete()
+        for batch in _batches(BookRecommendation(book_id=int(book), recommended_id=int(recommended), rank=int(rank),
+                                                 score=float(score))
+                              for book, recommended, rank, score in zip(*recommendations)):
+            BookRecommendation.objects.bulk_create(batch)
+
+        TopRatedBook.objects.all().delete()
+        TopRatedBook.objects.bulk_create(
+            [TopRatedBook(category=str(category), book_id=int(book), rank=int(rank), score=float(score))
+             for category, book, rank, score in zip(*top_rated)], batch_size=WRITE_BATCH_SIZE)
+        # Every cached detail page shows the lists
+        invalidate_catalogue()
+
+    return {'recommendations': len(recommendations[0]), 'top_rated': len(top_rated[0])}
@@ -0,0 +1,164 @@
+from django.db import transaction
+from django.db.models import Avg, Count, F, Q, Sum
+from django.utils import timezone
+
+from .models import (Book, CategoryStats, DailyOrderStats, Order, PublisherReviewStats, ReportWatermark,
+                     Review)
+
+ORDERS = 'orders'
+REVIEWS = 'reviews'
+
+# Orders and reviews are folded in by id, from just above the source's watermark up to the newest row, so each
+# refresh only reads what was added since the last one. Rows changed or deleted after being counted stay
+# counted until a full rebuild (`refresh_reports --full`).
+#
+# An id is taken when the row is inserted but the row only becomes visible when its transaction commits, so a
+# refresh can see order 12 before order 11. Ids under the newest one that are not visible yet are kept on the
+# watermark (pending_ids, as [first, last] ranges so a deleted or rolled back block costs one entry) and folded
+# in by a later refresh once they show up. Ids more than PENDING_WINDOW below the newest are given up on, as
+# their transactions rolled back or the rows were deleted, and so are all but the newest MAX_PENDING_RANGES gaps.
+PENDING_WINDOW = 10000
+MAX_PENDING_RANGES = 100
+
+
+def _ranges(ids):
+    # Sorted ids as [first, last] runs of consecutive ids
+    ranges = []
+    for pk in ids:
+        if ranges and ranges[-1][1] == pk - 1:
+            ranges[-1][1] = pk
+        else:
+            ranges.append([pk, pk])
+    return ranges
+
+
+def _in_ranges(ranges, field):
+    rows = Q()
+    for first, last in ranges:
+        rows |= Q(**{f'{field}__range': (first, last)})
+    return rows
+
+
+def _pending(watermark, lowest):
+    # The watermark's pending ranges from `lowest` up; single ids are what earlier versions stored
+    ranges = [pk if isinstance(pk, list) else [pk, pk] for pk in watermark.pending_ids]
+    return [[max(first, lowest), last] for first, last in ranges if last >= lowest]
+
+
+def _watermark(source):
+    # Locked until the refresh commits, so two concurrent refreshes cannot count the same rows twice
+    ReportWatermark.objects.get_or_create(source=source)
+    return ReportWatermark.objects.select_for_update().get(source=source)
+
+
+def _newest_id(model):
+    return model.objects.order_by('-id').values_list('id', flat=True).first() or 0
+
+
+def _advance(model, watermark):
+    # Moves the watermark to the newest row and returns a function building the filter (on `prefix` + 'id')
+    # for the rows to fold in now, or None when there are none. Rows committed after this snapshot are left
+    # out by that filter and pending on the watermark instead, so every row is counted exactly once.
+    newest = _newest_id(model)
+    last_id = watermark.last_id
+    pending = _pending(watermark, newest - PENDING_WINDOW + 1)
+    if newest <= last_id and not pending:
+        watermark.pending_ids = pending
+        return None
+
+    first = max(last_id, newest - PENDING_WINDOW) + 1
+    new = set(model.objects.filter(id__gte=first, id__lte=newest).values_list('id', flat=True))
+    missing = _ranges(pk for pk in range(first, newest + 1) if pk not in new)
+    visible = set(model.objects.filter(_in_ranges(pending, 'id')).values_list('id', flat=True)) if pending else set()
+    pending_ids = [pk for low, high in pending for pk in range(low, high + 1)]
+    found = _ranges(pk for pk in pending_ids if pk in visible)
+    watermark.pending_ids = (_ranges(pk for pk in pending_ids if pk not in visible) + missing)[-MAX_PENDING_RANGES:]
+    watermark.last_id = max(newest, last_id)
+
+    def condition(prefix=''):
+        rows = Q(**{f'{prefix}id__gt': last_id, f'{prefix}id__lte': newest})
+        if missing:
+            rows &= ~_in_ranges(missing, f'{prefix}id')
+        if found:
+            rows |= _in_ranges(found, f'{prefix}id')
+        return rows
+    return condition
+
+
+def _add(model, lookup, totals):
+    # Adds `totals` to the row matching `lookup`, creating the row the first time
+    updated = model.objects.filter(**lookup).update(**{field: F(field) + value for field, value in totals.items()})
+    if not updated:
+        model.objects.create(**lookup, **totals)
+
+
+def refresh_orders(watermark):
+    # Daily order counts, order lines and purchase revenue of the orders added since the watermark
+    condition = _advance(Order, watermark)
+    if condition is None:
+        return 0
+
+    days = {}
+    orders = Order.objects.filter(condition()).order_by().values('order_date', 'order_type').annotate(count=Count('id'))
+    for row in orders:
+        days[row['order_date'], row['order_type']] = {'orders': row['count'], 'books': 0, 'revenue': 0}
+    lines = (Order.books.through.objects.filter(condition('order__'))
+             .order_by().values('order__order_date', 'order__order_type')
+             .annotate(count=Count('id'), revenue=Sum('book__price', filter=Q(order__order_type=Order.PURCHASE))))
+    for row in lines:
+        totals = days.setdefault((row['order__order_date'], row['order__order_type']),
+                                 {'orders': 0, 'books': 0, 'revenue': 0})
+        totals['books'] = row['count']
+        totals['revenue'] = row['revenue'] or 0
+
+    for (day, order_type), totals in days.items():
+        _add(DailyOrderStats, {'day': day, 'order_type': order_type}, totals)
+    return sum(totals['orders'] for totals in days.values())
+
+
+def refresh_reviews(watermark):
+    # Per-publisher review counts and rating totals of the reviews added since the watermark
+    condition = _advance(Review, watermark)
+    if condition is None:
+        return 0
+    reviews = (Review.objects.filter(condition()).order_by()
+               .values('book__publisher').annotate(count=Count('id'), rating_sum=Sum('rating')))
+    added = 0
+    for row in reviews:
+        _add(PublisherReviewStats, {'publisher_id': row['book__publisher']},
+             {'reviews': row['count'], 'rating_sum': row['rating_sum']})
+        added += row['count']
+    return added
+
+
+def refresh_categories():
+    # The catalogue changes in place, so the per-category snapshot is recomputed with one grouped query
+    rows = (Book.objects.order_by().values('category')
+            .annotate(books=Count('id'), avg_price=Avg('price'), reviews=Sum('rating_count'),
+                      rating_sum=Sum('rating_sum')))
+    CategoryStats.objects.all().delete()
+    CategoryStats.objects.bulk_create([
+        CategoryStats(category=row['category'], books=row['books'], avg_price=round(row['avg_price'], 2),
+                      reviews=row['reviews'], avg_rating=row['rating_sum'] / row['reviews'] if row['reviews'] else 0)
+        for row in rows])
+    return len(rows)
+
+
+def refresh_reports(full=False):
+    # Brings every report table up to date; with full=True they are rebuilt from the whole history
+    with transaction.atomic():
+        orders_mark, reviews_mark = _watermark(ORDERS), _watermark(REVIEWS)
+        if full:
+            DailyOrderStats.objects.all().delete()
+            PublisherReviewStats.objects.all().delete()
+            for watermark in (orders_mark, reviews_mark):
+                watermark.last_id = 0
+                watermark.pending_ids = []
+
+        counts = {'orders': refresh_orders(orders_mark), 'reviews': refresh_reviews(reviews_mark),
+                  'categories': refresh_categories()}
+        now = timezone.now()
+        for watermark in (orders_mark, reviews_mark):
+            watermark.refreshed_at = now
+            watermark.save()
+    return counts
@@ -0,0 +1,72 @@
+import random
+from contextvars import ContextVar
+
+from django.conf import settings
+
+PRIMARY = 'default'
+
+# Apps always read from the primary: a session written at login must be readable on the very next request
+PRIMARY_APPS = {'sessions'}
+
+# Set by ReplicaPinningMiddleware when the request uses an unsafe method or the client wrote within
+# REPLICA_PIN_SECONDS; _wrote is set by the first write of the request (or management command)
+_pinned = ContextVar('myapp_pinned_to_primary', default=False)
+_wrote = ContextVar('myapp_wrote_to_primary', default=False)
+
+
+def begin(pinned):
+    # Starts the routing state of a request; hand the result to end() when it is done
+    return _pinned.set(pinned), _wrote.set(False)
+
+
+def end(tokens):
+    pinned_token, wrote_token = tokens
+    _pinned.reset(pinned_token)
+    _wrote.reset(wrote_token)
+
+
+def has_written():
+    return _wrote.get()
+
+
+def is_pinned():
+    # Whether reads must go to the primary
+    return _pinned.get() or _wrote.get()
+
+
+def _is_historical(model):
+    # Models built from migration state (apps.get_model() in RunPython) live in the '__fake__' module; a
+    # migration reads the database it is migrating, which replicas only catch up with later
+    return model.__module__ == '__fake__'
+
+
+def replicas():
+    return getattr(settings, 'DATABASE_REPLICAS', [])
+
+
+class PrimaryReplicaRouter:
+    # Writes go to the primary ('default') and reads to a random replica from settings.DATABASE_REPLICAS.
+    # Replicas hold the same data (they are copies of the primary), so relations across them are allowed
+    # and only the primary is migrated.
+
+    def db_for_read(self, model, **hints):
+        available = replicas()
+        if not available or is_pinned() or model._meta.app_label in PRIMARY_APPS or _is_historical(model):
+            return PRIMARY
+        return random.choice(available)
+
+    def db_for_write(self, model, **hints):
+        # Reads after a write see it, for the rest of the request and, through the middleware, afterwards
+        _wrote.set(True)
+        return PRIMARY
+
+    def allow_relation(self, obj1, obj2, **hints):
+        databases = {PRIMARY, *replicas()}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in replicas():
+            return False
+        return None
@@ -0,0 +1,174 @@
+import re
+import threading
+from bisect import bisect_left
+from collections import defaultdict
+from operator import itemgetter
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import FloatField
+from django.db.models.expressions import RawSQL
+from django.db.models.functions import Cast
+
+from .caching import search_index_version
+from .models import Book
+from .pagination import DEFAULT_PAGE_SIZE, decode_cursor, keyset_page, paginate
+
+# Words are lower-cased runs of letters/digits, the same for both search backends
+TOKEN_RE = re.compile(r'\w+')
+
+# Title matches count twice as much as description matches (mirrors the 'A'/'B' weights in PostgreSQL)
+TITLE_WEIGHT = 2.0
+DESCRIPTION_WEIGHT = 1.0
+
+# Most ranked candidates checked against the rest of the query (price, category) per round trip in the
+# fallback; the first round trip checks just one page's worth
+CANDIDATE_BATCH = 500
+
+SEARCH_ORDERING = ('-rank', 'id')
+
+
+def tokenize(text):
+    return TOKEN_RE.findall((text or '').lower())
+
+
+def build_tsquery(query):
+    # Every word must match, the last one as a prefix so that "pyth" finds "Python"
+    terms = tokenize(query)
+    if not terms:
+        return ''
+    return ' & '.join(terms[:-1] + [terms[-1] + ':*'])
+
+
+class InvertedIndex:
+    # Pure-Python fallback used when the database is not PostgreSQL (e.g. SQLite test runs).
+    # Each process holds its own copy, built from the database on first use. Writes to titles or descriptions
+    # (saves, deletes, imports) bump the shared search index version stamp in myapp.caching, and every
+    # process rebuilds its copy on the next search that sees a new stamp; writes that bypass the Book
+    # signals (queryset.update(), bulk_create) must call invalidate_search_index() themselves.
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._postings = defaultdict(dict)  # word -> {book_id: weight}
+        self._vocabulary = []  # sorted words for prefix lookups, rebuilt lazily
+        self._vocabulary_dirty = True
+        self._version = None  # stamp the index was built under; None until first used
+
+    def _load(self, version):
+        # The stamp is read before the rows, so a write committed during the load is picked up next time
+        self._postings.clear()
+        books = Book.objects.values_list('id', 'title', 'description').iterator(chunk_size=2000)
+        for book_id, title, description in books:
+            self._add(book_id, title, description)
+        self._version = version
+
+    def _add(self, book_id, title, description):
+        weights = defaultdict(float)
+        for word in tokenize(title):
+            weights[word] += TITLE_WEIGHT
+        for word in tokenize(description):
+            weights[word] += DESCRIPTION_WEIGHT
+        for word, weight in weights.items():
+            self._postings[word][book_id] = weight
+        self._vocabulary_dirty = True
+
+    def _prefix_postings(self, prefix):
+        if self._vocabulary_dirty:
+            self._vocabulary = sorted(self._postings)
+            self._vocabulary_dirty = False
+        matches = {}
+        position = bisect_left(self._vocabulary, prefix)
+        while position < len(self._vocabulary) and self._vocabulary[position].startswith(prefix):
+            for book_id, weight in self._postings[self._vocabulary[position]].items():
+                matches[book_id] = max(matches.get(book_id, 0), weight)
+            position += 1
+        return matches
+
+    def clear(self):
+        # Rebuilds this process's copy on its next search, whatever the stamp
+        with self._lock:
+            self._postings.clear()
+            self._vocabulary_dirty = True
+            self._version = None
+
+    def search(self, query):
+        # Returns {book_id: score} for books containing every word (the last one as a prefix)
+        terms = tokenize(query)
+        if not terms:
+            return {}
+        version = search_index_version()
+        with self._lock:
+            if self._version != version:
+                self._load(version)
+            scores = None
+            for position, term in enumerate(terms):
+                if position == len(terms) - 1:
+                    matches = self._prefix_postings(term)
+                else:
+                    matches = self._postings.get(term, {})
+                if scores is None:
+                    scores = dict(matches)
+                else:
+                    scores = {book_id: score + matches[book_id] for book_id, score in scores.items()
+                              if book_id in matches}
+                if not scores:
+                    break
+            return scores
+
+
+book_index = InvertedIndex()
+
+
+def uses_postgres_search(using=DEFAULT_DB_ALIAS):
+    # Whether the database behind `using` (e.g. queryset.db, which may be a replica) has the tsvector column
+    return connections[using].vendor == 'postgresql'
+
+
+def _postgres_search(queryset, query):
+    # search_vector is a generated tsvector column with a GIN index (see migration 0014)
+    tsquery = SearchQuery(build_tsquery(query), search_type='raw', config='english')
+    quote_name = connections[queryset.db].ops.quote_name
+    vector = RawSQL('%s.search_vector' % quote_name(Book._meta.db_table), [],
+                    output_field=SearchVectorField())
+    # ts_rank returns a real; the double precision cast makes the value round-trip exactly
+    # through keyset pagination cursors
+    return queryset.alias(search_vector=vector).filter(search_vector=tsquery).annotate(
+        rank=Cast(SearchRank(vector, tsquery), FloatField()))
+
+
+def _fallback_page(queryset, query, cursor, page_size):
+    # The in-memory index scores every match; they are ranked here and only the ids of the next page are sent
+    # to the database, a batch of candidates at a time, so no query grows with the number of matches
+    ranked = list(book_index.search(query).items())
+    values = decode_cursor(cursor)
+    if (values is not None and len(values) == len(SEARCH_ORDERING)
+            and all(isinstance(value, (int, float)) for value in values)):
+        rank, last_id = values
+        ranked = [(book_id, score) for book_id, score in ranked
+                  if score < rank or (score == rank and book_id > last_id)]
+    # Best score first, then by id: sorting is stable, so the id order survives the score sort
+    ranked.sort(key=itemgetter(0))
+    ranked.sort(key=itemgetter(1), reverse=True)
+
+    books = []
+    offset, batch_size = 0, page_size + 1
+    while offset < len(ranked) and len(books) <= page_size:
+        batch = ranked[offset:offset + batch_size]
+        found = queryset.in_bulk([book_id for book_id, score in batch])
+        for book_id, score in batch:
+            if book_id in found:
+                found[book_id].rank = score
+                books.append(found[book_id])
+        offset += batch_size
+        # The filters dropped some candidates: look further ahead in the next round trip
+        batch_size = min(batch_size * 4, CANDIDATE_BATCH)
+    return keyset_page(books[:page_size + 1], SEARCH_ORDERING, page_size)
+
+
+def search_page(queryset, query, cursor=None, page_size=DEFAULT_PAGE_SIZE):
+    # One page of the books of a Book queryset matching the query, best matches first, after the cursor
+    if not tokenize(query):
+        return paginate(queryset, ('id',), cursor, page_size)
+    if uses_postgres_search(queryset.db):
+        return paginate(_postgres_search(queryset, query), SEARCH_ORDERING, cursor, page_size)
+    return _fallback_page(queryset, query, cursor, page_size)
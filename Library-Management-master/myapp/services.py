@@ -0,0 +1,32 @@
+from django.db import transaction
+
+from .counters import review_counters
+from .models import Book, Member, Order
+
+
+def create_order(member_id, books, order_type):
+    # Places an order for the member (a Member shares its primary key with its User) using a fixed
+    # number of queries however many books are ordered; either every row is written or none is
+    books = list(books)
+    with transaction.atomic():
+        order = Order.objects.create(member_id=member_id, order_type=order_type)
+
+        # One INSERT for all rows of the Order.books link table
+        OrderBook = Order.books.through
+        OrderBook.objects.bulk_create([OrderBook(order_id=order.pk, book_id=book.pk) for book in books])
+
+        # Borrowed books already held by the member are skipped, as borrowed_books.add() would do
+        if order_type == Order.BORROW:
+            BorrowedBook = Member.borrowed_books.through
+            BorrowedBook.objects.bulk_create(
+                [BorrowedBook(member_id=member_id, book_id=book.pk) for book in books], ignore_conflicts=True)
+    return order
+
+
+def record_review(review):
+    # Counts a newly saved review towards its book's num_reviews and rating aggregates
+    if review_counters.enabled:
+        # Buffered mode: the increment is queued once the review is committed and written in a later batch
+        transaction.on_commit(lambda: review_counters.add(review.book_id, review.rating))
+    else:
+        Book.add_reviews(review.book_id, 1, review.rating)
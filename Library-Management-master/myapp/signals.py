@@ -0,0 +1,33 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .caching import invalidate_book, invalidate_catalogue, invalidate_search_index
+from .models import Book, Publisher, Review
+from .search import uses_postgres_search
+
+
+# Has every process rebuild its in-memory search index (PostgreSQL maintains its own)
+@receiver([post_save, post_delete], sender=Book)
+def expire_search_index(sender, instance, using, **kwargs):
+    if not uses_postgres_search(using):
+        invalidate_search_index()
+
+
+# Expires the cached index and detail fragments that show the changed rows
+@receiver([post_save, post_delete], sender=Book)
+@receiver([post_save, post_delete], sender=Publisher)
+def expire_catalogue(sender, instance, **kwargs):
+    invalidate_catalogue()
+
+
+@receiver([post_save, post_delete], sender=Review)
+def expire_book(sender, instance, **kwargs):
+    invalidate_book(instance.book_id)
+
+
+# A deleted review changes what its book's pages show without touching the book row, so the book's
+# updated_at is bumped for the ETags and Last-Modified built from it (new reviews bump it in add_reviews)
+@receiver(post_delete, sender=Review)
+def touch_book(sender, instance, **kwargs):
+    Book.objects.filter(pk=instance.book_id).update(updated_at=timezone.now())
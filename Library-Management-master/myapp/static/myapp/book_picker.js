@@ -0,0 +1,89 @@
+// Book picker for the selects rendered by myapp.forms.BookSelect and BookSelectMultiple.
+// The select only holds the chosen books; others are found by typing the start of a title,
+// one page of the autocomplete endpoint at a time.
+(function () {
+    'use strict';
+
+    var DELAY_MS = 250;
+
+    function setUp(select) {
+        var search = document.createElement('input');
+        search.type = 'search';
+        search.className = 'form-control mb-2';
+        search.placeholder = 'Type the start of a title';
+        var results = document.createElement('div');
+        results.className = 'list-group mb-2';
+        select.parentNode.insertBefore(search, select);
+        select.parentNode.insertBefore(results, select);
+
+        var timer = null;
+        var latest = 0;
+        var nextCursor = null;
+
+        function choose(book) {
+            if (!select.multiple) {
+                select.innerHTML = '';
+            }
+            var option = Array.prototype.find.call(select.options, function (o) {
+                return o.value === String(book.id);
+            });
+            if (!option) {
+                option = new Option(book.title, book.id);
+                select.add(option);
+            }
+            option.selected = true;
+        }
+
+        function show(data, append) {
+            if (!append) {
+                results.innerHTML = '';
+            }
+            var more = results.querySelector('.book-picker-more');
+            if (more) {
+                more.remove();
+            }
+            data.results.forEach(function (book) {
+                var item = document.createElement('button');
+                item.type = 'button';
+                item.className = 'list-group-item list-group-item-action';
+                item.textContent = book.title;
+                item.addEventListener('click', function () { choose(book); });
+                results.appendChild(item);
+            });
+            nextCursor = data.next_cursor;
+            if (nextCursor) {
+                more = document.createElement('button');
+                more.type = 'button';
+                more.className = 'list-group-item list-group-item-light book-picker-more';
+                more.textContent = 'More…';
+                more.addEventListener('click', function () { load(true); });
+                results.appendChild(more);
+            }
+        }
+
+        function load(append) {
+            var url = select.dataset.autocompleteUrl + '?q=' + encodeURIComponent(search.value.trim());
+            if (append && nextCursor) {
+                url += '&cursor=' + encodeURIComponent(nextCursor);
+            }
+            // Responses to earlier keystrokes that arrive late are dropped
+            var request = ++latest;
+            fetch(url, {credentials: 'same-origin'})
+                .then(function (response) { return response.json(); })
+                .then(function (data) {
+                    if (request === latest) {
+                        show(data, append);
+                    }
+                });
+        }
+
+        search.addEventListener('input', function () {
+            clearTimeout(timer);
+            timer = setTimeout(function () { load(false); }, DELAY_MS);
+        });
+    }
+
+    document.addEventListener('DOMContentLoaded', function () {
+        document.querySelectorAll('select.book-picker').forEach(setUp);
+    });
+})();
@@ -0,0 +1,743 @@
+import atexit
+import csv
+import io
+import json
+import logging
+import os
+import queue
+import tempfile
+from decimal import Decimal
+from importlib.util import find_spec
+from unittest import skipUnless
+from unittest.mock import patch
+
+from django.apps import apps
+from django.contrib.auth.models import AnonymousUser, User
+from django.contrib.messages import get_messages
+from django.contrib.sessions.models import Session
+from django.core.cache import cache
+from django.db import connection
+from django.db.migrations.state import ProjectState
+from django.db.models import Count
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import routers
+from .api.views import MAX_BATCH_IDS, PAGE_SIZE as API_PAGE_SIZE
+from .backends import MemberBackend
+from .caching import catalogue_versions, index_fragment_key, invalidate_search_index
+from .counters import ReviewCounterBuffer
+from .datagen import generate_catalogue
+from .forms import OrderForm
+from .logutils import JsonFormatter, NonBlockingQueueHandler, RateLimitFilter, queue_handler
+from .management.commands import explain_views
+from .middleware import MemberMiddleware, ReplicaPinningMiddleware
+from .models import (Book, BookRecommendation, DailyOrderStats, Member, Order, Publisher, ReportWatermark, Review,
+                     TopRatedBook)
+from .recommendations import compute_recommendations
+from .pagination import decode_cursor, encode_cursor, keyset_page, paginate
+from .reports import refresh_reports
+from .search import InvertedIndex, book_index, search_page
+from .services import create_order
+
+
+class PaginationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_catalogue(publishers=2, books=25, members=10, orders=5, reviews=40)
+
+    def test_cursor_round_trip(self):
+        self.assertEqual(decode_cursor(encode_cursor([4.5, 'abc', 7])), [4.5, 'abc', 7])
+
+    def test_malformed_cursor_decodes_to_none(self):
+        for token in (None, '', '!!!', encode_cursor({'id': 1})):
+            self.assertIsNone(decode_cursor(token))
+
+    def test_pages_cover_every_row_once(self):
+        # Ratings repeat, so the id tiebreaker decides the order within equal ratings
+        ordering = ('-avg_rating', 'id')
+        expected = list(Book.objects.order_by(*ordering).values_list('id', flat=True))
+        seen = []
+        cursor = None
+        while True:
+            page = paginate(Book.objects.all(), ordering, cursor, page_size=7)
+            seen += [book.id for book in page]
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, expected)
+
+    def test_malformed_cursor_gives_first_page(self):
+        first = paginate(Book.objects.all(), ('id',), None, page_size=5)
+        self.assertEqual([book.id for book in paginate(Book.objects.all(), ('id',), 'garbage', page_size=5)],
+                         [book.id for book in first])
+
+    def test_tampered_cursor_gives_first_page(self):
+        first = [book.id for book in paginate(Book.objects.all(), ('-avg_rating', 'id'), None, page_size=5)]
+        for values in (['x', 1], [1, 'x'], [None, 1], [[1], 1], [1.5, 2 ** 80]):
+            page = paginate(Book.objects.all(), ('-avg_rating', 'id'), encode_cursor(values), page_size=5)
+            self.assertEqual([book.id for book in page], first)
+
+    def test_tampered_cursor_in_requests(self):
+        book = Book.objects.order_by('id').first()
+        requests = [
+            (reverse('myapp:index'), {'cursor': encode_cursor(['x'])}),
+            (reverse('myapp:async_index'), {'cursor': encode_cursor(['x'])}),
+            (reverse('myapp:findbooks'), {'max_price': '100', 'cursor': encode_cursor(['x'])}),
+            (reverse('myapp:findbooks'), {'name': 'python', 'max_price': '100', 'cursor': encode_cursor(['x', 'y'])}),
+            (reverse('myapp:api:book_reviews', args=[book.id]), {'cursor': encode_cursor(['x', 'y'])}),
+        ]
+        for url, params in requests:
+            with self.subTest(url=url, params=params):
+                self.assertEqual(self.client.get(url, params).status_code, 200)
+
+    def test_dict_rows(self):
+        page = keyset_page([{'id': 1}, {'id': 2}, {'id': 3}], ('id',), 2)
+        self.assertEqual(page.object_list, [{'id': 1}, {'id': 2}])
+        self.assertEqual(decode_cursor(page.next_cursor), [2])
+        self.assertFalse(keyset_page([{'id': 1}], ('id',), 2).has_next)
+
+
+class BookAutocompleteTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        publisher = Publisher.objects.create(name='Press', website='https://press.example.com')
+        titles = [f'python {i:02d}' for i in range(15)] + [f'Python {i:02d}' for i in range(15)] + ['Java']
+        Book.objects.bulk_create([Book(title=title, price=10, publisher=publisher) for title in titles])
+
+    def fetch(self, **params):
+        response = self.client.get(reverse('myapp:book_autocomplete'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_pages_of_prefix_matches_in_title_order(self):
+        titles = []
+        data = self.fetch(q='PYTH')
+        while True:
+            titles += [book['title'] for book in data['results']]
+            if not data['next_cursor']:
+                break
+            data = self.fetch(q='PYTH', cursor=data['next_cursor'])
+        expected = Book.objects.filter(title__istartswith='pyth').order_by('id').values_list('title', flat=True)
+        self.assertEqual(titles, sorted(expected, key=str.lower))
+
+    def test_tampered_cursor_gives_first_page(self):
+        first = self.fetch(q='py')
+        self.assertEqual(self.fetch(q='py', cursor=encode_cursor(['a', 'x'])), first)
+
+    def test_empty_query(self):
+        self.assertEqual(self.fetch(q='  '), {'results': [], 'next_cursor': None})
+
+    def test_picker_renders_only_valid_selected_ids(self):
+        book = Book.objects.get(title='Java')
+        form = OrderForm({'books': ['abc', '\u00b2', '9' * 30, '-1', str(book.id)], 'order_type': Order.BORROW})
+        self.assertFalse(form.is_valid())
+        html = str(form['books'])
+        self.assertEqual(html.count('<option'), 1)
+        self.assertIn(f'value="{book.id}"', html)
+
+
+class SearchTests(TestCase):
+    # SQLite test runs exercise the in-memory fallback; PostgreSQL runs the same tests against the tsvector column
+
+    @classmethod
+    def setUpTestData(cls):
+        publisher = Publisher.objects.create(name='Press', website='https://press.example.com')
+        Book.objects.bulk_create([
+            Book(title='Python basics', description='A first course', price=10, publisher=publisher),
+            Book(title='Cooking', description='Python recipes for the kitchen', price=10, publisher=publisher),
+            Book(title='Pythons of the world', description='Snakes', price=50, publisher=publisher),
+            Book(title='Python tricks', description='Advanced python', price=20, publisher=publisher),
+            Book(title='Java', description='Coffee', price=10, publisher=publisher),
+        ])
+
+    def setUp(self):
+        cache.clear()
+        book_index.clear()
+
+    def titles(self, queryset, query, page_size=10):
+        titles, cursor = [], None
+        while True:
+            page = search_page(queryset, query, cursor, page_size)
+            titles += [book.title for book in page]
+            if not page.has_next:
+                return titles
+            cursor = page.next_cursor
+
+    def test_title_matches_rank_above_description_matches(self):
+        titles = self.titles(Book.objects.all(), 'python')
+        self.assertEqual(titles[0], 'Python tricks')
+        self.assertEqual(titles[-1], 'Cooking')
+
+    def test_last_word_is_a_prefix(self):
+        self.assertEqual(set(self.titles(Book.objects.all(), 'PYTH')),
+                         {'Python basics', 'Cooking', 'Pythons of the world', 'Python tricks'})
+        self.assertEqual(self.titles(Book.objects.all(), 'python fir'), ['Python basics'])
+        self.assertEqual(self.titles(Book.objects.all(), 'fir python'), [])
+
+    def test_filters_apply_across_pages(self):
+        queryset = Book.objects.filter(price__lte=20)
+        self.assertEqual(self.titles(queryset, 'pyth', page_size=1), self.titles(queryset, 'pyth'))
+        self.assertEqual(len(self.titles(queryset, 'pyth', page_size=1)), 3)
+
+    def test_index_follows_writes_made_elsewhere(self):
+        # Stands for another process's copy; the write below sends it no signal, only the version stamp
+        index = InvertedIndex()
+        self.assertEqual(index.search('snakes').keys(), {Book.objects.get(title='Pythons of the world').id})
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.filter(title='Java').update(description='Snakes and ladders')
+            invalidate_search_index()
+        self.assertEqual(len(index.search('snakes')), 2)
+        with self.captureOnCommitCallbacks(execute=True):
+            Book.objects.get(title='Java').delete()
+        self.assertEqual(len(index.search('snakes')), 1)
+
+
+class FragmentCacheTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    def test_index_key_uses_the_decoded_cursor(self):
+        self.assertEqual(index_fragment_key(encode_cursor([5])), index_fragment_key(encode_cursor([5]) + '=='))
+        self.assertNotEqual(index_fragment_key(encode_cursor([5])), index_fragment_key(None))
+
+    def test_undecodable_cursor_is_not_cached(self):
+        for cursor in ('x' * 5000, encode_cursor(['5']), encode_cursor([5, 6]), encode_cursor([True])):
+            self.assertIsNone(index_fragment_key(cursor))
+        response = self.client.get(reverse('myapp:index'), {'cursor': 'x' * 5000})
+        self.assertEqual(response.status_code, 200)
+
+    def test_async_views_render_the_fragments(self):
+        generate_catalogue(publishers=1, books=5, members=5, orders=5, reviews=5)
+        book = Book.objects.order_by('id').first()
+        for name, args, text in (('index', [], book.title), ('detail', [book.id], book.title.upper())):
+            self.assertContains(self.client.get(reverse(f'myapp:async_{name}', args=args)), text)
+            # The async and sync views share the cached fragment
+            self.assertContains(self.client.get(reverse(f'myapp:{name}', args=args)), text)
+
+
+class ConditionalGetTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_catalogue(publishers=2, books=15, members=10, orders=5, reviews=20)
+
+    def setUp(self):
+        cache.clear()
+        self.book = Book.objects.order_by('id').first()
+
+    def assertRevalidates(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Cookie', response['Vary'])
+        etag = response['ETag']
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        return etag
+
+    def test_index_not_modified(self):
+        self.assertRevalidates(reverse('myapp:index'))
+
+    def test_index_changes_with_a_book(self):
+        url = reverse('myapp:index')
+        etag = self.assertRevalidates(url)
+        self.book.price += 1
+        self.book.save()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_detail_changes_with_its_publisher(self):
+        url = reverse('myapp:detail', args=[self.book.id])
+        etag = self.assertRevalidates(url)
+        self.book.publisher.city = 'Kingston'
+        self.book.publisher.save()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_check_reviews_changes_when_a_review_is_deleted(self):
+        book = Book.objects.filter(review__isnull=False).order_by('id').first()
+        url = reverse('myapp:check_reviews', args=[book.id])
+        self.client.force_login(Member.objects.order_by('pk').first())
+        etag = self.assertRevalidates(url)
+        Review.objects.filter(book=book).first().delete()
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+    def test_missing_book_has_no_etag(self):
+        response = self.client.get(reverse('myapp:detail', args=[0]))
+        self.assertNotIn('ETag', response)
+
+
+class ReviewCounterTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        publisher = Publisher.objects.create(name='Press', website='https://press.example.com')
+        cls.books = Book.objects.bulk_create([
+            Book(title='Rated', price=10, publisher=publisher, num_reviews=2, rating_sum=7, rating_count=2,
+                 avg_rating=3.5),
+            Book(title='Unrated', price=10, publisher=publisher),
+        ])
+
+    def setUp(self):
+        cache.clear()
+
+    def test_add_reviews_is_one_update(self):
+        book = self.books[0]
+        with self.assertNumQueries(1):
+            Book.add_reviews(book.id, 3, 10)
+        book.refresh_from_db()
+        self.assertEqual((book.num_reviews, book.rating_sum, book.rating_count), (5, 17, 5))
+        # Divided in the database from the summed counters, not averaged from the previous average
+        self.assertEqual(book.avg_rating, 17 / 5)
+
+    @override_settings(REVIEW_COUNTERS_FLUSH_INTERVAL=60)
+    def test_buffered_increments_are_summed_per_book(self):
+        rated, unrated = self.books
+        buffer = ReviewCounterBuffer()
+        for book, rating in ((rated, 5), (unrated, 2), (rated, 1), (rated, 4)):
+            buffer.add(book.id, rating)
+        with self.captureOnCommitCallbacks(execute=True), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(buffer.flush(), 2)
+        # One UPDATE per book, however many reviews it got
+        self.assertEqual(sum(query['sql'].startswith('UPDATE') for query in queries), 2)
+        self.assertEqual(buffer.flush(), 0)
+
+        rated.refresh_from_db()
+        unrated.refresh_from_db()
+        self.assertEqual((rated.num_reviews, rated.rating_sum, rated.rating_count), (5, 17, 5))
+        self.assertEqual((unrated.num_reviews, unrated.rating_sum, unrated.avg_rating), (1, 2, 2.0))
+        # The cached pages of both books are expired
+        self.assertEqual(catalogue_versions(rated.id)[1], 2)
+        self.assertEqual(catalogue_versions(unrated.id)[1], 2)
+
+
+class BookAdminActionTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_superuser('admin', password='x')
+        cls.press, cls.house = Publisher.objects.bulk_create([
+            Publisher(name='Press', website='https://press.example.com'),
+            Publisher(name='House', website='https://house.example.com'),
+        ])
+        Book.objects.bulk_create([
+            Book(title='Dune', price=10, publisher=cls.press),
+            Book(title='Emma', price=995, publisher=cls.press),
+            Book(title='Dune', price=20, publisher=cls.house),
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def act(self, action, books, **data):
+        # Runs an action from the Book changelist; returns the messages and the UPDATE statements it ran
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(reverse('admin:myapp_book_changelist'),
+                                        {'action': action, '_selected_action': [book.id for book in books], **data})
+        self.assertEqual(response.status_code, 302)
+        updates = [query['sql'] for query in queries if query['sql'].startswith('UPDATE "myapp_book"')]
+        return [str(message) for message in get_messages(response.wsgi_request)], updates
+
+    def book(self, title, publisher):
+        return Book.objects.get(title=title, publisher=publisher)
+
+    def test_reprice_is_one_update_and_skips_out_of_range_prices(self):
+        dune, emma = self.book('Dune', self.press), self.book('Emma', self.press)
+        messages, updates = self.act('increase_10_dollars', [dune, emma])
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(messages, ['1 book(s) repriced.', '1 book(s) skipped: the new price would be outside 0-1000.'])
+        self.assertEqual(self.book('Dune', self.press).price, 20)
+        self.assertEqual(self.book('Emma', self.press).price, 995)
+
+    def test_change_price_by_percent(self):
+        messages, updates = self.act('change_price_by_percent', [self.book('Dune', self.press)], amount='12.5')
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(self.book('Dune', self.press).price, Decimal('11.25'))
+
+    def test_action_without_its_value_changes_nothing(self):
+        messages, updates = self.act('change_price_by_amount', [self.book('Dune', self.press)], amount='')
+        self.assertEqual(updates, [])
+        self.assertEqual(messages, ["Please fill in 'amount' next to the action."])
+
+    def test_set_category(self):
+        books = list(Book.objects.all())
+        messages, updates = self.act('set_category', books, category='F')
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(set(Book.objects.values_list('category', flat=True)), {'F'})
+
+    def test_move_to_publisher_skips_titles_it_already_has(self):
+        messages, updates = self.act('move_to_publisher', Book.objects.filter(publisher=self.press),
+                                     publisher=self.house.id)
+        self.assertEqual(messages, ['1 book(s) moved to House.',
+                                    '1 book(s) skipped: House already has a book with the same title.'])
+        self.assertEqual(self.book('Emma', self.house).price, 995)
+        self.assertEqual(self.book('Dune', self.press).price, 10)
+
+    def test_move_to_publisher_refuses_selected_books_with_one_title(self):
+        third = Publisher.objects.create(name='Third', website='https://third.example.com')
+        messages, updates = self.act('move_to_publisher', Book.objects.filter(title='Dune'), publisher=third.id)
+        self.assertEqual(len(messages), 1)
+        self.assertTrue(messages[0].startswith('No books moved'))
+        self.assertFalse(Book.objects.filter(publisher=third).exists())
+
+
+class ExportTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_catalogue(publishers=2, books=20, members=5, orders=15, reviews=30)
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+
+    def setUp(self):
+        self.client.force_login(self.staff)
+
+    def export(self, kind, fmt, **params):
+        response = self.client.get(reverse('myapp:export', args=[kind, fmt]), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode()
+
+    def test_orders_csv_lists_each_order_with_its_books(self):
+        rows = list(csv.DictReader(io.StringIO(self.export('orders', 'csv'))))
+        orders = Order.objects.order_by('id')
+        self.assertEqual([int(row['id']) for row in rows], list(orders.values_list('id', flat=True)))
+        book_ids = sorted(orders.first().books.values_list('id', flat=True))
+        self.assertEqual(rows[0]['book_ids'], ' '.join(map(str, book_ids)))
+
+    def test_since_id_exports_only_newer_rows(self):
+        since = Review.objects.order_by('id').values_list('id', flat=True)[10]
+        rows = [json.loads(line) for line in self.export('reviews', 'ndjson', since_id=since).splitlines()]
+        self.assertEqual(len(rows), Review.objects.filter(id__gt=since).count())
+        self.assertTrue(all(row['id'] > since for row in rows))
+
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(reverse('myapp:export', args=['members', 'csv'])).status_code, 400)
+        url = reverse('myapp:export', args=['books', 'csv'])
+        self.assertEqual(self.client.get(url, {'since_date': '2020-01-01'}).status_code, 400)
+        self.client.force_login(Member.objects.order_by('pk').first())
+        self.assertEqual(self.client.get(url).status_code, 302)
+
+
+class MemberLookupTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_catalogue(publishers=1, books=1, members=2, orders=0, reviews=0)
+        cls.member = Member.objects.order_by('pk').first()
+        cls.staff = User.objects.create_user('staff', password='x', is_staff=True)
+
+    def test_backend_joins_the_member(self):
+        backend = MemberBackend()
+        with self.assertNumQueries(1):
+            user = backend.get_user(self.member.pk)
+            self.assertEqual(user.member.status, self.member.status)
+        self.assertFalse(hasattr(backend.get_user(self.staff.pk), 'member'))
+        User.objects.filter(pk=self.member.pk).update(is_active=False)
+        self.assertIsNone(backend.get_user(self.member.pk))
+
+    def test_middleware_sets_a_lazy_member(self):
+        seen = []
+
+        def view(request):
+            seen.append(request.member.pk if request.member else None)
+            return HttpResponse()
+
+        middleware = MemberMiddleware(view)
+        backend = MemberBackend()
+        for user, expected in ((backend.get_user(self.member.pk), self.member.pk),
+                               (backend.get_user(self.staff.pk), None),
+                               (AnonymousUser(), None)):
+            request = RequestFactory().get('/')
+            request.user = user
+            # The backend already joined the member row (or its absence), so no query is left to run
+            with self.assertNumQueries(0):
+                middleware(request)
+            self.assertEqual(seen.pop(), expected)
+
+
+@skipUnless(find_spec('numpy') and find_spec('scipy'), 'compute_recommendations needs numpy and scipy')
+class RecommendationTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_catalogue(publishers=1, books=4, members=1, orders=0, reviews=0)
+        cls.a, cls.b, cls.c, cls.d = Book.objects.order_by('id')
+        member = Member.objects.get()
+        for books in ([cls.a, cls.b], [cls.a, cls.b], [cls.a, cls.c], [cls.d]):
+            create_order(member.pk, books, Order.PURCHASE)
+        Book.objects.update(category='S', rating_sum=0, rating_count=0)
+        for book, rating_sum, rating_count in ((cls.a, 5, 1), (cls.b, 90, 20), (cls.c, 1, 1)):
+            Book.objects.filter(pk=book.pk).update(rating_sum=rating_sum, rating_count=rating_count)
+
+    def test_books_ordered_together_are_recommended_by_cosine_score(self):
+        # One order line per block, so the counts are summed across blocks
+        compute_recommendations(block_lines=1)
+        lists = {book.id: [(rec.recommended_id, round(rec.score, 3))
+                           for rec in BookRecommendation.objects.for_book(book.id)]
+                 for book in (self.a, self.b, self.d)}
+        # A is in 3 orders, B in 2 (both with A) and C in 1: 2/sqrt(3*2) and 1/sqrt(3*1)
+        self.assertEqual(lists[self.a.id], [(self.b.id, 0.816), (self.c.id, 0.577)])
+        self.assertEqual(lists[self.b.id], [(self.a.id, 0.816)])
+        self.assertEqual(lists[self.d.id], [])
+
+    def test_top_rated_shrinks_ratings_towards_the_mean(self):
+        compute_recommendations()
+        mean = 96 / 22
+        expected = sorted([((5 + 5 * mean) / 6, self.a.id), ((90 + 5 * mean) / 25, self.b.id),
+                           ((1 + 5 * mean) / 6, self.c.id)], reverse=True)
+        top = TopRatedBook.objects.for_category('S')
+        self.assertEqual([(round(row.score, 6), row.book_id) for row in top],
+                         [(round(score, 6), book_id) for score, book_id in expected])
+
+
+class ApiTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_catalogue(publishers=2, books=10, members=2, orders=150, reviews=80)
+        busiest = Order.objects.values('member').annotate(orders=Count('id')).order_by('-orders', 'member').first()
+        cls.member = Member.objects.get(pk=busiest['member'])
+
+    def test_books_batch_lists_found_and_missing_ids(self):
+        book = Book.objects.select_related('publisher').order_by('id').first()
+        response = self.client.get(reverse('myapp:api:books'), {'ids': f'0,{book.id},{book.id}'})
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['missing'], [0])
+        self.assertEqual([row['id'] for row in data['results']], [book.id])
+        self.assertEqual(data['results'][0]['publisher_name'], book.publisher.name)
+        self.assertEqual(data['results'][0]['price'], str(book.price))
+        for ids in ('', 'a,b', ','.join(map(str, range(MAX_BATCH_IDS + 1)))):
+            self.assertEqual(self.client.get(reverse('myapp:api:books'), {'ids': ids}).status_code, 400)
+
+    def test_member_orders_pages_through_every_order(self):
+        url = reverse('myapp:api:member_orders', args=[self.member.pk])
+        self.assertEqual(self.client.get(url).status_code, 401)
+        self.client.force_login(Member.objects.exclude(pk=self.member.pk).first())
+        self.assertEqual(self.client.get(url).status_code, 403)
+
+        self.client.force_login(self.member)
+        orders, cursor = [], None
+        while True:
+            data = self.client.get(url, {'cursor': cursor} if cursor else {}).json()
+            orders += data['results']
+            cursor = data['next_cursor']
+            if not cursor:
+                break
+        expected = Order.objects.filter(member=self.member)
+        self.assertGreater(expected.count(), API_PAGE_SIZE)
+        self.assertEqual(sorted(order['id'] for order in orders), sorted(expected.values_list('id', flat=True)))
+        first = expected.get(id=orders[0]['id'])
+        self.assertEqual(orders[0]['book_ids'], sorted(first.books.values_list('id', flat=True)))
+
+    def test_reviews_of_a_missing_book(self):
+        response = self.client.get(reverse('myapp:api:book_reviews', args=[0]))
+        self.assertEqual(response.status_code, 404)
+
+
+class PlaceOrderTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_catalogue(publishers=1, books=5, members=10, orders=0, reviews=0)
+        cls.books = list(Book.objects.order_by('id').values_list('id', flat=True)[:2])
+
+    def test_order_belongs_to_the_member(self):
+        member = Member.objects.order_by('pk').first()
+        self.client.force_login(member)
+        response = self.client.post(reverse('myapp:place_order'), {'books': self.books, 'order_type': Order.BORROW})
+        self.assertEqual(response.status_code, 200)
+        order = Order.objects.get()
+        self.assertEqual(order.member_id, member.pk)
+        self.assertEqual(set(member.borrowed_books.values_list('id', flat=True)), set(self.books))
+
+    def test_account_without_member_gets_404(self):
+        self.client.force_login(User.objects.create_user('staff', password='x', is_staff=True))
+        response = self.client.post(reverse('myapp:place_order'), {'books': self.books, 'order_type': Order.BORROW})
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(Order.objects.exists())
+
+
+class ReportsTests(TestCase):
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.member = Member.objects.create(username='reader')
+
+    def order_count(self):
+        return sum(DailyOrderStats.objects.values_list('orders', flat=True))
+
+    def test_order_committed_below_the_watermark_is_counted_once(self):
+        orders = [Order.objects.create(member=self.member) for _ in range(4)]
+        # The second order's transaction has not committed yet when the report is refreshed
+        late_id = orders[1].id
+        orders[1].delete()
+        refresh_reports()
+        self.assertEqual(self.order_count(), 3)
+
+        Order.objects.create(id=late_id, member=self.member)
+        refresh_reports()
+        self.assertEqual(self.order_count(), 4)
+        refresh_reports()
+        self.assertEqual(self.order_count(), 4)
+        self.assertEqual(refresh_reports(full=True)['orders'], 4)
+
+    def test_gaps_are_kept_as_ranges(self):
+        orders = Order.objects.bulk_create([Order(member=self.member) for _ in range(50)])
+        ids = [order.id for order in orders]
+        # A block that rolled back (or was deleted) is one pending entry, not one per id
+        Order.objects.filter(id__in=ids[10:40]).delete()
+        refresh_reports()
+        self.assertEqual(self.order_count(), 20)
+        self.assertEqual(ReportWatermark.objects.get(source='orders').pending_ids, [[ids[10], ids[39]]])
+
+        Order.objects.bulk_create([Order(id=pk, member=self.member) for pk in ids[20:25]])
+        refresh_reports()
+        self.assertEqual(self.order_count(), 25)
+        self.assertEqual(ReportWatermark.objects.get(source='orders').pending_ids,
+                         [[ids[10], ids[19]], [ids[25], ids[39]]])
+
+
+class LoggingTests(SimpleTestCase):
+
+    def record(self, msg='Query failed: %s', name='myapp.views'):
+        return logging.LogRecord(name, logging.ERROR, __file__, 0, msg, ('timeout',), None)
+
+    def test_rate_limit_reports_what_it_dropped(self):
+        clock = [100.0]
+        with patch('myapp.logutils.time.monotonic', lambda: clock[0]):
+            limit = RateLimitFilter(rate=2, per=1.0, keep=10.0)
+            self.assertEqual([limit.filter(self.record()) for _ in range(5)], [True, True, False, False, False])
+            clock[0] += 1.5
+            record = self.record()
+            self.assertTrue(limit.filter(record))
+            self.assertEqual(json.loads(JsonFormatter().format(record))['suppressed'], 3)
+
+            # A message that is not logged again gets its dropped count logged on its own once given up on
+            for _ in range(4):
+                limit.filter(self.record('Slow page'))
+            clock[0] += 11
+            with self.assertLogs('myapp.logutils', 'WARNING') as logs:
+                limit.filter(self.record('Something else'))
+        self.assertEqual(logs.records[0].suppressed, 2)
+        self.assertIn('Slow page', logs.output[0])
+
+    def test_full_queue_counts_dropped_records(self):
+        handler = NonBlockingQueueHandler(queue.Queue(1))
+        for _ in range(3):
+            handler.handle(self.record())
+        handler.queue.get_nowait()
+        handler.handle(self.record())
+        self.assertEqual(handler.queue.get_nowait().queue_dropped, 2)
+
+    @skipUnless(hasattr(os, 'fork'), 'needs os.fork')
+    def test_forked_child_writes_its_own_records(self):
+        with tempfile.TemporaryFile('w+') as stream:
+            handler = queue_handler(stream)
+            self.addCleanup(handler.listener.stop)
+            self.addCleanup(atexit.unregister, handler.listener.stop)
+            pid = os.fork()
+            if pid == 0:
+                # The child has no listener thread; without write_directly this record would stay queued
+                handler.handle(self.record())
+                os._exit(0)
+            os.waitpid(pid, 0)
+            stream.seek(0)
+            lines = [json.loads(line) for line in stream]
+        self.assertEqual([line['message'] for line in lines], ['Query failed: timeout'])
+
+
+class ExplainViewsTests(SimpleTestCase):
+
+    def test_only_pk_ordered_pages_are_bounded_scans(self):
+        bounded = explain_views.Command.bounded_scan
+        page = 'SELECT "myapp_book"."id" FROM "myapp_book" ORDER BY "myapp_book"."id" ASC LIMIT 11'
+        self.assertEqual(bounded(page, ['SCAN myapp_book']), 'SCAN myapp_book')
+        # A filter can make the scan read far past LIMIT rows before it finds enough matches
+        filtered = page.replace(' ORDER BY', ' WHERE "myapp_book"."price" <= %s ORDER BY')
+        self.assertIsNone(bounded(filtered, ['SCAN myapp_book']))
+        by_title = page.replace('ORDER BY "myapp_book"."id"', 'ORDER BY "myapp_book"."title"')
+        self.assertIsNone(bounded(by_title, ['SCAN myapp_book', 'USE TEMP B-TREE FOR ORDER BY']))
+        self.assertIsNone(bounded(page.replace(' LIMIT 11', ''), ['SCAN myapp_book']))
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class RoutingTests(SimpleTestCase):
+    # Only the routing decisions are checked; no query reaches the (absent) replica
+
+    def setUp(self):
+        self.router = routers.PrimaryReplicaRouter()
+        tokens = routers.begin(False)
+        self.addCleanup(routers.end, tokens)
+
+    def test_reads_go_to_a_replica(self):
+        self.assertEqual(self.router.db_for_read(Book), 'replica1')
+
+    def test_sessions_read_from_the_primary(self):
+        self.assertEqual(self.router.db_for_read(Session), routers.PRIMARY)
+
+    def test_reads_after_a_write_go_to_the_primary(self):
+        self.assertEqual(self.router.db_for_write(Book), routers.PRIMARY)
+        self.assertEqual(self.router.db_for_read(Book), routers.PRIMARY)
+
+    def test_pinned_reads_go_to_the_primary(self):
+        tokens = routers.begin(True)
+        try:
+            self.assertEqual(self.router.db_for_read(Book), routers.PRIMARY)
+        finally:
+            routers.end(tokens)
+        self.assertEqual(self.router.db_for_read(Book), 'replica1')
+
+    def test_migration_models_read_from_the_primary(self):
+        # RunPython code reads the database being migrated, which replicas have not caught up with yet
+        historical = ProjectState.from_apps(apps).apps.get_model('myapp', 'Review')
+        self.assertEqual(self.router.db_for_read(historical), routers.PRIMARY)
+
+    def test_replicas_are_not_migrated(self):
+        self.assertIs(self.router.allow_migrate('replica1', 'myapp'), False)
+        self.assertIsNone(self.router.allow_migrate(routers.PRIMARY, 'myapp'))
+
+
+@override_settings(DATABASE_REPLICAS=['replica1'])
+class ReplicaPinningMiddlewareTests(SimpleTestCase):
+
+    def setUp(self):
+        self.factory = RequestFactory()
+        self.routes = []
+
+    def view(self, write):
+        def get_response(request):
+            if write:
+                routers.PrimaryReplicaRouter().db_for_write(Book)
+            self.routes.append(routers.PrimaryReplicaRouter().db_for_read(Book))
+            return HttpResponse()
+        return ReplicaPinningMiddleware(get_response)
+
+    def test_write_pins_the_next_reads(self):
+        response = self.view(write=True)(self.factory.post('/'))
+        cookie = response.cookies[ReplicaPinningMiddleware.cookie_name]
+        self.assertEqual(self.routes, [routers.PRIMARY])
+
+        request = self.factory.get('/')
+        request.COOKIES[cookie.key] = cookie.value
+        response = self.view(write=False)(request)
+        self.assertEqual(self.routes[-1], routers.PRIMARY)
+        # Reads while pinned do not extend the window
+        self.assertNotIn(ReplicaPinningMiddleware.cookie_name, response.cookies)
+
+    def test_reads_without_cookie_use_replicas(self):
+        response = self.view(write=False)(self.factory.get('/'))
+        self.assertEqual(self.routes, ['replica1'])
+        self.assertNotIn(ReplicaPinningMiddleware.cookie_name, response.cookies)
+
+    def test_forged_cookie_is_ignored(self):
+        request = self.factory.get('/')
+        request.COOKIES[ReplicaPinningMiddleware.cookie_name] = '1'
+        self.view(write=False)(request)
+        self.assertEqual(self.routes, ['replica1'])
@@ -1,5 +1,5 @@
-from django.urls import path
-from myapp import views
+from django.urls import include, path
+from myapp import async_views, views
 
 app_name = 'myapp'
 
@@ -15,6 +15,9 @@ urlpatterns = [
     # Findbooks view to search for books
     path(r'findbooks/', views.findbooks, name='findbooks'),
 
+    # JSON title autocomplete used by the book pickers on the order and review forms
+    path(r'books/autocomplete/', views.book_autocomplete, name='book_autocomplete'),
+
     # Place_order view for placing an order
     path(r'place_order/', views.place_order, name='place_order'),
 
@@ -35,6 +38,21 @@ urlpatterns = [
 
     # My orders view for displaying user orders
     path(r'orders/', views.my_orders, name='orders'),
+
+    # Streaming CSV/NDJSON export of books, orders or reviews (staff only)
+    path(r'export/<str:kind>.<str:fmt>', views.export, name='export'),
+
+    # Staff dashboard built from the reporting tables
+    path(r'dashboard/', views.dashboard, name='dashboard'),
+
+    # Versioned JSON read API for partner systems
+    path(r'api/v1/', include('myapp.api.urls')),
+
+    # Async versions of the read-only pages, for serving through mysiteF19.asgi
+    path(r'async/', async_views.IndexView.as_view(), name='async_index'),
+    path(r'async/<int:book_id>/', async_views.DetailView.as_view(), name='async_detail'),
+    path(r'async/findbooks/', async_views.findbooks, name='async_findbooks'),
+    path(r'async/check/<int:book_id>/', async_views.chk_reviews, name='async_check_reviews'),
 ]
 
 # Comments:
@@ -1,20 +1,44 @@
 import random
-from datetime import datetime
+from datetime import date, datetime
 
 from django.contrib.auth import authenticate, login, logout
+from django.contrib.admin.views.decorators import staff_member_required
 from django.contrib.auth.decorators import login_required
-from django.http import HttpResponseRedirect, HttpResponseServerError
+from django.db import connections, transaction
+from django.db.models import Max, Q, Sum
+from django.db.models.functions import Collate, TruncMonth, Upper
+from django.http import (Http404, HttpResponseBadRequest, HttpResponseRedirect, HttpResponseServerError,
+                         JsonResponse, StreamingHttpResponse)
 from django.shortcuts import get_object_or_404
 from django.shortcuts import render
+from django.template.loader import render_to_string
 from django.urls import reverse
+from django.utils.decorators import method_decorator
 from django.views import View
 
+from .caching import cached_fragment, detail_fragment_key, index_fragment_key
+from .conditional import (check_reviews_etag, conditional_page, detail_etag, detail_last_modified, index_etag,
+                          index_last_modified, results_etag, results_last_modified)
+from .exports import FORMATS, ExportError, export_lines
 from .forms import SearchForm, OrderForm, ReviewForm, RegisterForm
-from .models import Book, Member, Order, Review
+from .models import (Book, BookRecommendation, CategoryStats, DailyOrderStats, Member, Order, PublisherReviewStats,
+                     ReportWatermark, Review, TopRatedBook)
+from .pagination import DEFAULT_PAGE_SIZE, paginate
+from .search import search_page
+from .services import create_order, record_review
 import logging
 
 logger = logging.getLogger(__name__)
 
+# Maximum number of books rendered on one search results page
+RESULTS_PAGE_SIZE = 20
+
+# Maximum number of orders rendered on one page of a member's order history
+ORDERS_PAGE_SIZE = 20
+
+# Maximum number of books returned by one book picker autocomplete request
+AUTOCOMPLETE_PAGE_SIZE = 20
+
 
 # Index view function
 def index(request):
@@ -25,26 +49,36 @@ def index(request):
         return render(request, 'myapp/index.html', {'booklist': book_list, 'last_login': last_login})
     except Exception as e:
         # Logs an error if an exception occurs while rendering the index view
-        logger.error(f"An error occurred in index view: {e}")
+        logger.error("An error occurred in index view: %s", e)
         return render(request, 'myapp/error.html', {'message': 'Something went wrong! Please try again later.'})
 
 
-# Index view class-based
+# Index view class-based; unchanged pages are answered with 304 Not Modified
+@method_decorator(conditional_page(index_etag, index_last_modified), name='get')
 class IndexView(View):
     template_name = 'myapp/index.html'
+    fragment_template = 'myapp/includes/book_list.html'
     last_login_cookie = 'last_login'
+    page_size = DEFAULT_PAGE_SIZE
 
     def get(self, request):
         try:
-            # Retrieves the last login from the session and fetches a list of books using a class-based approach
+            # Retrieves the last login from the session; it is per user, so it stays out of the cache
             last_login = request.session.get(self.last_login_cookie, '')
-            book_list = Book.objects.all().order_by('id')[:10]
-            return render(request, self.template_name, {'booklist': book_list, 'last_login': last_login})
+
+            # The page of books after the cursor is the same for everyone and cached until the catalogue changes
+            cursor = request.GET.get('cursor')
+            booklist_html = cached_fragment(index_fragment_key(cursor), lambda: self.render_books(cursor))
+            return render(request, self.template_name, {'booklist_html': booklist_html, 'last_login': last_login})
         except Exception as e:
             # Logs an error if an exception occurs while rendering the index view (class-based)
-            logger.error(f"An error occurred in IndexView: {e}")
+            logger.error("An error occurred in IndexView: %s", e)
             return render(request, 'myapp/error.html', {'message': 'Something went wrong! Please try again later.'})
 
+    def render_books(self, cursor):
+        book_list = paginate(Book.objects.for_listing(), ('id',), cursor, self.page_size)
+        return render_to_string(self.fragment_template, {'booklist': book_list})
+
 
 # Function-based view for book detail
 def detail(request, book_id):
@@ -54,65 +88,101 @@ def detail(request, book_id):
         return render(request, 'myapp/detail.html', {'book': book})
     except Book.DoesNotExist as e:
         # Logs an error if the book does not exist and returns an HTTP 500 error response
-        logger.error(f"Book with ID {book_id} does not exist: {e}")
+        logger.error("Book with ID %s does not exist: %s", book_id, e)
         return HttpResponseServerError("Sorry, the book you requested does not exist.")
 
 
-# Class-based view for detailed book information
+# Class-based view for detailed book information; unchanged pages are answered with 304 Not Modified
+@method_decorator(conditional_page(detail_etag, detail_last_modified), name='get')
 class DetailView(View):
     template_name = 'myapp/detail.html'
+    fragment_template = 'myapp/includes/book_detail.html'
+    reviews_shown = 20
+    also_borrowed_heading = 'Members also borrowed'
+    top_rated_heading = 'Top rated in this category'
 
     def get(self, request, book_id):
         try:
-            # Retrieves the book with the given ID or raises a 404 error
-            book = get_object_or_404(Book, id=book_id)
-            reviews = Review.objects.filter(book=book)
-
-            # Calculates average rating for the book's reviews
-            avg_rating = -1
-            if reviews.exists():
-                total_rating = sum(review.rating for review in reviews)
-                avg_rating = total_rating / len(reviews)
-
-            # Renders the book detail template with book info and average rating
-            return render(request, self.template_name, {'book': book, 'avg_rating': avg_rating, 'reviews': reviews})
+            # The book card and its reviews are cached until the book, its reviews or the catalogue change
+            detail_html = cached_fragment(detail_fragment_key(book_id), lambda: self.render_book(book_id))
+
+            # Renders the book detail page around the cached fragment
+            return render(request, self.template_name, {'detail_html': detail_html})
         except Book.DoesNotExist as e:
             # Logs an error if the book does not exist and returns an HTTP 500 error response
-            logger.error(f"Book with ID {book_id} does not exist: {e}")
+            logger.error("Book with ID %s does not exist: %s", book_id, e)
             return HttpResponseServerError("Sorry, the book you requested does not exist.")
 
+    def render_book(self, book_id):
+        # Retrieves the book with the given ID, together with its publisher, or raises a 404 error
+        book = get_object_or_404(Book.objects.with_publisher(), id=book_id)
+
+        # The average rating is precomputed on the book; -1 means there are no reviews yet
+        avg_rating = book.avg_rating if book.rating_count else -1
+
+        # Only the most recent reviews are listed, however many the book has
+        reviews = Review.objects.filter(book=book).order_by('-date', '-id')[:self.reviews_shown]
+
+        # Precomputed by compute_recommendations; books nobody ordered with others show their category's best
+        related_books = [rec.recommended for rec in BookRecommendation.objects.for_book(book.id)]
+        related_heading = self.also_borrowed_heading
+        if not related_books:
+            related_books = [top.book for top in TopRatedBook.objects.for_category(book.category, book.id)]
+            related_heading = self.top_rated_heading
+        return render_to_string(self.fragment_template, {'book': book, 'avg_rating': avg_rating, 'reviews': reviews,
+                                                         'related_books': related_books,
+                                                         'related_heading': related_heading})
 
-# View to handle book searching
+
+def search_results(name, category, max_price, cursor):
+    # One page of the books within the price (and category), after the cursor
+    booklist = Book.objects.only('id', 'title', 'category').filter(price__lte=max_price)
+    if category:
+        booklist = booklist.filter(category=category)
+
+    # Ranks the remaining books by how well their title/description match the search text
+    return search_page(booklist, name, cursor, RESULTS_PAGE_SIZE)
+
+
+def next_page_query(data, page):
+    # Query string of the next results page: the submitted search plus the page's cursor
+    if not page.has_next:
+        return ''
+    params = data.copy()
+    params.pop('csrfmiddlewaretoken', None)
+    params['cursor'] = page.next_cursor
+    return params.urlencode()
+
+
+# View to handle book searching; result pages fetched again with GET may be answered with 304 Not Modified
+@conditional_page(results_etag, results_last_modified)
 def findbooks(request):
     try:
-        if request.method == 'POST':
-            # Handles form submission via POST method
-            form = SearchForm(request.POST)
+        if request.method == 'POST' or 'max_price' in request.GET:
+            # Handles form submission via POST, or a further results page requested via GET
+            data = request.POST if request.method == 'POST' else request.GET
+            form = SearchForm(data)
             if form.is_valid():
                 # Extracts cleaned form data
                 name = form.cleaned_data['name']
                 category = form.cleaned_data['category']
                 max_price = form.cleaned_data['max_price']
 
-                # Filters books based on category and maximum price
-                if not category:
-                    booklist = Book.objects.filter(price__lte=max_price)
-                else:
-                    booklist = Book.objects.filter(price__lte=max_price, category=category)
-
-                # Logs the resulting book list and search parameters
-                logger.info(f"Book list: {booklist}")
-                logger.info(f"Search results - Name: {name}, Category: {category}, Max Price: {max_price}")
+                # Fetches one page of the books in the category and price, best matches for the search text first;
+                # the link to the next page carries the search and cursor
+                booklist = search_results(name, category, max_price, data.get('cursor'))
+                next_query = next_page_query(data, booklist)
 
-                # Logs individual book details in the list
-                for book in booklist:
-                    logger.info(f"Book: {book.title}, Category: {book.category}")
+                # Logs the search parameters and the size of the page, not the books on it
+                logger.info("Search results - Name: %s, Category: %s, Max Price: %s, %d books",
+                            name, category, max_price, len(booklist))
 
                 # Renders the results page with booklist and search parameters
-                return render(request, 'myapp/results.html', {'booklist': booklist, 'name': name, 'category': category})
+                return render(request, 'myapp/results.html', {'booklist': booklist, 'name': name, 'category': category,
+                                                              'next_query': next_query})
             else:
                 # Handles form validation errors
-                logger.error(f"Form errors: {form.errors}")
+                logger.error("Form errors: %s", form.errors)
                 return render(request, 'myapp/findbooks.html', {'form': form})
         else:
             # Handles GET requests, provides an empty search form
@@ -120,10 +190,37 @@ def findbooks(request):
             return render(request, 'myapp/findbooks.html', {'form': form})
     except Exception as e:
         # Catches any unexpected errors during book search
-        logger.error(f"An error occurred: {e}")
+        logger.error("An error occurred: %s", e)
         return HttpResponseServerError("An error occurred during book search.")
 
 
+def title_order(queryset):
+    # Case-insensitive title order for the autocomplete. On SQLite this is the collation of book_title_prefix_idx,
+    # whose entries end with the rowid (the book id), so that index answers the prefix filter and the ordering
+    # together and a page reads only its own rows. PostgreSQL's pattern_ops index narrows the rows to the
+    # matches, which are then sorted.
+    if connections[queryset.db].vendor == 'sqlite':
+        key = Collate('title', 'NOCASE')
+    else:
+        key = Upper('title')
+    return queryset.annotate(title_key=key), ('title_key', 'id')
+
+
+# Autocomplete for the book picker (see forms.BookSelect): books whose title starts with ?q=, in title order
+def book_autocomplete(request):
+    try:
+        query = request.GET.get('q', '').strip()[:100]
+        if not query:
+            return JsonResponse({'results': [], 'next_cursor': None})
+        books, ordering = title_order(Book.objects.for_listing().filter(title__istartswith=query))
+        books = paginate(books, ordering, request.GET.get('cursor'), AUTOCOMPLETE_PAGE_SIZE)
+        return JsonResponse({'results': [{'id': book.id, 'title': book.title} for book in books],
+                             'next_cursor': books.next_cursor})
+    except Exception as e:
+        logger.error("An error occurred in book_autocomplete: %s", e)
+        return JsonResponse({'error': 'An unexpected error occurred.'}, status=500)
+
+
 @login_required(login_url='/myapp/login/')
 def place_order(request):
     try:
@@ -133,17 +230,14 @@ def place_order(request):
             if form.is_valid():
                 # Validates the submitted form
                 books = form.cleaned_data['books']
-                order = form.save(commit=False)
-                member = get_object_or_404(Member, id=request.user.id)
-                order.member = member
-                order.save()
-                order.books.set(books)
-
-                # Updates user's borrowed books if it's a borrow order type
-                order_type = order.order_type
-                if order_type == 1:
-                    for book in order.books.all():
-                        member.borrowed_books.add(book)
+
+                # The member was loaded together with the logged-in user (see MemberBackend)
+                member = request.member
+                if not member:
+                    raise Member.DoesNotExist
+
+                # Saves the order, its books and, for borrow orders, the member's borrowed books in one transaction
+                order = create_order(member.pk, books, form.cleaned_data['order_type'])
 
                 # Renders a response page with order details
                 return render(request, 'myapp/order_response.html', {'books': books, 'order': order})
@@ -154,17 +248,23 @@ def place_order(request):
             # Handles GET requests, provides an empty order form
             form = OrderForm()
             return render(request, 'myapp/placeorder.html', {'form': form})
+    except Member.DoesNotExist as e:
+        # Accounts without a member (e.g. staff) cannot place orders
+        logger.error("Member not found: %s", e)
+        raise Http404("No member for this account")
     except Exception as e:
         # Logs and handles any unexpected errors during order placement
-        logger.error(f"An error occurred: {e}")
+        logger.error("An error occurred: %s", e)
         return HttpResponseServerError("An error occurred while placing the order.")
 
 
 @login_required(login_url='/myapp/login/')
 def review(request):
     try:
-        # Retrieves the member based on the logged-in user
-        member = Member.objects.get(pk=request.user.pk)
+        # The member was loaded together with the logged-in user (see MemberBackend)
+        member = request.member
+        if not member:
+            raise Member.DoesNotExist
 
         # Checks if the member has eligible status for reviewing
         if member.status == 1 or member.status == 2:
@@ -172,12 +272,10 @@ def review(request):
                 # Handles POST requests for submitting reviews
                 form = ReviewForm(request.POST)
                 if form.is_valid():
-                    # Saves the review and updates book review count
-                    review = form.save()
-                    book = review.book
-                    book.num_reviews += 1
-                    book.save()
-                    review.save()
+                    # Saves the review and updates the book's review count and rating aggregates together
+                    with transaction.atomic():
+                        review = form.save()
+                        record_review(review)
                     return HttpResponseRedirect('/myapp')
             else:
                 # For GET requests, provides an empty review form
@@ -188,11 +286,11 @@ def review(request):
             return render(request, 'myapp/invalid.html', {'message': 'You are not eligible to view this page'})
     except Member.DoesNotExist as e:
         # Logs and handles member not found scenarios
-        logger.error(f"Member not found: {e}")
+        logger.error("Member not found: %s", e)
         return render(request, 'myapp/invalid.html', {'message': 'You are not eligible to view this page'})
     except Exception as e:
         # Logs and handles unexpected errors during review submission
-        logger.error(f"An error occurred: {e}")
+        logger.error("An error occurred: %s", e)
         return render(request, 'myapp/error.html', {'message': 'An error occurred while processing your request'})
 
 
@@ -234,7 +332,7 @@ def user_login(request):
 
     except Exception as e:
         # Logs and renders an error page for unexpected errors during login
-        logger.error(f"An error occurred: {e}")
+        logger.error("An error occurred: %s", e)
         return render(request, 'myapp/error.html', {'message': 'An error occurred while processing your request'})
 
 
@@ -245,36 +343,27 @@ def user_logout(request):
 
 
 @login_required(login_url='/myapp/login/')
+@conditional_page(check_reviews_etag, detail_last_modified)
 def chk_reviews(request, book_id):
     try:
         # Retrieves the book with the given ID
-        selected_book = get_object_or_404(Book, pk=book_id)
+        selected_book = get_object_or_404(Book.objects.only('id', 'title', 'rating_count', 'avg_rating'), pk=book_id)
 
         # Checks if there are no reviews for the book
-        if selected_book.num_reviews == 0:
+        if selected_book.rating_count == 0:
             return render(request, 'myapp/chk_reviews.html', {'book': selected_book, 'avg_rating': -1})
 
-        # Retrieves reviews for the book and calculates the average rating
-        reviews = Review.objects.filter(book=selected_book)
-        total_rating = sum(review.rating for review in reviews)
-        avg_rating = total_rating / len(reviews)
-
-        # Renders the template with book information and average rating
-        return render(request, 'myapp/chk_reviews.html', {'book': selected_book, 'avg_rating': avg_rating})
+        # Renders the template with book information and its precomputed average rating
+        return render(request, 'myapp/chk_reviews.html', {'book': selected_book, 'avg_rating': selected_book.avg_rating})
 
     except Book.DoesNotExist as e:
         # Handles the case where the book with the given ID does not exist
-        logger.error(f"Book with ID {book_id} does not exist: {e}")
+        logger.error("Book with ID %s does not exist: %s", book_id, e)
         return render(request, 'myapp/error.html', {'error_message': 'The book does not exist.'})
 
-    except ZeroDivisionError as e:
-        # Handles the case where there are no reviews for the book (division by zero error)
-        logger.error(f"Error calculating average rating: {e}")
-        return render(request, 'myapp/error.html', {'error_message': 'No reviews available for this book.'})
-
     except Exception as e:
         # Handles any other unexpected errors that may occur
-        logger.error(f"An error occurred: {e}")
+        logger.error("An error occurred: %s", e)
         return render(request, 'myapp/error.html', {'error_message': 'An unexpected error occurred.'})
 
 
@@ -289,7 +378,7 @@ def register(request):
                 return HttpResponseRedirect(reverse('myapp:login'))
             else:
                 # If the form is invalid, logs the error and renders an error message
-                logger.error(f"Invalid registration form data: {form.errors}")
+                logger.error("Invalid registration form data: %s", form.errors)
                 return render(request, 'myapp/error.html',
                               {'error_message': 'Invalid registration form data. Please check your input.'})
         else:
@@ -299,7 +388,7 @@ def register(request):
 
     except Exception as e:
         # Handles any unexpected errors during the registration process
-        logger.error(f"An error occurred during registration: {e}")
+        logger.error("An error occurred during registration: %s", e)
         return render(request, 'myapp/error.html',
                       {'error_message': 'An unexpected error occurred during registration.'})
 
@@ -307,39 +396,59 @@ def register(request):
 @login_required(login_url='/myapp/login/')
 def my_orders(request):
     try:
-        # Attempt to retrieve the logged-in user
-        logged_in_user = Member.objects.get(pk=request.user.pk)
-
-        # Fetch orders associated with the logged-in user
-        orders = Order.objects.filter(member=logged_in_user)
-
-        # Initialize an empty list to store book titles corresponding to each order
-        book_list = []
-
-        # Iterate through each order to retrieve associated books and concatenate their titles
-        for order in orders:
-            books = order.books.all()
-            book_title = ''
-            for book in books:
-                book_title = book_title + book.title + ', '
+        # The member was loaded together with the logged-in user (see MemberBackend)
+        logged_in_user = request.member
+        if not logged_in_user:
+            raise Member.DoesNotExist
 
-            # Append concatenated book titles (excluding the trailing comma and space) to book_list
-            book_list.append(book_title[:-2])
-
-        # Zip orders with their respective book titles for display in the template
-        new_list = zip(orders, book_list)
+        # Fetch one page of the user's orders, newest first, with the books of all of them in one query
+        orders = paginate(Order.objects.history(logged_in_user), ('-order_date', '-id'), request.GET.get('cursor'),
+                          ORDERS_PAGE_SIZE)
 
         # Render the 'myapp/myorders.html' template with retrieved data for display
-        return render(request, 'myapp/myorders.html', {'orders': orders, 'book_list': book_list, 'new_list': new_list})
+        return render(request, 'myapp/myorders.html', {'orders': orders})
 
     except Member.DoesNotExist:
         # Log an error if the logged-in user is not found and render a corresponding message for the user
         error_message = 'There are no available orders!'
-        logger.error(f"Error retrieving orders: {error_message}")
+        logger.error("Error retrieving orders: %s", error_message)
         return render(request, 'myapp/invalid.html', {'message': error_message})
 
     except Exception as e:
         # Log any unexpected errors and render a general error message for the user
         error_message = 'An unexpected error occurred while retrieving orders.'
-        logger.error(f"Unexpected error in my_orders view: {e}")
+        logger.error("Unexpected error in my_orders view: %s", e)
         return render(request, 'myapp/error.html', {'error_message': error_message})
+
+
+@staff_member_required(login_url='/myapp/login/')
+def export(request, kind, fmt):
+    # Streams a catalogue/order/review export; ?since_id= and ?since_date= limit it to newer rows
+    try:
+        since_id = request.GET.get('since_id')
+        since_date = request.GET.get('since_date')
+        lines = export_lines(kind, fmt, since_id=int(since_id) if since_id else None,
+                             since_date=date.fromisoformat(since_date) if since_date else None)
+    except (ExportError, ValueError) as e:
+        return HttpResponseBadRequest(str(e))
+
+    # Rows are fetched in chunks while the response is being sent, so memory use stays flat
+    response = StreamingHttpResponse(lines, content_type=FORMATS[fmt])
+    response['Content-Disposition'] = f'attachment; filename="{kind}.{fmt}"'
+    return response
+
+
+@staff_member_required(login_url='/myapp/login/')
+def dashboard(request):
+    # Reads only the reporting tables kept up to date by `manage.py refresh_reports`, so the page costs the
+    # same however many orders and reviews there are
+    months = (DailyOrderStats.objects.annotate(month=TruncMonth('day')).values('month')
+              .annotate(borrowed=Sum('orders', filter=Q(order_type=Order.BORROW)),
+                        purchased=Sum('orders', filter=Q(order_type=Order.PURCHASE)),
+                        books=Sum('books'), revenue=Sum('revenue'))
+              .order_by('-month')[:12])
+    categories = CategoryStats.objects.order_by('category')
+    publishers = PublisherReviewStats.objects.select_related('publisher').order_by('-reviews')[:10]
+    refreshed_at = ReportWatermark.objects.aggregate(refreshed_at=Max('refreshed_at'))['refreshed_at']
+    return render(request, 'myapp/dashboard.html', {'months': months, 'categories': categories,
+                                                    'publishers': publishers, 'refreshed_at': refreshed_at})
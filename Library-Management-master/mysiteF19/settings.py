@@ -42,11 +42,14 @@ INSTALLED_APPS = [
 CRISPY_TEMPLATE_PACK = 'bootstrap4'
 
 MIDDLEWARE = [
+    'myapp.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'myapp.middleware.ReplicaPinningMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'myapp.middleware.MemberMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -74,35 +77,112 @@ WSGI_APPLICATION = 'mysiteF19.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/2.2/ref/settings/#databases
 
+# Read from the environment (defaults are the local development database, whose password has to be set in
+# DB_PASSWORD); see settings_prod.py for persistent connections
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': 'library',
-        'USER': 'postgres',
-        'PASSWORD': 'ardak',
-        'HOST': 'localhost',
-        'PORT': '5432',
+        'ENGINE': os.environ.get('DB_ENGINE', 'django.db.backends.postgresql'),
+        'NAME': os.environ.get('DB_NAME', 'library'),
+        'USER': os.environ.get('DB_USER', 'postgres'),
+        'PASSWORD': os.environ.get('DB_PASSWORD', ''),
+        'HOST': os.environ.get('DB_HOST', 'localhost'),
+        'PORT': os.environ.get('DB_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.environ.get('DB_CONN_MAX_AGE', 0)),
     }
 }
 
+# Read replicas: DB_REPLICA_HOSTS=host1,host2 adds 'replica1', 'replica2', ... with the primary's other settings.
+# myapp.routers.PrimaryReplicaRouter sends reads to them, except for clients that wrote within
+# REPLICA_PIN_SECONDS (myapp.middleware.ReplicaPinningMiddleware); without replicas everything uses 'default'.
+for number, host in enumerate(filter(None, os.environ.get('DB_REPLICA_HOSTS', '').split(',')), start=1):
+    DATABASES[f'replica{number}'] = dict(DATABASES['default'], HOST=host.strip(), TEST={'MIRROR': 'default'})
+DATABASE_REPLICAS = [alias for alias in DATABASES if alias != 'default']
+DATABASE_ROUTERS = ['myapp.routers.PrimaryReplicaRouter']
+REPLICA_PIN_SECONDS = int(os.environ.get('REPLICA_PIN_SECONDS', 5))
+
+CACHES = {
+    # Per process, so only right for a single development server: the version stamps that expire cached
+    # fragments are not seen by other processes. settings_prod requires a shared cache.
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # Profiling samples must be visible to `manage.py profile_report`, which runs in its own process;
+    # point this at the shared production cache (Redis/Memcached) when deploying
+    'profiling': {
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': os.path.join(BASE_DIR, '.profiling_cache'),
+    },
+}
+
+# Seconds the shared index/detail page fragments stay cached (they are also expired on every change)
+CATALOGUE_CACHE_TIMEOUT = 600
+
+# Per-view profiling (myapp.middleware.ProfilingMiddleware); off unless PROFILING_ENABLED=1
+PROFILING_ENABLED = os.environ.get('PROFILING_ENABLED') == '1'
+PROFILING_SAMPLE_RATE = float(os.environ.get('PROFILING_SAMPLE_RATE', 0.1))  # share of requests measured
+PROFILING_CACHE = 'profiling'
+PROFILING_WINDOW = 1000  # samples kept per view for the rolling percentiles
+PROFILING_BATCH_SIZE = 50  # samples buffered in each process before they are written to the cache...
+PROFILING_FLUSH_SECONDS = 10  # ...or once the oldest of them is this old
+PROFILING_SERVER_TIMING = DEBUG  # adds a Server-Timing header for the browser's network panel
+PROFILING_SLOW_REQUEST_MS = 500
+
+# Review counters: when buffered, num_reviews/rating increments for each book are coalesced in memory
+# and written every REVIEW_COUNTERS_FLUSH_INTERVAL seconds instead of locking the book row per review
+REVIEW_COUNTERS_BUFFERED = False
+REVIEW_COUNTERS_FLUSH_INTERVAL = 5
+
+# Log records are sampled and rate limited in the logging thread, then written as JSON lines by a background
+# listener (myapp.logutils), so requests never block on log I/O. Warnings and errors are never sampled.
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'filters': {
+        'sampling': {
+            '()': 'myapp.logutils.SamplingFilter',
+            # Share of INFO/DEBUG records kept per logger (and its children)
+            'rates': {'myapp.views': 0.1, 'myapp.async_views': 0.1},
+        },
+        'rate_limit': {
+            '()': 'myapp.logutils.RateLimitFilter',
+            # Records per second for each logger and message
+            'rate': 20,
+            'per': 1.0,
+        },
+    },
     'handlers': {
         'console': {
-            'level': 'DEBUG',
-            'class': 'logging.StreamHandler',
+            '()': 'myapp.logutils.queue_handler',
+            'filters': ['sampling', 'rate_limit'],
+            'stream': 'ext://sys.stderr',
         },
     },
     'loggers': {
         '': {
             'handlers': ['console'],
-            'level': 'DEBUG',
+            'level': os.environ.get('LOG_LEVEL', 'INFO'),
             'propagate': True,
         },
+        # Replaces Django's default 'django' logger configuration, whose own console handler writes
+        # synchronously (under DEBUG) and whose records would also reach the root logger's handler
+        'django': {
+            'handlers': ['console'],
+            'level': os.environ.get('LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
     },
 }
 
+# Sessions are read from the cache and only fall back to the database on a miss
+SESSION_ENGINE = 'django.contrib.sessions.backends.cached_db'
+
+# MemberBackend loads the user and its Member row together; ModelBackend stays so sessions that were
+# created before it was added remain valid
+AUTHENTICATION_BACKENDS = [
+    'myapp.backends.MemberBackend',
+    'django.contrib.auth.backends.ModelBackend',
+]
+
 # Password validation
 # https://docs.djangoproject.com/en/2.2/ref/settings/#auth-password-validators
 
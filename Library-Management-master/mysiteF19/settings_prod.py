@@ -0,0 +1,48 @@
+"""
+Production settings for mysiteF19: DJANGO_SETTINGS_MODULE=mysiteF19.settings_prod
+
+Everything deployment-specific comes from the environment:
+    DJANGO_SECRET_KEY, DJANGO_ALLOWED_HOSTS (comma-separated),
+    DB_PASSWORD, DB_ENGINE, DB_NAME, DB_USER, DB_HOST, DB_PORT,
+    DB_CONN_MAX_AGE (seconds a connection is reused, default 60),
+    DB_REPLICA_HOSTS (comma-separated read replicas), REPLICA_PIN_SECONDS,
+    CACHE_LOCATION (e.g. redis://cache:6379/0) with CACHE_BACKEND (default: Django's RedisCache)
+"""
+
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import DATABASES
+
+SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+
+DEBUG = False
+
+ALLOWED_HOSTS = [host.strip() for host in os.environ.get('DJANGO_ALLOWED_HOSTS', '').split(',') if host.strip()]
+
+# Every worker must share one cache: a change expires the cached page fragments (and ETags) of all of them by
+# bumping the version stamps in myapp.caching, and sessions are read from the cache first
+CACHES = {
+    'default': {
+        'BACKEND': os.environ.get('CACHE_BACKEND', 'django.core.cache.backends.redis.RedisCache'),
+        'LOCATION': os.environ['CACHE_LOCATION'],
+    },
+}
+if CACHES['default']['BACKEND'] in ('django.core.cache.backends.locmem.LocMemCache',
+                                    'django.core.cache.backends.dummy.DummyCache'):
+    raise ImproperlyConfigured('CACHE_BACKEND must be a cache shared by all workers (Redis, Memcached, database)')
+
+PROFILING_ENABLED = False
+PROFILING_CACHE = 'default'
+PROFILING_SERVER_TIMING = False
+
+# Keep each worker's connection open between requests instead of connecting (TCP, TLS, authentication)
+# for every request, and check it is still usable before reusing it after an idle period. Django 4.2 has
+# no connection pool; to share a few connections between many workers put PgBouncer in front of the database.
+# The password has no default here: an unset DB_PASSWORD fails at startup instead of at the first query.
+for database in DATABASES.values():
+    database['PASSWORD'] = os.environ['DB_PASSWORD']
+    database['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 60))
+    database['CONN_HEALTH_CHECKS'] = True
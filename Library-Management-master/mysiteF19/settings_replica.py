@@ -0,0 +1,30 @@
+"""
+Local primary/replica settings for trying out myapp.routers: DJANGO_SETTINGS_MODULE=mysiteF19.settings_replica
+
+Two SQLite files stand in for the servers: db.sqlite3 is the primary and db_replica.sqlite3 the replica.
+Nothing replicates between them; copy the primary over the replica to "catch up", e.g.
+
+    python manage.py migrate
+    cp db.sqlite3 db_replica.sqlite3
+
+Until the next copy, the replica lags behind: pages only show new orders and reviews to the client that
+wrote them, for REPLICA_PIN_SECONDS.
+"""
+
+import os
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+DATABASES = {
+    'default': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db.sqlite3'),
+    },
+    'replica1': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.path.join(BASE_DIR, 'db_replica.sqlite3'),
+        'TEST': {'MIRROR': 'default'},
+    },
+}
+DATABASE_REPLICAS = ['replica1']